@@ -0,0 +1,59 @@
+"""
+Benchmarks Phase 1 discovery against a local stand-in server.
+
+Compares the old one-page-at-a-time loop (max_workers=1) with the bounded worker pool.
+
+    python benchmarks/bench_discovery.py --files 120 --latency 0.15
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_server import FakeServer  # noqa: E402
+from ffdownloader.discovery import DISCOVERY_PER_HOST, DISCOVERY_WORKERS, discover_files  # noqa: E402
+from ffdownloader.net import HttpClient  # noqa: E402
+
+
+def quiet_log(message, obj, tag="info"):
+    if tag == "error":
+        print(f"  [{tag}] {message}: {obj}")
+
+
+def run(links, workers, per_host):
+    with HttpClient(pool_size=per_host) as http:
+        started = time.perf_counter()
+        files = discover_files(links, http, quiet_log, max_workers=workers, per_host=per_host)
+        elapsed = time.perf_counter() - started
+        handshakes = sum(s['handshakes'] for s in http.stats.snapshot().values())
+    return elapsed, files, handshakes
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100, help="Number of file pages to serve")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds of server latency per request")
+    parser.add_argument("--workers", type=int, default=DISCOVERY_WORKERS)
+    parser.add_argument("--per-host", type=int, default=DISCOVERY_PER_HOST)
+    args = parser.parse_args()
+
+    with FakeServer(files=args.files, latency=args.latency) as server:
+        links = server.page_links()
+
+        serial_time, serial_files, serial_handshakes = run(links, 1, 1)
+        pooled_time, pooled_files, pooled_handshakes = run(links, args.workers, args.per_host)
+
+    same_order = [f['page_link'] for f in serial_files] == [f['page_link'] for f in pooled_files]
+    print(f"pages:            {args.files} (latency {args.latency * 1000:.0f} ms)")
+    print(f"serial:           {serial_time:7.2f} s  ({len(serial_files)} resolved, {serial_handshakes} connections)")
+    print(f"pool {args.workers:>2}/{args.per_host:<2} per host: {pooled_time:7.2f} s  "
+          f"({len(pooled_files)} resolved, {pooled_handshakes} connections)")
+    print(f"speedup:          {serial_time / pooled_time:7.2f}x")
+    print(f"order preserved:  {same_order}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,274 @@
+"""
+End-to-end benchmark: whole runs (scrape, discovery with size probes, downloads) against a
+local stand-in server, for every scenario and engine, with saved baselines to catch regressions.
+
+Each run starts a fresh Python process that drives a DownloadPipeline headlessly into an empty
+temporary folder, so its CPU time and peak memory are its own (the server runs in this process).
+Peak memory is the child's high-water mark from /proc (ru_maxrss would carry this process's peak,
+payloads included, over into the child on Linux). Reported are the wall time, throughput, time to
+the first downloaded byte, the length of the discovery phase (not for pipelined scenarios, whose
+downloads run during discovery), CPU seconds, peak RSS, connections opened and the files
+completed and failed, the median of `--repeat` runs each.
+
+    python benchmarks/bench_e2e.py                        # every scenario, every available engine
+    python benchmarks/bench_e2e.py --scenario large-ranged --engine async --repeat 5
+    python benchmarks/bench_e2e.py --save                 # store the results as the baseline
+
+When the baseline file exists, every result is compared with it and the command exits with
+status 1 if wall time, CPU time or peak RSS grew by more than `--tolerance`. Baselines depend
+on the machine, so they are not part of the repository; save one before a change and compare
+after it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_server import FakeServer  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "e2e.json")
+BASELINE_VERSION = 2  # 2: rss_mb is the child's own high-water mark
+MIB = 1024 * 1024
+
+# name -> FakeServer arguments, DownloadPipeline arguments (plus 'pipeline' for pipelined mode)
+SCENARIOS = {
+    # Discovery bound: many small parts behind a slow page server
+    'many-pages': ({'files': 200, 'file_size': 64 * 1024, 'latency': 0.05}, {}),
+    'many-pages-pipelined': ({'files': 200, 'file_size': 64 * 1024, 'latency': 0.05}, {'pipeline': True}),
+    # Large parts on a per-connection bandwidth cap, where Range segments pay off
+    'large-ranged': ({'files': 2, 'file_size': 64 * MIB, 'bandwidth': 16 * MIB}, {}),
+    # Parallel capped streams, with checksums verified while downloading
+    'capped-streams': ({'files': 16, 'file_size': 4 * MIB, 'latency': 0.02, 'bandwidth': 4 * MIB, 'checksums': True},
+                       {}),
+    # 503s to retry and bodies cut off halfway
+    'flaky': ({'files': 40, 'file_size': 512 * 1024, 'latency': 0.02, 'fail_rate': 0.1, 'reset_rate': 0.05}, {}),
+    # Every part on two hosters, the preferred one down: the speed probe has to rank the mirror first
+    'dead-hoster': ({'files': 8, 'file_size': 1 * MIB, 'latency': 0.02, 'mirror': True,
+                     'down_hosts': ("127.0.0.1",)}, {}),
+}
+ENGINES = ("threads", "async")
+
+# Result keys compared with the baseline (lower is better) and how they are printed
+COMPARED = ("wall", "cpu", "rss_mb")
+COLUMNS = (
+    ("wall", "wall s", "{:.2f}"),
+    ("mb_per_s", "MB/s", "{:.1f}"),
+    ("first_byte", "1st byte", "{:.2f}"),
+    ("discover", "discover", "{:.2f}"),  # Discovery phase, "-" for pipelined runs
+    ("cpu", "cpu s", "{:.2f}"),
+    ("rss_mb", "rss MB", "{:.0f}"),
+    ("connections", "conns", "{:.0f}"),
+    ("completed", "done", "{:.0f}"),
+    ("failed", "failed", "{:.0f}"),
+)
+
+
+# --- Child process: one run ---
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MiB: VmHWM on Linux, ru_maxrss on macOS, None elsewhere.
+    On Linux ru_maxrss survives exec, so a child would report its parent's peak if that was higher.
+    """
+    try:
+        with open("/proc/self/status", 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024  # KiB
+    except OSError:
+        pass
+    if sys.platform != "darwin":
+        return None
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / MIB  # Bytes on macOS
+
+
+def run_child(case):
+    """Runs one pipeline as described by `case` and prints its measurements as one JSON line."""
+    from ffdownloader.hosts import FuckingFastResolver, HostRanking
+    from ffdownloader.selection import SelectionRule
+
+    if case['engine'] == "async":
+        from ffdownloader.aio import AsyncDownloadPipeline as pipeline_class
+    else:
+        from ffdownloader.core import DownloadPipeline as pipeline_class
+    # The stand-in server's file pages instead of fuckingfast.co's
+    resolvers = [FuckingFastResolver(name, [prefix]) for name, prefix in case['hosters']]
+
+    settings = dict(case['pipeline'])
+    pipelined = settings.pop('pipeline', False)
+    first_byte = []
+
+    def on_event(kind, data):
+        if kind == "progress" and data['current'] and not first_byte:
+            first_byte.append(time.perf_counter())
+
+    with tempfile.TemporaryDirectory() as folder:
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        # A fresh hoster ranking, so every run probes the hosters again
+        pipeline = pipeline_class(folder, on_event=on_event, resolvers=resolvers,
+                                  ranking=HostRanking(os.path.join(folder, ".hosts.json")), **settings)
+        if pipelined:
+            summary = pipeline.run(case['url'], rule=SelectionRule())
+        else:
+            summary = pipeline.run(case['url'], select=lambda files: files)
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+        downloaded = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+                         if not name.startswith("."))
+        report = {}
+        for name in os.listdir(folder):
+            if name.startswith(".download_report_"):
+                with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                    report = json.load(f)
+
+    print(json.dumps({
+        'wall': wall,
+        'mb_per_s': downloaded / MIB / wall,
+        'first_byte': first_byte[0] - started if first_byte else None,
+        'discover': None if pipelined else report.get('phases', {}).get('discover'),
+        'cpu': cpu,
+        'rss_mb': peak_rss_mb(),
+        'connections': sum(host['handshakes'] for host in report.get('hosts', {}).values()),
+        'completed': (summary or {}).get('completed', 0),
+        'failed': (summary or {}).get('failed', 0),
+    }))
+
+
+# --- Parent process: scenarios, baselines ---
+
+def run_case(scenario, engine):
+    """Serves `scenario` and runs one pipeline against it in a new process. Returns its results, or None."""
+    server_args, pipeline_args = SCENARIOS[scenario]
+    with FakeServer(**server_args) as server:
+        for i in range(server.files):
+            server.payload(i)  # Build the payloads before anything is timed
+        case = {
+            'engine': engine,
+            'url': server.url("/repack"),
+            'hosters': [("fake", server.url("/f/")), ("fake-mirror", server.mirror_url("/f/"))],
+            'pipeline': pipeline_args,
+        }
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(case)], cwd=ROOT,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        print(f"  {scenario}/{engine} failed:\n{process.stderr.strip()}", file=sys.stderr)
+        return None
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def median_results(runs):
+    """The median of every result key over `runs` (keys that are None in some run are left None)."""
+    return {key: statistics.median(run[key] for run in runs) if all(run[key] is not None for run in runs) else None
+            for key in runs[0]}
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return baseline if baseline.get('version') == BASELINE_VERSION else None
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    baseline = {
+        'version': BASELINE_VERSION,
+        'saved': round(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+def regressions(result, base, tolerance):
+    """The COMPARED keys of `result` that are more than `tolerance` worse than in `base`, as "key +x%"."""
+    worse = []
+    for key in COMPARED:
+        if result.get(key) is None or not base.get(key):
+            continue
+        change = result[key] / base[key] - 1
+        if change > tolerance:
+            worse.append(f"{key} +{change * 100:.0f}%")
+    return worse
+
+
+def format_row(label, result):
+    cells = [(fmt.format(result[key]) if result.get(key) is not None else "-").rjust(max(len(title), 6))
+             for key, title, fmt in COLUMNS]
+    return f"{label:<32}" + " ".join(cells)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--engine", action="append", choices=ENGINES,
+                        help="Engine to run (repeatable, default: all that are installed)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario and engine, the median is reported")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, metavar="FILE",
+                        help="Baseline to compare with (and to write with --save)")
+    parser.add_argument("--save", action="store_true", help="Store the results in the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Growth of wall time, CPU time or RSS over the baseline that counts as a regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return 0
+
+    from ffdownloader.aio import engine_available
+
+    engines = args.engine or [engine for engine in ENGINES if engine != "async" or engine_available()]
+    if "async" in engines and not engine_available():
+        parser.error("the async engine needs aiohttp (pip install aiohttp)")
+    baseline = None if args.save else load_baseline(args.baseline)
+    if baseline:
+        print(f"Comparing with the baseline saved {time.strftime('%Y-%m-%d %H:%M', time.localtime(baseline['saved']))} "
+              f"(Python {baseline['python']}), tolerance {args.tolerance * 100:.0f}%")
+
+    print(f"{'scenario/engine':<32}" + " ".join(title.rjust(max(len(title), 6)) for _, title, _ in COLUMNS))
+    results = {}
+    regressed = False  # A run failed, or a result is worse than its baseline
+    for scenario in args.scenario or SCENARIOS:
+        for engine in engines:
+            label = f"{scenario}/{engine}"
+            runs = [run_case(scenario, engine) for _ in range(max(1, args.repeat))]
+            if None in runs:
+                print(f"{label:<32} failed")
+                regressed = True
+                continue
+            results[label] = median_results(runs)
+            line = format_row(label, results[label])
+            base = (baseline or {}).get('results', {}).get(label)
+            if base:
+                worse = regressions(results[label], base, args.tolerance)
+                regressed = regressed or bool(worse)
+                line += "  REGRESSION: " + ", ".join(worse) if worse else "  ok"
+            print(line)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
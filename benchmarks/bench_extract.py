@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of page extraction on the saved fixture pages in benchmarks/fixtures/.
+
+Compares the original full BeautifulSoup parse with ffdownloader.extract, reporting CPU time
+and peak traced memory per page.
+
+    python benchmarks/bench_extract.py --repeat 200
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from ffdownloader.extract import extract_file_page, extract_links  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHUNK_SIZE = 16 * 1024
+PREFIX = "https://fuckingfast.co/"
+
+
+def soup_file_page(page):
+    soup = BeautifulSoup(page.decode('utf-8'), 'html.parser')
+    meta_title = soup.find('meta', attrs={'name': 'title'})
+    title = meta_title['content'] if meta_title and meta_title.get('content') else None
+    for script in soup.find_all('script'):
+        if script.string and 'function download' in script.string:
+            match = re.search(r'window\.open\(["\'](https?://[^\s"\'\)]+)', script.string)
+            return title, match.group(1) if match else None
+    return title, None
+
+
+def fast_file_page(page):
+    chunks = (page[i:i + CHUNK_SIZE] for i in range(0, len(page), CHUNK_SIZE))
+    title, url, _, _ = extract_file_page(chunks)
+    return title, url
+
+
+def soup_links(page):
+    soup = BeautifulSoup(page.decode('utf-8'), 'html.parser')
+    return [a['href'] for a in soup.find_all('a', href=True) if a['href'].startswith(PREFIX)]
+
+
+def fast_links(page):
+    return extract_links(page, PREFIX)
+
+
+def measure(func, page, repeat):
+    """Returns (result, CPU ms per page, peak KiB for one page)."""
+    result = func(page)
+    started = time.process_time()
+    for _ in range(repeat):
+        func(page)
+    cpu_ms = (time.process_time() - started) / repeat * 1000
+
+    tracemalloc.start()
+    func(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_ms, peak / 1024
+
+
+def report(label, page, slow, fast, repeat):
+    slow_result, slow_cpu, slow_peak = measure(slow, page, repeat)
+    fast_result, fast_cpu, fast_peak = measure(fast, page, repeat)
+    print(f"{label} ({len(page) / 1024:.0f} KiB, results match: {slow_result == fast_result})")
+    print(f"  BeautifulSoup : {slow_cpu:8.3f} ms CPU  {slow_peak:9.1f} KiB peak")
+    print(f"  extract       : {fast_cpu:8.3f} ms CPU  {fast_peak:9.1f} KiB peak  "
+          f"({slow_cpu / fast_cpu:.0f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100, help="Timed iterations per page")
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, "file_page.html"), "rb") as f:
+        file_page = f.read()
+    with open(os.path.join(FIXTURES, "repack_page.html"), "rb") as f:
+        repack_page = f.read()
+
+    report("file page", file_page, soup_file_page, fast_file_page, args.repeat)
+    report("repack page", repack_page, soup_links, fast_links, max(1, args.repeat // 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark: wall time from launching a fresh interpreter until the program is usable.
+
+Each case starts a new Python process (so nothing is cached in sys.modules) and stops the clock
+when the process exits, or, for the GUI window, when it reports that its first frame was drawn.
+HOME points to an empty temporary folder, so no queue or update-check cache of the user is read
+or written. "eager imports" loads what main.py used to import at the top, for comparison.
+
+    python benchmarks/bench_startup.py --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUI_WINDOW = """
+import tkinter as tk
+import main
+root = tk.Tk()
+app = main.DownloaderApp(root)
+root.update()
+print("ready", flush=True)
+root.destroy()
+"""
+
+CASES = [
+    ("python (empty)", ["-c", "pass"], False),
+    ("eager imports", ["-c", "import requests, bs4, tkinter, subprocess, webbrowser"], False),
+    ("headless --help", ["-m", "ffdownloader", "--help"], False),
+    ("headless --show-queue", ["-m", "ffdownloader", "--show-queue"], False),
+    ("headless first download", ["-c", "import ffdownloader.cli, ffdownloader.core"], False),
+    ("GUI import", ["-c", "import main"], False),
+    ("GUI window ready", ["-c", GUI_WINDOW], True),
+]
+
+
+def launch(args, wait_for_ready, env):
+    """Seconds until the process exited (or printed "ready"), or None if it failed."""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    if wait_for_ready:
+        ready = any(line.strip() == "ready" for line in process.stdout)
+        elapsed = time.perf_counter() - started
+        process.wait()
+        return elapsed if ready else None
+    process.communicate()
+    elapsed = time.perf_counter() - started
+    return elapsed if process.returncode == 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Launches per case")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        print(f"{'case':<26} {'min':>9} {'median':>9}")
+        for label, case_args, wait_for_ready in CASES:
+            launch(case_args, wait_for_ready, env)  # Warm the OS file cache, the interpreter still starts cold
+            timings = [launch(case_args, wait_for_ready, env) for _ in range(max(1, args.repeat))]
+            if None in timings:
+                print(f"{label:<26} {'skipped (failed to start, no display?)':>20}")
+                continue
+            print(f"{label:<26} {min(timings) * 1000:7.1f}ms {statistics.median(timings) * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
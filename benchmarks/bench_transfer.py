@@ -0,0 +1,101 @@
+"""
+Benchmarks the single-stream download loop against a local stand-in server.
+
+Compares the old `iter_content(8192)` + write loop with ffdownloader.transfer.copy_response
+(adaptive read size, readinto a reusable buffer), running `--streams` downloads at once and
+reporting MB/s and CPU% of each stream's thread.
+
+    python benchmarks/bench_transfer.py --size-mb 256 --streams 2
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_server import FakeServer  # noqa: E402
+from ffdownloader.net import HttpClient  # noqa: E402
+from ffdownloader.transfer import copy_response, preallocate  # noqa: E402
+
+
+def iter_content_loop(response, f, total_size):
+    """The loop download_file_gui used before copy_response."""
+    downloaded = 0
+    for data in response.iter_content(8192):
+        f.write(data)
+        downloaded += len(data)
+
+
+def copy_response_loop(response, f, total_size):
+    copy_response(response, f, on_chunk=lambda nbytes: None)
+
+
+def copy_response_preallocated(response, f, total_size):
+    preallocate(f, total_size)
+    copy_response(response, f, on_chunk=lambda nbytes: None)
+
+
+LOOPS = {
+    "iter_content(8192)": iter_content_loop,
+    "copy_response": copy_response_loop,
+    "copy_response + prealloc": copy_response_preallocated,
+}
+
+
+def run_stream(http, url, loop, folder, index, results):
+    path = os.path.join(folder, f"stream-{index}.bin")
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    with http.get(url, stream=True) as response:
+        total_size = int(response.headers.get('content-length', 0))
+        with open(path, 'wb') as f:
+            loop(response, f, total_size)
+    wall = time.perf_counter() - started
+    cpu = time.thread_time() - cpu_started
+    size = os.path.getsize(path)
+    os.remove(path)
+    results[index] = (size, wall, cpu)
+
+
+def run(server, loop, streams, folder):
+    results = {}
+    with HttpClient(pool_size=streams) as http:
+        threads = [
+            threading.Thread(target=run_stream,
+                             args=(http, server.url(f"/dl/{i % server.files}"), loop, folder, i, results))
+            for i in range(streams)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return [results[i] for i in range(streams)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=128, help="Size of each downloaded file in MiB")
+    parser.add_argument("--streams", type=int, default=1, help="Downloads running at the same time")
+    parser.add_argument("--rounds", type=int, default=2, help="Runs per loop, the best one is reported")
+    args = parser.parse_args()
+
+    with FakeServer(files=args.streams, file_size=args.size_mb * 1024 * 1024) as server, \
+            tempfile.TemporaryDirectory() as folder:
+        for i in range(server.files):
+            server.payload(i)  # Build the payloads before anything is timed
+
+        print(f"{args.streams} stream(s) of {args.size_mb} MiB")
+        for label, loop in LOOPS.items():
+            best = min((run(server, loop, args.streams, folder) for _ in range(args.rounds)),
+                       key=lambda streams: max(wall for _, wall, _ in streams))
+            for index, (size, wall, cpu) in enumerate(best):
+                print(f"  {label:<26} stream {index + 1}: {size / wall / 1024 / 1024:8.1f} MB/s  "
+                      f"{cpu / wall * 100:5.1f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+A local stand-in for the FitGirl repack page and the fuckingfast.co file pages.
+
+Routes:
+    /repack         -> repack page linking to every file page
+    /f/<i>          -> fuckingfast-style page with the `function download` / `window.open` script
+    /dl/<i>         -> payload for file <i> (honours single `Range: bytes=a-b` requests when `ranges` is on)
+
+Every route also answers HEAD with the headers of its GET. With `url_ttl`, file pages hand out
+"/dl/<i>?issued=<time>" links that answer 410 once they are older than `url_ttl` seconds,
+like fuckingfast.co's signed links.
+
+Payloads can be throttled to `bandwidth` bytes per second per response, and failures injected:
+`fail_rate` of the payload requests answer 503, `reset_rate` of them hang up halfway through
+the body. The failures are drawn from a random generator seeded with `seed`, so runs repeat.
+
+With `mirror`, the repack page links every part twice, like FitGirl's list of hosters: at
+base_url and at mirror_url(), the same server under the name "localhost", so the two count as
+different hosters. Both links end in "#<file name>", and a file page hands out download links
+on the host it was asked for. File pages and payloads on a host name in `down_hosts` answer 503.
+
+Use it as a context manager:
+
+    with FakeServer(files=100, latency=0.2) as server:
+        server.url("/repack")
+"""
+
+import hashlib
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+THROTTLE_CHUNK_SIZE = 64 * 1024  # Bytes written between sleeps when `bandwidth` is set
+
+FILE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="title" content="{name}">
+<title>{name}</title>
+<script src="/static/app.js"></script>
+</head>
+<body>
+<div class="panel">
+<h1>{name}</h1>
+<p>Size: {size} bytes</p>
+<button onclick="download()">DOWNLOAD</button>
+</div>
+<script>
+var token = "{token}";
+function download() {{
+    window.open("{download_url}");
+}}
+</script>
+</body>
+</html>
+"""
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Does not print tracebacks when the client hangs up early (clients do that on purpose)."""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """Threaded HTTP server serving a synthetic repack with `files` parts of `file_size` bytes each."""
+
+    def __init__(self, files=50, file_size=64 * 1024, latency=0.0, ranges=True, name_prefix="fitgirl-repack.part",
+                 checksums=False, url_ttl=None, bandwidth=None, fail_rate=0.0, reset_rate=0.0, seed=0, mirror=False,
+                 down_hosts=()):
+        self.files = files
+        self.file_size = file_size
+        self.latency = latency
+        self.ranges = ranges
+        self.name_prefix = name_prefix
+        self.checksums = checksums  # List "<md5> *<name>" lines on the repack page
+        self.url_ttl = url_ttl  # Seconds a download link from a file page stays valid (None: forever)
+        self.bandwidth = bandwidth  # Bytes per second of each payload response (None: as fast as possible)
+        self.fail_rate = fail_rate  # Share of payload requests answered with 503
+        self.reset_rate = reset_rate  # Share of payload responses cut off halfway
+        self.mirror = mirror  # Link every part on a second host name too
+        self.down_hosts = tuple(down_hosts)  # Host names ("127.0.0.1", "localhost") answering 503 but for /repack
+        self.expired_served = 0
+        self.failures_injected = 0
+        self._random = random.Random(seed)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._payloads = {}
+        self._httpd = None
+        self._thread = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._httpd = QuietHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Helpers ---
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def mirror_url(self, path):
+        return f"http://localhost:{self._httpd.server_address[1]}{path}"
+
+    def file_name(self, index):
+        return f"{self.name_prefix}{index + 1:03d}.rar"
+
+    def page_links(self):
+        return [self.url(f"/f/{i}") for i in range(self.files)]
+
+    def payload(self, index):
+        """Deterministic payload for file `index` (cheap to generate, differs per file, built once)."""
+        with self._lock:
+            body = self._payloads.get(index)
+            if body is None:
+                pattern = bytes((index + j) % 251 for j in range(251))
+                repeats = self.file_size // len(pattern) + 1
+                body = self._payloads[index] = (pattern * repeats)[:self.file_size]
+        return body
+
+    def render_repack_page(self):
+        anchors = "\n".join(
+            f'<li><a href="{link}" target="_blank">{self.file_name(i)}</a></li>'
+            for i, link in enumerate(self.page_links())
+        )
+        if self.mirror:
+            anchors = "\n".join(
+                f'<li><a href="{base}/f/{i}#{self.file_name(i)}" target="_blank">{self.file_name(i)}</a></li>'
+                for base in (self.base_url, self.mirror_url("")) for i in range(self.files)
+            )
+        checksums = ""
+        if self.checksums:
+            checksums = "<h3>MD5</h3><pre>\n" + "\n".join(
+                f"{hashlib.md5(self.payload(i)).hexdigest()} *{self.file_name(i)}" for i in range(self.files)
+            ) + "\n</pre>"
+        return f"<html><body><h3>Download Mirrors</h3><ul>\n{anchors}\n</ul>{checksums}</body></html>"
+
+    def render_file_page(self, index, host=None):
+        path = f"/dl/{index}" + (f"?issued={time.time():.3f}" if self.url_ttl else "")
+        return FILE_PAGE_TEMPLATE.format(
+            name=self.file_name(index),
+            size=self.file_size,
+            token="x" * 64,
+            download_url=f"http://{host}{path}" if host else self.url(path),
+        )
+
+    # --- Request handling ---
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            _head_only = False
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._head_only = True
+                try:
+                    self.do_GET()
+                finally:
+                    self._head_only = False
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests_served += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                parts = self.path.split("?")[0].strip("/").split("/")
+                try:
+                    if parts == ["repack"]:
+                        self._send_html(server.render_repack_page())
+                    elif self._host_down():
+                        self.send_error(503)
+                    elif len(parts) == 2 and parts[0] == "f":
+                        self._send_html(server.render_file_page(int(parts[1]), self.headers.get("Host")))
+                    elif len(parts) == 2 and parts[0] == "dl" and self._link_expired():
+                        with server._lock:
+                            server.expired_served += 1
+                        self.send_error(410)
+                    elif len(parts) == 2 and parts[0] == "dl" and self._inject("fail"):
+                        self.send_error(503)
+                    elif len(parts) == 2 and parts[0] == "dl":
+                        self._send_payload(int(parts[1]), cut=self._inject("reset"))
+                    else:
+                        self.send_error(404)
+                except (ValueError, IndexError):
+                    self.send_error(404)
+
+            def _inject(self, failure):
+                rate = server.fail_rate if failure == "fail" else server.reset_rate
+                if not rate or self._head_only:
+                    return False
+                with server._lock:
+                    injected = server._random.random() < rate
+                    if injected:
+                        server.failures_injected += 1
+                return injected
+
+            def _host_down(self):
+                return self.headers.get("Host", "").rpartition(":")[0] in server.down_hosts
+
+            def _link_expired(self):
+                if not server.url_ttl:
+                    return False
+                issued = self.path.partition("issued=")[2]
+                return not issued or time.time() - float(issued) > server.url_ttl
+
+            def _send_html(self, html):
+                body = html.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not self._head_only:
+                    self.wfile.write(body)
+
+            def _send_payload(self, index, cut=False):
+                if not 0 <= index < server.files:
+                    self.send_error(404)
+                    return
+                body = server.payload(index)
+                etag = f'"fake-{index}-{len(body)}"'
+                status = 200
+                byte_range = self._parse_range(len(body)) if server.ranges else None
+                if byte_range and self.headers.get("If-Range", etag) != etag:
+                    byte_range = None  # Validator mismatch: send the whole (changed) file
+                if byte_range and byte_range[0] >= len(body):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(body)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if byte_range:
+                    start, end = byte_range
+                    content_range = f"bytes {start}-{end}/{len(body)}"
+                    body = memoryview(body)[start:end + 1]
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Content-Disposition", f'attachment; filename="{server.file_name(index)}"')
+                self.send_header("ETag", etag)
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", content_range)
+                self.end_headers()
+                if self._head_only:
+                    return
+                if cut:
+                    body = memoryview(body)[:len(body) // 2]
+                    self.close_connection = True
+                self._write_body(body)
+
+            def _write_body(self, body):
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                started = time.monotonic()
+                for offset in range(0, len(body), THROTTLE_CHUNK_SIZE):
+                    self.wfile.write(body[offset:offset + THROTTLE_CHUNK_SIZE])
+                    ahead = (offset + THROTTLE_CHUNK_SIZE) / server.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+            def _parse_range(self, size):
+                header = self.headers.get("Range", "")
+                if not header.startswith("bytes="):
+                    return None
+                start, _, end = header[len("bytes="):].partition("-")
+                start = int(start)
+                end = min(int(end), size - 1) if end else size - 1
+                return start, end
+
+        return Handler
@@ -0,0 +1 @@
+"""Building blocks of the FitGirl FF Downloader that do not depend on the GUI."""
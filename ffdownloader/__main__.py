@@ -0,0 +1,5 @@
+import sys
+
+from ffdownloader.cli import main
+
+sys.exit(main())
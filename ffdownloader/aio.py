@@ -0,0 +1,1140 @@
+"""
+An asyncio engine for the scrape, discovery and download stages.
+
+DownloadPipeline gives every page fetch, size probe, download and range segment its own thread
+making blocking requests calls, so hundreds of fetches in flight mean hundreds of OS threads.
+AsyncDownloadPipeline runs the same stages as coroutines on one event loop with an aiohttp
+client. The limits the threads get from pools and BoundedSemaphores are asyncio.Semaphores and
+Conditions here: pages in flight in total and per host, files and files per host, connections
+per file. Disk writes, hashing, the session journal and the discovery cache block, so they run
+on a small ThreadPoolExecutor (AIO_IO_THREADS) while the loop keeps reading from the network.
+
+The synchronous API stays as it is: run() creates a loop on the calling thread (the GUI's worker
+thread, the command line's main thread or a job of the queue), runs each stage on it and
+returns the same summary, emitting the same events. select() is called between the stages and
+may block; stop() may be called from any thread. Sessions, the discovery cache, checksums,
+bandwidth limits, a shared scheduler.SlotPool and metrics work as with the threaded engine.
+
+aiohttp is optional (pip install aiohttp); without it AsyncDownloadPipeline raises
+AsyncEngineUnavailable.
+"""
+
+import asyncio
+import collections
+import email.utils
+import functools
+import importlib.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from ffdownloader.checksums import StreamHasher, page_manifest, parse_manifest
+from ffdownloader.core import PIPELINE_QUEUE_SIZE, DownloadPipeline, links_from_page
+from ffdownloader.discovery import (
+    DIRECT_URL_MAX_AGE, DISCOVERY_CHUNK_SIZE, DISCOVERY_DRAIN_LIMIT, DISCOVERY_PER_HOST, DISCOVERY_WORKERS,
+    PROBE_RANGE_HEADERS, PROBE_TIMEOUT, PROGRESS_LOG_INTERVAL, head_probe_result, page_record, range_probe_result,
+)
+from ffdownloader.download import (
+    INCOMPLETE, PART_SUFFIX, PARTIAL_SAVE_INTERVAL, URL_REFRESH_LIMIT, TransferIncomplete, Verification,
+    contiguous_end, file_name_from_response, finish_part_file, refused, strong_etag, total_size_from_content_range,
+)
+from ffdownloader.extract import FilePageScanner
+from ffdownloader.hosts import MIRROR_PROBE_BYTES, MIRROR_PROBE_TIMEOUT, TransferWatch, resolver_for
+from ffdownloader.net import (
+    HTTP_BACKOFF_FACTOR, HTTP_BACKOFF_MAX, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_RETRY_STATUSES,
+    URL_EXPIRED_STATUSES, HostStats, UrlExpired,
+)
+from ffdownloader.scheduler import DownloadScheduler
+from ffdownloader.segmented import (
+    SEGMENT_ADAPT_INTERVAL, SEGMENT_MAX_CONNECTIONS, SEGMENT_MIN_GAIN, SEGMENT_PIECE_RETRIES, SEGMENT_PIECE_SIZE,
+    SEGMENT_START_CONNECTIONS, SEGMENT_STOP_POLL, RangeNotSupported, supports_segmented_download,
+)
+from ffdownloader.transfer import ChunkSizer, TransferStopped, preallocate as preallocate_file
+
+AIO_IO_THREADS = 4  # Threads for disk writes, hashing, session and cache updates of one run
+
+
+class AsyncEngineUnavailable(Exception):
+    """The asyncio engine was chosen but aiohttp is not installed."""
+
+
+def engine_available():
+    """True if aiohttp can be imported, without importing it."""
+    return importlib.util.find_spec("aiohttp") is not None
+
+
+def _blocking(io, func, *args, **kwargs):
+    """Runs the blocking call func(*args, **kwargs) on the executor `io`; await the result."""
+    return asyncio.get_running_loop().run_in_executor(io, functools.partial(func, *args, **kwargs))
+
+
+def _retry_after(value):
+    """Seconds to wait from a Retry-After header (delay seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _AnyOf:
+    """Looks like a threading.Event that is set while any of `events` is."""
+
+    def __init__(self, *events):
+        self.events = events
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+# --- HTTP ---
+
+class AsyncHttpClient:
+    """
+    One aiohttp.ClientSession shared by every request of a run, the asyncio counterpart of
+    net.HttpClient: keep-alive connections pooled (`pool_size` per host), connection errors and
+    HTTP_RETRY_STATUSES retried with exponential backoff (honouring Retry-After), (connect, read)
+    timeouts, and the same HostStats and metrics. Create it on the loop that uses it.
+    `errors` are the exceptions a failed request raises.
+    """
+
+    def __init__(self, headers=None, pool_size=10, retries=HTTP_RETRIES,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), metrics=None):
+        import aiohttp  # Optional, only the async engine needs it
+
+        self._aiohttp = aiohttp
+        self.retries = retries
+        self.timeout = timeout
+        self.metrics = metrics
+        self.stats = HostStats(metrics)
+        self.errors = (aiohttp.ClientError, asyncio.TimeoutError)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_connection_create_start.append(self._on_connection_start)
+        trace.on_connection_create_end.append(self._on_connection_end)
+        self.session = aiohttp.ClientSession(
+            headers=headers,
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=max(1, pool_size)),
+            trace_configs=[trace],
+        )
+
+    async def _on_request_start(self, session, context, params):
+        context.host = params.url.host
+
+    async def _on_connection_start(self, session, context, params):
+        context.connect_started = time.monotonic()
+
+    async def _on_connection_end(self, session, context, params):
+        self.stats.record_handshake(getattr(context, 'host', None) or "?", time.monotonic() - context.connect_started)
+
+    async def request(self, method, url, headers=None, timeout=None, allow_redirects=True):
+        """
+        Returns the response as soon as its headers arrived; release it with `async with response`.
+        `timeout` is a (connect, read) pair or one number for both. Raises one of `errors`.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        client_timeout = self._aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+        host = urlsplit(url).hostname or url
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = await self.session.request(method, url, headers=headers, timeout=client_timeout,
+                                                      allow_redirects=allow_redirects)
+            except self.errors as e:
+                if attempt >= self.retries:
+                    if self.metrics:
+                        self.metrics.inc('http_errors_total', error=type(e).__name__)
+                    raise
+                delay = None
+            else:
+                # Time until the response headers arrived (the body may still be streaming)
+                self.stats.record_request(host, time.monotonic() - started)
+                if self.metrics:
+                    self.metrics.inc('http_responses_total', method=method, status=str(response.status))
+                if (response.status not in HTTP_RETRY_STATUSES or method not in ('GET', 'HEAD')
+                        or attempt >= self.retries):
+                    return response
+                delay = _retry_after(response.headers.get('retry-after'))
+                response.release()
+            if delay is None:
+                delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_FACTOR * 2 ** attempt)
+            attempt += 1
+            if self.metrics:
+                self.metrics.inc('http_retries_total')
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request('HEAD', url, **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+    def log_stats(self, log):
+        """Logs one line per host with its handshake count and latency."""
+        self.stats.log_summary(log)
+
+
+# --- Discovery ---
+
+async def discover_file_page(link, index, http, log, resolver=None):
+    """discovery.discover_file_page() on the loop: the page is scanned as it streams in."""
+    direct_url = resolver.direct_url(link) if resolver else None
+    if direct_url:
+        return page_record(link, index, resolver.part_name(link), direct_url, log)
+
+    started = time.perf_counter()
+    async with await http.get(link) as response:
+        if response.status != 200:
+            log("Failed To Fetch Page", f"Status: {response.status} for {link}", "error")
+            return None
+
+        scanner = resolver.scanner() if resolver else FilePageScanner()
+        parse_seconds = 0.0
+        async for chunk in response.content.iter_chunked(DISCOVERY_CHUNK_SIZE):
+            parse_started = time.perf_counter()
+            done = scanner.feed(chunk)
+            parse_seconds += time.perf_counter() - parse_started
+            if done:
+                break
+        parse_started = time.perf_counter()
+        title, download_url = scanner.finish()
+        if http.metrics:
+            http.metrics.observe('parse_seconds', parse_seconds + time.perf_counter() - parse_started, page="file")
+
+        # Reading a short remainder is cheaper than closing the socket and paying a new handshake
+        drained = 0
+        while drained <= DISCOVERY_DRAIN_LIMIT:
+            chunk = await response.content.read(DISCOVERY_CHUNK_SIZE)
+            if not chunk:
+                break
+            drained += len(chunk)
+    if http.metrics:
+        http.metrics.observe('discovery_page_seconds', time.perf_counter() - started)
+    return page_record(link, index, title, download_url, log)
+
+
+async def probe_file(file_info, http, log):
+    """discovery.probe_file() on the loop: sets file_info['size'], file_info['ranges'] and file_info['file_name']."""
+    url = file_info['url']
+    size = None
+    ranges = False
+    file_name = None
+    try:
+        async with await http.head(url, timeout=PROBE_TIMEOUT) as response:
+            size, ranges = head_probe_result(response.status, response.headers)
+            if response.status == 200:
+                file_name = file_name_from_response(log, response, url, file_info['name'])
+        if size is None:
+            async with await http.get(url, headers=PROBE_RANGE_HEADERS, timeout=PROBE_TIMEOUT) as response:
+                size, ranges = range_probe_result(response.status, response.headers, ranges)
+                if file_name is None and response.status in (200, 206):
+                    file_name = file_name_from_response(log, response, url, file_info['name'])
+    except http.errors as e:
+        log("Could not determine file size", f"{file_info['name']}: {e or type(e).__name__}", "warning")
+    file_info['size'] = size
+    file_info['ranges'] = ranges
+    file_info['file_name'] = file_name
+    return file_info
+
+
+async def discover_files(links, http, log, io, max_workers=DISCOVERY_WORKERS, per_host=DISCOVERY_PER_HOST,
+                         cache=None, on_file=None, probe=False, resolvers=None, mirrors=None, ranking=None,
+                         stop=None):
+    """
+    discovery.discover_files() on the loop: every page is a task, at most `max_workers` of them
+    (and `per_host` per host) fetching at once, a page that cannot be resolved is tried on its
+    `mirrors`, fastest hoster first by `ranking`. Cache lookups and stores run on `io`. Once `stop`
+    (a threading.Event) is set, the remaining tasks are cancelled and the files resolved so far are
+    returned.
+    on_file(file_info) is a coroutine function, awaited as each file is resolved.
+    """
+    total = len(links)
+    results = [None] * total
+    in_flight = asyncio.Semaphore(max(1, max_workers))
+    hosts = collections.defaultdict(lambda: asyncio.Semaphore(max(1, per_host)))
+
+    cached = await _blocking(io, cache.get_many, links) if cache else {}
+    if cached:
+        log(f"Loaded {len(cached)}/{total} pages from the discovery cache.", "", "info")
+    to_fetch = []
+    for i, link in enumerate(links):
+        if link in cached and not (probe and cached[link].get('size') is None):
+            results[i] = cached[link]
+            if on_file:
+                await on_file(cached[link])
+        else:
+            to_fetch.append((i, link))  # Not cached, or cached without a size to probe for
+    if not to_fetch:
+        return [file_info for file_info in results if file_info]
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    async def resolve(index, link):
+        sources = [link] + (mirrors or {}).get(link, [])
+        if ranking and len(sources) > 1:
+            sources = ranking.ranked(sources, resolvers)
+        for number, source in enumerate(sources):
+            if stopped():
+                return None
+            try:
+                async with hosts[urlsplit(source).netloc.lower()]:
+                    file_info = await discover_file_page(source, index, http, log, resolver_for(source, resolvers))
+            except Exception as e:
+                if number + 1 == len(sources):
+                    raise
+                log(f"Error discovering link {source}", str(e) or type(e).__name__, "error")
+                continue
+            if file_info:
+                if source != link:
+                    file_info['page_link'] = link  # Still known by its part's link...
+                    file_info['source'] = source  # ...but its direct URL is the mirror's (not cached)
+                return file_info
+        return None
+
+    async def worker(index, link):
+        try:
+            async with in_flight:
+                if stopped():
+                    return index, None
+                file_info = cached.get(link) or await resolve(index, link)
+                if probe and file_info and not stopped():
+                    async with hosts[urlsplit(file_info['url']).netloc.lower()]:
+                        await probe_file(file_info, http, log)
+        except Exception as e:
+            log(f"Error discovering link {link}", str(e) or type(e).__name__, "error")
+            file_info = None
+        return index, file_info
+
+    completed = total - len(to_fetch)
+    failed = 0
+    started = time.monotonic()
+    last_report = started
+
+    tasks = [asyncio.ensure_future(worker(i, link)) for i, link in to_fetch]
+    for finished in asyncio.as_completed(tasks):
+        index, results[index] = await finished
+        if results[index] is None:
+            failed += 1
+        elif on_file:
+            await on_file(results[index])
+        completed += 1
+
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_LOG_INTERVAL and completed < total:
+            last_report = now
+            log(f"Discovered {completed}/{total} pages...", f"{failed} failed, {now - started:.1f}s elapsed", "info")
+        if stopped():
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            break
+
+    log(f"Discovery {'stopped' if stopped() else 'pass finished'}: {completed - failed}/{total} pages resolved.",
+        f"{time.monotonic() - started:.1f}s", "info")
+    if cache:
+        await _blocking(io, cache.put_many,
+                        [results[i] for i, _ in to_fetch if results[i] and 'source' not in results[i]])
+    return [file_info for file_info in results if file_info]
+
+
+async def probe_speed(http, url, nbytes=MIRROR_PROBE_BYTES, timeout=MIRROR_PROBE_TIMEOUT):
+    """hosts.probe_speed() on the loop: bytes per second of the first `nbytes` of `url`, or None."""
+    started = time.monotonic()
+    received = 0
+    try:
+        async with await http.get(url, headers={'Range': f"bytes=0-{nbytes - 1}"}, timeout=timeout) as response:
+            if response.status not in (200, 206):
+                return None
+            while received < nbytes:
+                chunk = await response.content.read(64 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+    except http.errors:
+        return None
+    elapsed = time.monotonic() - started
+    return received / elapsed if received and elapsed > 0 else None
+
+
+# --- Downloads ---
+
+async def copy_response(response, f, io, on_chunk=None, stop=None, sizer=None, hasher=None, throttle=None,
+                        metrics=None):
+    """
+    transfer.copy_response() on the loop: reads the body of `response` in adaptive chunk sizes and
+    writes (and hashes) every chunk on the executor `io`, so the loop never waits for the disk.
+    on_chunk(nbytes) is a coroutine function awaited after every write. Returns the bytes written.
+    """
+    sizer = sizer or ChunkSizer()
+    written = 0
+    started = time.perf_counter()
+
+    def write(data):
+        write_started = time.perf_counter()
+        f.write(data)
+        if metrics:
+            metrics.observe('disk_write_seconds', time.perf_counter() - write_started)
+        if hasher:
+            hasher.update(data)
+
+    try:
+        while not (stop and stop.is_set()):
+            read_started = time.perf_counter()
+            size = throttle.chunk_size(sizer.size) if throttle else sizer.size
+            # aiohttp hands out what its buffer holds, collect a whole chunk per trip to the executor
+            data = bytearray()
+            while len(data) < size:
+                piece = await response.content.read(size - len(data))
+                if not piece:
+                    break
+                data += piece
+            if not data:
+                break
+            await _blocking(io, write, data)
+            written += len(data)
+            sizer.update(len(data), time.perf_counter() - read_started)
+            if on_chunk:
+                await on_chunk(len(data))
+            if throttle:
+                wait = throttle.reserve(len(data))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+    finally:  # Also counts what a broken stream wrote
+        if metrics and written:
+            metrics.inc('download_bytes_total', written)
+            metrics.observe('stream_bytes_per_second', written / max(time.perf_counter() - started, 1e-6))
+    return written
+
+
+class SegmentedDownload:
+    """
+    segmented.SegmentedDownloader on the loop: connections are tasks taking `piece_size` pieces
+    from a shared list and writing them at their offsets through their own file handle on `io`.
+    It starts with `start_connections` and adds one every SEGMENT_ADAPT_INTERVAL seconds while
+    that still raises throughput by SEGMENT_MIN_GAIN. on_piece_done is a coroutine function.
+    """
+
+    def __init__(self, url, output_path, total_size, http, progress, file_name, log, io,
+                 max_connections=SEGMENT_MAX_CONNECTIONS, start_connections=SEGMENT_START_CONNECTIONS,
+                 piece_size=SEGMENT_PIECE_SIZE, done_pieces=None, on_piece_done=None, throttle=None, stop=None):
+        self.url = url
+        self.output_path = output_path
+        self.total_size = total_size
+        self.http = http
+        self.progress = progress
+        self.file_name = file_name
+        self.log = log
+        self.io = io
+        self.max_connections = max(1, max_connections)
+        self.start_connections = max(1, min(start_connections, self.max_connections))
+        self.piece_size = max(256 * 1024, piece_size)
+        self.on_piece_done = on_piece_done
+        self.throttle = throttle
+        self.stop = stop
+
+        self.done_pieces = set(done_pieces or ())
+        self.resuming = bool(self.done_pieces)
+        self.pieces = collections.deque()
+        self.downloaded = 0
+        for start in range(0, total_size, self.piece_size):
+            end = min(start + self.piece_size, total_size) - 1
+            if start in self.done_pieces:
+                self.downloaded += end + 1 - start
+            else:
+                self.pieces.append((start, end))
+
+        self.error = None
+        self._aborted = False
+        self._stopping = _AnyOf(self, *([stop] if stop else []))  # What every connection's copy loop checks
+        self._piece_failures = collections.Counter()
+        self._active = 0  # Connection tasks still running
+        self._finished = None  # asyncio.Event set when the last of them ends, created on the loop by run()
+
+    def is_set(self):
+        return self._aborted
+
+    async def run(self):
+        """Downloads the whole file. Raises RangeNotSupported, UrlExpired, TransferStopped or the first fatal error."""
+        if not self.resuming:
+            await _blocking(self.io, _create_preallocated, self.output_path, self.total_size)
+
+        self.progress(self.downloaded, self.total_size, self.file_name)
+        self._finished = asyncio.Event()
+        connections = [self._start_connection() for _ in range(self.start_connections)]
+
+        last_rate = None
+        last_time, last_bytes = time.monotonic(), self.downloaded
+        next_check = last_time + SEGMENT_ADAPT_INTERVAL
+        growing = True
+        while not self._finished.is_set():
+            if self.stop and self.stop.is_set():
+                self._aborted = True
+            if self._aborted:
+                await self._finished.wait()  # Each connection gives up after its current read
+                break
+            # Returns as soon as the last connection is done, not at the end of the interval
+            try:
+                await asyncio.wait_for(self._finished.wait(),
+                                       min(SEGMENT_STOP_POLL, max(0.0, next_check - time.monotonic())))
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            if now < next_check or self._finished.is_set():
+                continue
+            next_check = now + SEGMENT_ADAPT_INTERVAL
+            rate = (self.downloaded - last_bytes) / (now - last_time)
+            last_time, last_bytes = now, self.downloaded
+
+            if not growing or not self.pieces:
+                continue
+            if last_rate is not None and rate < last_rate * (1 + SEGMENT_MIN_GAIN):
+                growing = False  # The last connection we added did not help, keep the current count
+                self.log(f"Segmented download settled on {len(connections)} connections",
+                         f"{self.file_name} ({rate / 1024 / 1024:.1f} MB/s)", "info")
+                continue
+            if len(connections) < self.max_connections:
+                last_rate = rate
+                connections.append(self._start_connection())
+
+        await asyncio.gather(*connections)
+        if self.stop and self.stop.is_set() and self.downloaded != self.total_size:
+            raise TransferStopped(f"Stopped at {self.downloaded}/{self.total_size} bytes")
+        if self.error:
+            raise self.error
+        if self.downloaded != self.total_size:
+            raise IOError(f"Segmented download incomplete ({self.downloaded}/{self.total_size} bytes)")
+
+    def _start_connection(self):
+        self._active += 1
+        self._finished.clear()
+        return asyncio.create_task(self._connection())
+
+    async def _connection(self):
+        try:
+            await self._pull_pieces()
+        finally:
+            self._active -= 1
+            if not self._active:
+                self._finished.set()
+
+    async def _pull_pieces(self):
+        f = await _blocking(self.io, open, self.output_path, 'r+b')
+        try:
+            while not self._stopping.is_set() and self.pieces:
+                start, end = self.pieces.popleft()
+                try:
+                    await self._fetch_piece(f, start, end)
+                except (RangeNotSupported, UrlExpired) as e:
+                    self._fail(e)
+                except Exception as e:
+                    self._piece_failures[start] += 1
+                    if self._piece_failures[start] > SEGMENT_PIECE_RETRIES:
+                        self._fail(e)
+                    else:
+                        if self.http.metrics:
+                            self.http.metrics.inc('download_retries_total', reason="piece")
+                        self.pieces.append((start, end))  # Let any connection retry it
+        finally:
+            await _blocking(self.io, f.close)
+
+    async def _fetch_piece(self, f, start, end):
+        offset = start
+
+        async def on_chunk(nbytes):
+            nonlocal offset
+            offset += nbytes
+            self.downloaded += nbytes
+            self.progress(self.downloaded, self.total_size, self.file_name)
+
+        try:
+            async with await self.http.get(self.url, headers={'Range': f"bytes={start}-{end}"}) as response:
+                if response.status != 206:
+                    if response.status == 200:
+                        raise RangeNotSupported(f"Server ignored Range request for {self.file_name}")
+                    if response.status in URL_EXPIRED_STATUSES:
+                        raise UrlExpired(response.status)
+                    raise IOError(f"Status {response.status} for bytes {start}-{end}")
+
+                await _blocking(self.io, f.seek, start)
+                await copy_response(response, f, self.io, on_chunk, stop=self._stopping, throttle=self.throttle,
+                                    metrics=self.http.metrics)
+                if self._stopping.is_set():
+                    return
+
+            if offset != end + 1:
+                raise IOError(f"Short read for bytes {start}-{end} ({offset - start} bytes)")
+        except Exception:
+            # Give back what this attempt counted, the whole piece is fetched again
+            self.downloaded -= offset - start
+            raise
+
+        if self.on_piece_done:
+            await _blocking(self.io, f.flush)
+            self.done_pieces.add(start)
+            await self.on_piece_done(sorted(self.done_pieces))
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._aborted = True
+
+
+def _create_preallocated(path, size):
+    with open(path, 'wb') as f:
+        preallocate_file(f, size)  # So every connection can write at its own offset
+
+
+def _open_part_file(path, mode, offset, preallocate_size=0):
+    f = open(path, mode)
+    if preallocate_size:
+        preallocate_file(f, preallocate_size)
+    f.seek(offset)
+    return f
+
+
+async def download_file(http, download_url, output_folder, file_label, progress, log, io, partial=None,
+                        save_partial=None, on_url_expired=None, preallocate=False, expected_digest=None,
+                        on_verified=None, throttle=None, stop=None):
+    """
+    download.download_file() on the loop, with the same resume records, URL refreshes,
+    verification and return value. save_partial(record) blocks and runs on `io`;
+    on_url_expired() is a coroutine function returning a fresh URL or None.
+    """
+    save_partial = save_partial or (lambda record: None)
+    verify = Verification(expected_digest, on_verified) if expected_digest else None
+    latest = [partial]
+
+    def save(record):
+        latest[0] = record  # What a retry with a fresh URL resumes from
+        save_partial(record)
+
+    refreshes = 0
+    while True:
+        try:
+            return await _download(http, download_url, output_folder, file_label, progress, log, io, latest[0],
+                                   save, preallocate, verify, throttle, stop)
+        except UrlExpired as e:
+            fresh_url = await on_url_expired() if on_url_expired and refreshes < URL_REFRESH_LIMIT else None
+            if not fresh_url:
+                log(f"Failed To Download File (Status: {e.status})", f"{file_label} from {download_url}", "error")
+                return False
+            refreshes += 1
+            if http.metrics:
+                http.metrics.inc('download_retries_total', reason="url_expired")
+            log("Download link expired, continuing with a fresh one", file_label, "warning")
+            download_url = fresh_url
+            if verify:
+                verify.hasher = StreamHasher(verify.algorithm)  # Rebuilt from the bytes on disk on resume
+        except TransferStopped:
+            log("Download paused, keeping partial file for resume", file_label, "warning")
+            return False
+        except TransferIncomplete as e:
+            log("Download interrupted, keeping partial file for resume", f"{file_label}: {e}", "warning")
+            return INCOMPLETE
+        except Exception as e:
+            log(f"Failed To Download File '{file_label}'", str(e) or type(e).__name__, "error")
+            return False
+
+
+async def _download(http, download_url, output_folder, file_label, progress, log, io, partial, save, preallocate,
+                    verify, throttle, stop):
+    """One attempt of download_file. Raises UrlExpired when the server rejects `download_url`."""
+    resume_from = 0
+    request_headers = {}
+    if partial and partial.get('mode') == 'stream':
+        part_path = os.path.join(output_folder, partial['file_name'] + PART_SUFFIX)
+        if os.path.exists(part_path):
+            resume_from = partial.get('committed', 0) if partial.get('preallocated') else os.path.getsize(part_path)
+    if resume_from:
+        request_headers['Range'] = f"bytes={resume_from}-"
+        validator = partial.get('etag') or partial.get('last_modified')
+        if validator:
+            request_headers['If-Range'] = validator
+
+    response = await http.get(download_url, headers=request_headers)
+
+    if response.status == 416 and resume_from and resume_from == partial.get('size'):
+        response.release()
+        return await _blocking(io, finish_part_file, log, os.path.join(output_folder, partial['file_name']),
+                               resume_from, partial['size'], save, verify)
+
+    if response.status == 206 and resume_from:
+        file_name = partial['file_name']
+        total_size = total_size_from_content_range(response) or partial.get('size', 0)
+        log(f"Resuming download at {resume_from / 1024 / 1024:.1f}MB", file_name, "info")
+    elif response.status == 200:
+        if resume_from:
+            log("Server sent the whole file, restarting download", file_label, "warning")
+        resume_from = 0
+        file_name = file_name_from_response(log, response, download_url, file_label)
+        total_size = int(response.headers.get('content-length', 0))
+    else:
+        response.release()
+        return refused(log, response.status, file_label, download_url)
+
+    output_path = os.path.join(output_folder, file_name)
+    record = {
+        'url': download_url,
+        'file_name': file_name,
+        'size': total_size,
+        'etag': strong_etag(response),
+        'last_modified': response.headers.get('last-modified'),
+    }
+
+    if response.status == 200 and supports_segmented_download(response, total_size):
+        response.close()
+        try:
+            return await _download_segmented(http, log, io, download_url, output_path, total_size, record, partial,
+                                             progress, save, verify, throttle, stop)
+        except RangeNotSupported as e:
+            log("Range requests not honoured, falling back to a single stream", str(e), "warning")
+            if verify:
+                verify.hasher = StreamHasher(verify.algorithm)
+            response = await http.get(download_url)
+            if response.status != 200:
+                response.release()
+                return refused(log, response.status, file_label, download_url)
+
+    record['mode'] = 'stream'
+    if resume_from:
+        record['preallocated'] = bool(partial.get('preallocated'))
+    else:
+        record['preallocated'] = bool(preallocate and total_size)
+    async with response:
+        downloaded = await _download_stream(response, output_path + PART_SUFFIX, record, resume_from, progress, save,
+                                            verify, io, throttle, stop, http.metrics)
+    return await _blocking(io, finish_part_file, log, output_path, downloaded, total_size, save, verify)
+
+
+async def _download_stream(response, part_path, record, resume_from, progress, save, verify, io, throttle, stop,
+                           metrics):
+    """Writes a single-stream response into the ".part" file from `resume_from` on, returning the file's byte count."""
+    total_size = record['size']
+    hasher = verify.hasher if verify else None
+    if hasher and resume_from:
+        await _blocking(io, hasher.advance_to, part_path, resume_from)
+    downloaded = resume_from
+    preallocated = record['preallocated']
+    await _blocking(io, save, dict(record, committed=downloaded) if preallocated else record)
+    progress(downloaded, total_size, record['file_name'])
+
+    mode = 'wb' if not resume_from else ('r+b' if preallocated else 'ab')
+    f = await _blocking(io, _open_part_file, part_path, mode, resume_from,
+                        total_size if preallocated and not resume_from else 0)
+    last_save = time.monotonic()
+
+    def commit():
+        f.flush()
+        save(dict(record, committed=downloaded))
+
+    async def on_chunk(nbytes):
+        nonlocal downloaded, last_save
+        downloaded += nbytes
+        progress(downloaded, total_size, record['file_name'])
+        # The file size no longer tells how far a preallocated download got, so record it
+        if preallocated and time.monotonic() - last_save >= PARTIAL_SAVE_INTERVAL:
+            last_save = time.monotonic()
+            await _blocking(io, commit)
+
+    try:
+        await copy_response(response, f, io, on_chunk, stop=stop, hasher=hasher, throttle=throttle, metrics=metrics)
+    except TransferStopped:
+        raise
+    except Exception as e:
+        raise TransferIncomplete(f"Connection lost at {downloaded}/{total_size} bytes "
+                                 f"({str(e) or type(e).__name__})") from e
+    finally:
+        if preallocated:
+            await _blocking(io, commit)
+        await _blocking(io, f.close)
+    if stop and stop.is_set() and downloaded != total_size:
+        raise TransferStopped(f"Stopped at {downloaded}/{total_size} bytes")
+    return downloaded
+
+
+async def _download_segmented(http, log, io, download_url, output_path, total_size, record, partial, progress, save,
+                              verify, throttle, stop):
+    """Runs SegmentedDownload into the ".part" file, reusing finished pieces of a matching earlier run."""
+    part_path = output_path + PART_SUFFIX
+    done_pieces = []
+    if (partial and partial.get('mode') == 'segmented'
+            and partial.get('size') == total_size
+            and partial.get('piece_size') == SEGMENT_PIECE_SIZE
+            and (partial.get('etag'), partial.get('last_modified')) in ((record['etag'], record['last_modified']),
+                                                                        (None, None))
+            and os.path.exists(part_path) and os.path.getsize(part_path) == total_size):
+        done_pieces = partial.get('pieces_done', [])
+        log(f"Resuming segmented download ({len(done_pieces)} pieces already done)", record['file_name'], "info")
+
+    record = dict(record, mode='segmented', piece_size=SEGMENT_PIECE_SIZE, pieces_done=done_pieces)
+    await _blocking(io, save, record)
+    last_save = [time.monotonic()]
+
+    def piece_done(pieces_done, save_now):
+        if verify:
+            # Pieces finish out of order, hash whatever is contiguous from the start while it is still cached
+            verify.hasher.advance_to(part_path, contiguous_end(pieces_done, SEGMENT_PIECE_SIZE, total_size))
+        if save_now:
+            save(dict(record, pieces_done=pieces_done))
+
+    async def on_piece_done(pieces_done):
+        # Saving after every piece would rewrite the state file constantly on a fast link
+        now = time.monotonic()
+        save_now = now - last_save[0] >= PARTIAL_SAVE_INTERVAL
+        if save_now:
+            last_save[0] = now
+        if verify or save_now:
+            await _blocking(io, piece_done, pieces_done, save_now)
+
+    downloader = SegmentedDownload(download_url, part_path, total_size, http, progress, record['file_name'], log, io,
+                                   done_pieces=done_pieces, on_piece_done=on_piece_done, throttle=throttle, stop=stop)
+    try:
+        await downloader.run()
+    finally:
+        await _blocking(io, save, dict(record, pieces_done=sorted(downloader.done_pieces)))
+    return await _blocking(io, finish_part_file, log, output_path, downloader.downloaded, total_size, save, verify)
+
+
+# --- Scheduling ---
+
+class AsyncDownloadScheduler(DownloadScheduler):
+    """
+    DownloadScheduler with coroutine workers on one loop: the same start order, per host limit,
+    retries, shared SlotPool and callbacks, for a coroutine download_func. `feed` is an
+    asyncio.Queue ended by None. on_finished writes the session, so it runs on the executor `io`.
+    stop() may be called from any thread.
+    """
+
+    def __init__(self, download_func, io, **kwargs):
+        super().__init__(download_func, **kwargs)
+        self.io = io
+        self._loop = None
+        self._changed = None  # asyncio.Condition of the running loop, replaces the threading one
+
+    def stop(self):
+        self._stopped = True
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._notify()))
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def run(self, files=(), feed=None):
+        """Downloads every file in `files`, plus everything put on `feed` until it yields None."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Condition()
+        self._pending = self.prioritize(files)
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._feeding = feed is not None
+        worker_count = self.max_workers if feed is not None else min(self.max_workers, len(self._pending))
+        workers = [self._worker(slot) for slot in range(worker_count)]
+        if feed is not None:
+            workers.append(self._feed(feed))
+        await asyncio.gather(*workers)
+
+    async def _feed(self, feed):
+        """Moves files from `feed` to the pending list, taking only what idle workers can start."""
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self._pending) < self.max_workers or self._stopped)
+            file_info = await feed.get()
+            async with self._changed:
+                if file_info is None:
+                    self._feeding = False
+                else:
+                    self._pending = self.prioritize(self._pending + [file_info])
+                self._changed.notify_all()
+            if file_info is None:
+                return
+
+    async def _next_job(self):
+        async with self._changed:
+            while (self._pending or self._feeding) and not self._stopped:
+                for i, file_info in enumerate(self._pending):
+                    host = urlsplit(file_info['url']).netloc.lower()
+                    if self._active_per_host[host] < self.per_host:
+                        self._active_per_host[host] += 1
+                        file_info = self._pending.pop(i)
+                        self._changed.notify_all()
+                        return file_info, host
+                await self._changed.wait()
+            return None, None
+
+    async def _release_host(self, host):
+        async with self._changed:
+            self._active_per_host[host] -= 1
+            self._changed.notify_all()
+
+    async def _worker(self, worker_slot):
+        while True:
+            file_info, host = await self._next_job()
+            if file_info is None:
+                return
+            if not self.slot_pool:
+                await self._download(worker_slot, file_info, host)
+                continue
+            # The pool is shared with threaded runs, wait for it off the loop
+            slot = await self._loop.run_in_executor(
+                None, functools.partial(self.slot_pool.acquire, cancelled=lambda: self._stopped))
+            if slot is None:
+                await self._release_host(host)
+                return
+            try:
+                await self._download(slot, file_info, host)
+            finally:
+                self.slot_pool.release(slot)
+
+    async def _download(self, slot, file_info, host):
+        self._slot_bytes[slot] = 0
+        self.log(f"Worker {slot + 1} downloading...", file_info['name'], "info")
+        success = False
+        try:
+            success = await self.download_func(
+                file_info, lambda current, total, name: self._report(slot, current, total, name))
+        except Exception as e:
+            self.log(f"Error processing link {file_info['page_link']}", str(e), "error")
+        finally:
+            await self._release_host(host)
+
+        if success == self.RETRY:
+            async with self._changed:
+                retry = self._attempts[file_info['page_link']] < self.retries
+                if retry:
+                    self._attempts[file_info['page_link']] += 1
+                    self.retried += 1
+                    self._pending.append(file_info)
+                    self._changed.notify_all()
+            if retry:
+                self.log("Queued again for another attempt", file_info['name'], "warning")
+                return
+            success = False
+
+        if success != self.STOPPED:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if self.on_finished:
+            await _blocking(self.io, self.on_finished, slot, file_info, None if success == self.STOPPED else success)
+
+
+# --- Pipeline ---
+
+class AsyncDownloadPipeline(DownloadPipeline):
+    """
+    DownloadPipeline whose network stages run on an asyncio loop (see the module docstring).
+    Same constructor, run(), stop() and events. Raises AsyncEngineUnavailable without aiohttp.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if not engine_available():
+            raise AsyncEngineUnavailable("The async engine needs aiohttp (pip install aiohttp)")
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._io = None
+
+    def run(self, scrape_url, select=None, rule=None):
+        """Runs DownloadPipeline.run() with a fresh event loop on the calling thread, blocking until it ends."""
+        self._loop = asyncio.new_event_loop()
+        self._io = ThreadPoolExecutor(AIO_IO_THREADS, thread_name_prefix="aio-io")
+        try:
+            return super().run(scrape_url, select, rule)
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+            self._loop.close()
+            self._io.shutdown()
+
+    def _run(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+    def _open_http(self, metrics):
+        async def open_client():
+            return AsyncHttpClient(self.headers, pool_size=max(self.discovery_per_host,
+                                                               self.per_host * SEGMENT_MAX_CONNECTIONS),
+                                   metrics=metrics)
+
+        return self._run(open_client())
+
+    def _close_http(self):
+        self._run(self.http.close())
+
+    def _scrape(self, scrape_url, manifest, mirrors):
+        links, found_mirrors = self._run(self._scrape_page(scrape_url, manifest))
+        mirrors.update(found_mirrors)
+        return links
+
+    async def _scrape_page(self, scrape_url, manifest):
+        """core.scrape_links() plus checksums.scrape_manifest(), with the .md5/.sha1 files fetched at once."""
+        self.log("Scraping URL for links", scrape_url, "info")
+        try:
+            async with await self.http.get(scrape_url) as response:
+                response.raise_for_status()
+                page = await response.read()
+        except self.http.errors as e:
+            self.log("Failed to retrieve webpage for scraping", str(e) or type(e).__name__, "error")
+            self.emit("error", message=f"Failed to retrieve {scrape_url}: {str(e) or type(e).__name__}")
+            return [], {}
+
+        page_checksums, checksum_links = page_manifest(page)
+        manifest.update(page_checksums)
+
+        async def fetch_checksums(link):
+            try:
+                async with await self.http.get(link) as response:
+                    response.raise_for_status()
+                    return parse_manifest(await response.text(errors='replace'))
+            except self.http.errors as e:
+                self.log("Could not fetch checksum file", f"{link}: {e}", "warning")
+
+        for linked in await asyncio.gather(*(fetch_checksums(link) for link in checksum_links)):
+            if linked:
+                manifest.update(linked)
+        if manifest:
+            self.log(f"Found checksums for {len(manifest)} files", "", "info")
+        return links_from_page(page, self.log, self.http.metrics, self.resolvers)
+
+    def _discover(self, links, cache, on_file=None):
+        return self._run(discover_files(links, self.http, self.log, self._io, max_workers=self.discovery_workers,
+                                        per_host=self.discovery_per_host, cache=cache, on_file=on_file, probe=True,
+                                        resolvers=self.resolvers, mirrors=self._mirrors, ranking=self.ranking,
+                                        stop=self._stop))
+
+    def _probe_hosters(self, links):
+        async def probe(name, link):
+            try:
+                record = await discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except self.http.errors as e:
+                self.log("Could not resolve the mirror link", f"{link}: {e}", "warning")
+                record = None
+            self._record_probe(name, await probe_speed(self.http, record['url']) if record else None)
+
+        async def probe_all():
+            await asyncio.gather(*(probe(name, link) for name, link in links.items()))
+
+        self._run(probe_all())
+
+    def _run_downloads(self, scheduler, files):
+        self._run(scheduler.run(files))
+
+    def _discover_and_download(self, links, session, cache, rule, scheduler, summary):
+        """The pipelined flow with discovery and downloads as tasks on the loop, joined by an asyncio.Queue."""
+        self.log("Pipelined mode: downloads start as files are discovered.", f"Selection: {rule.describe()}",
+                 "info")
+        discovered_files = []
+        space = {'free': self._free_space(), 'skipped': 0}
+        admit = self._admission(rule, session, summary, space, discovered_files)
+        self._start_pipelined_downloads(scheduler)
+
+        async def pipelined():
+            feed = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+            async def on_file(file_info):
+                if admit(file_info):
+                    await feed.put(file_info)  # Waits while the download stage is saturated
+
+            downloads = asyncio.create_task(scheduler.run(feed=feed))
+            try:
+                await discover_files(links, self.http, self.log, self._io, max_workers=self.discovery_workers,
+                                     per_host=self.discovery_per_host, cache=cache, on_file=on_file, probe=True,
+                                     resolvers=self.resolvers, mirrors=self._mirrors, ranking=self.ranking,
+                                     stop=self._stop)
+            finally:
+                await feed.put(None)
+                await downloads
+
+        self._run(pipelined())
+        return self._pipelined_discovery_finished(discovered_files, space, summary)
+
+    def _new_scheduler(self, download):
+        return AsyncDownloadScheduler(download, self._io, max_workers=self.max_workers, per_host=self.per_host,
+                                      order=self.order, log=self.log, retries=self.retries,
+                                      slot_pool=self.slot_pool)
+
+    def _download_job(self, session, state_file, manifest, cache, summary, verified):
+        download_folder = self.download_folder
+        save_partial = self._partial_saver(session, state_file)
+        io = self._io
+
+        async def refresh_url(file_info):
+            """Resolves the file page (or the mirror it was found on) again, returning its fresh direct URL or None."""
+            link = file_info.get('source', file_info['page_link'])
+            try:
+                fresh = await discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except self.http.errors as e:
+                self.log("Could not resolve a fresh download link", f"{link}: {e}", "error")
+                fresh = None
+            return await _blocking(io, self._use_fresh_url, file_info, fresh, cache, summary)
+
+        async def resolve_mirror(link):
+            """The direct URL of mirror `link`, resolved now (mirror URLs are not cached), or None."""
+            try:
+                record = await discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except self.http.errors as e:
+                self.log("Could not resolve the mirror link", f"{link}: {e}", "error")
+                return None
+            return record['url'] if record else None
+
+        async def download(file_info, progress):
+            page_link = file_info['page_link']
+            await _blocking(io, session.start, page_link)
+            if await _blocking(io, self._reuse_existing, file_info, manifest, verified, session, save_partial,
+                               summary):
+                progress(file_info['size'], file_info['size'], file_info['name'])
+                return True
+
+            def on_verified(algorithm, digest, ok):
+                verified[page_link] = (algorithm, digest, ok)
+
+            def save_record(record):
+                if record:
+                    file_info['file_name'] = record['file_name']  # What the folder index will know the file as
+                save_partial(page_link, record)
+
+            sources = self._sources(file_info)
+            for number, source in enumerate(sources):
+                if source == file_info.get('source', page_link):
+                    if time.time() - file_info.get('fetched_at', 0) > DIRECT_URL_MAX_AGE:
+                        self.log("Download link is old, resolving it again", file_info['name'], "info")
+                        await refresh_url(file_info)
+                    url = file_info['url']
+                    on_url_expired = functools.partial(refresh_url, file_info)
+                else:
+                    url = await resolve_mirror(source)
+                    on_url_expired = functools.partial(resolve_mirror, source)
+                watch = TransferWatch(self._stop, progress, stall=number + 1 < len(sources)
+                                      and not (self.limiter and self.limiter.active))
+                success = False
+                if url:
+                    partial = await _blocking(io, self._partial_for, session, page_link, url, save_partial)
+                    success = await download_file(self.http, url, download_folder, file_info['name'], watch.progress,
+                                                  self.log, io, partial=partial,
+                                                  save_partial=save_record,
+                                                  on_url_expired=on_url_expired,
+                                                  preallocate=self.preallocate,
+                                                  expected_digest=manifest.lookup(file_info['name']),
+                                                  on_verified=on_verified,
+                                                  throttle=self.limiter.for_file() if self.limiter else None,
+                                                  stop=watch)
+                result = self._download_result(success, page_link, verified)
+                if not self._attempt_finished(file_info, sources, number, watch, result, summary):
+                    return result
+            return False
+
+        return download
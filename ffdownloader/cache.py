@@ -0,0 +1,126 @@
+"""
+Persistent cache of discovered file pages.
+
+Resolving a fuckingfast.co page (fetch + extract) is the slow part of every session start, and a
+resumed session would otherwise resolve every pending page again. DiscoveryCache keeps
+page link -> {name, url, size, file_name, fetched_at} in a small SQLite database in the download
+folder.
+
+Entries older than `ttl` seconds are ignored and purged, the least recently used entries are
+evicted once there are more than `max_entries`, and callers invalidate an entry as soon as its
+direct URL stops working (403/410).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE_NAME = ".discovery_cache.sqlite3"
+DEFAULT_TTL = 24 * 3600  # Seconds a resolved page stays valid
+DEFAULT_MAX_ENTRIES = 5000
+
+# SQLite refuses statements with more than 999 parameters on older builds
+_QUERY_BATCH = 500
+
+
+class DiscoveryCache:
+    """Thread-safe SQLite-backed map of page link -> discovered file info."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " page_link TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " size INTEGER,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " file_name TEXT)"
+        )
+        if 'file_name' not in {row[1] for row in self._db.execute("PRAGMA table_info(pages)")}:
+            self._db.execute("ALTER TABLE pages ADD COLUMN file_name TEXT")  # A cache written by an older version
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+
+    @classmethod
+    def for_folder(cls, folder, **kwargs):
+        """Opens (or creates) the cache stored in `folder`."""
+        return cls(os.path.join(folder, CACHE_FILE_NAME), **kwargs)
+
+    def get_many(self, page_links):
+        """
+        Returns {page_link: file_info} for every link with a fresh entry.
+        file_info has the same keys discovery produces ('name', 'url', 'page_link') plus
+        'size' and 'file_name' (None if unknown) and 'fetched_at'.
+        """
+        now = time.time()
+        oldest = now - self.ttl
+        found = {}
+        links = list(page_links)
+        with self._lock:
+            for i in range(0, len(links), _QUERY_BATCH):
+                batch = links[i:i + _QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT page_link, name, url, size, file_name, fetched_at FROM pages "
+                    f"WHERE fetched_at >= ? AND page_link IN ({placeholders})",
+                    [oldest, *batch],
+                ).fetchall()
+                for page_link, name, url, size, file_name, fetched_at in rows:
+                    found[page_link] = {'name': name, 'url': url, 'page_link': page_link,
+                                        'size': size, 'file_name': file_name, 'fetched_at': fetched_at}
+            if found:
+                self._db.executemany("UPDATE pages SET accessed_at = ? WHERE page_link = ?",
+                                     [(now, link) for link in found])
+        return found
+
+    def get(self, page_link):
+        return self.get_many([page_link]).get(page_link)
+
+    def put_many(self, files):
+        """Stores discovered files (dicts with 'page_link', 'name', 'url' and optionally 'size' and 'file_name')."""
+        now = time.time()
+        rows = [(f['page_link'], f['name'], f['url'], f.get('size'), f.get('file_name'), f.get('fetched_at', now), now)
+                for f in files]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pages (page_link, name, url, size, file_name, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.evict()
+
+    def put(self, file_info):
+        self.put_many([file_info])
+
+    def set_size(self, page_link, size):
+        """Records the content length of an already cached page."""
+        with self._lock:
+            self._db.execute("UPDATE pages SET size = ? WHERE page_link = ?", (size, page_link))
+
+    def invalidate(self, page_link):
+        """Drops a page, e.g. after its direct URL answered 403/410."""
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE page_link = ?", (page_link,))
+
+    def evict(self):
+        """Purges expired entries, then the least recently used ones above `max_entries`."""
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.ttl,))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM pages WHERE page_link IN "
+                    "(SELECT page_link FROM pages ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
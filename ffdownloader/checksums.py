@@ -0,0 +1,152 @@
+"""
+Checksum manifests and hashing downloads while they are written.
+
+A manifest maps file names to an expected digest. It is read from md5sum/sha1sum style text
+("<hex> *<name>" or "<name> <hex>" per line), which is what FitGirl ships in its MD5 folders and
+what some repack pages list inline. The algorithm follows from the digest length.
+
+StreamHasher hashes bytes as the download loop writes them, so a finished file is verified
+without reading it back. Python's hash objects cannot be saved, so a resumed download hashes
+the bytes already on disk once before continuing.
+"""
+
+import hashlib
+import html
+import os
+import re
+import threading
+
+from ffdownloader.extract import extract_links
+
+DIGEST_ALGORITHMS = {32: 'md5', 40: 'sha1'}  # Hex digest length -> hashlib algorithm
+MANIFEST_SUFFIXES = ('.md5', '.sha1')  # Links on a repack page that point at manifest files
+HASH_READ_SIZE = 1024 * 1024
+
+_DIGEST = r'([0-9a-fA-F]{40}|[0-9a-fA-F]{32})'
+_FILE_NAME = r'\*?([^\s*<>"|?][^\r\n<>"|?]*?\.[A-Za-z0-9]{1,8})'
+DIGEST_FIRST_RE = re.compile(rf'(?<![0-9a-fA-F]){_DIGEST}(?![0-9a-fA-F])[ \t]+{_FILE_NAME}[ \t]*$', re.MULTILINE)
+NAME_FIRST_RE = re.compile(rf'^[ \t]*{_FILE_NAME}[ \t:]+{_DIGEST}(?![0-9a-fA-F])', re.MULTILINE)
+TAG_RE = re.compile(r'<br\s*/?>|</(?:p|div|li|tr|pre)>|<[^>]+>', re.IGNORECASE)
+
+
+def _manifest_key(file_name):
+    """Manifests often hold relative Windows paths ("MD5\\..\\part01.rar"), only the base name matters."""
+    return file_name.replace('\\', '/').rsplit('/', 1)[-1].strip().lower()
+
+
+class Manifest:
+    """File name -> (algorithm, lowercase hex digest), matched case-insensitively on the base name."""
+
+    def __init__(self, entries=None):
+        self.entries = {}
+        for name, (algorithm, digest) in (entries or {}).items():
+            self.add(name, algorithm, digest)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, file_name, algorithm, digest):
+        self.entries[_manifest_key(file_name)] = (algorithm, digest.lower())
+
+    def update(self, other):
+        self.entries.update(other.entries)
+
+    def lookup(self, file_name):
+        """Returns (algorithm, hex digest) for `file_name`, or None if it is not listed."""
+        return self.entries.get(_manifest_key(file_name))
+
+    def to_dict(self):
+        return {name: list(value) for name, value in self.entries.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({name: tuple(value) for name, value in (data or {}).items()})
+
+
+def parse_manifest(text):
+    """Reads every "<digest> <name>" / "<name> <digest>" line of `text` into a Manifest."""
+    manifest = Manifest()
+    for match in DIGEST_FIRST_RE.finditer(text):
+        digest, name = match.groups()
+        manifest.add(name, DIGEST_ALGORITHMS[len(digest)], digest)
+    for match in NAME_FIRST_RE.finditer(text):
+        name, digest = match.groups()
+        if manifest.lookup(name) is None:
+            manifest.add(name, DIGEST_ALGORITHMS[len(digest)], digest)
+    return manifest
+
+
+def load_manifest(path):
+    """Reads a user supplied .md5/.sha1 (or any md5sum style) file."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return parse_manifest(f.read())
+
+
+def page_manifest(page):
+    """
+    The digests listed in the text of a repack page (bytes or str), and the links to the .md5/.sha1
+    files it publishes, which still have to be fetched.
+    """
+    if isinstance(page, bytes):
+        page = page.decode('utf-8', errors='replace')
+    manifest = parse_manifest(html.unescape(TAG_RE.sub('\n', page)))
+    links = [link for link in dict.fromkeys(extract_links(page, "http"))
+             if link.split('?')[0].lower().endswith(MANIFEST_SUFFIXES)]
+    return manifest, links
+
+
+def scrape_manifest(http, page, log):
+    """
+    Collects the checksums published with a repack: digests listed in the page text itself and
+    any linked .md5/.sha1 files. `page` is the raw repack page (bytes or str).
+    """
+    manifest, links = page_manifest(page)
+    for link in links:
+        try:
+            response = http.get(link)
+            response.raise_for_status()
+            manifest.update(parse_manifest(response.text))
+        except Exception as e:
+            log("Could not fetch checksum file", f"{link}: {e}", "warning")
+
+    if manifest:
+        log(f"Found checksums for {len(manifest)} files", "", "info")
+    return manifest
+
+
+class StreamHasher:
+    """
+    Incremental digest of a file that is written front to back, or in pieces.
+    update() takes the next bytes in file order; advance_to() hashes bytes already on disk
+    (a resumed prefix, or pieces that finished out of order) up to an offset. Thread-safe.
+    """
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.position = 0
+        self._hash = hashlib.new(algorithm)
+        self._lock = threading.Lock()
+
+    def update(self, data):
+        with self._lock:
+            self._hash.update(data)
+            self.position += len(data)
+
+    def advance_to(self, path, offset):
+        """Hashes bytes [position, offset) of `path`, reading them back from disk."""
+        with self._lock:
+            if offset <= self.position:
+                return
+            with open(path, 'rb') as f:
+                f.seek(self.position)
+                buffer = memoryview(bytearray(HASH_READ_SIZE))
+                while self.position < offset:
+                    n = f.readinto(buffer[:min(HASH_READ_SIZE, offset - self.position)])
+                    if not n:
+                        raise IOError(f"{os.path.basename(path)} ends at {self.position}, expected {offset} bytes")
+                    self._hash.update(buffer[:n])
+                    self.position += n
+
+    def hexdigest(self):
+        with self._lock:
+            return self._hash.hexdigest()
@@ -0,0 +1,348 @@
+"""
+Headless command line front end for DownloadPipeline.
+
+    python -m ffdownloader https://fitgirl-repacks.site/some-game/ -o /data/games --exclude "*optional*"
+
+Every pipeline event is printed to stdout as one JSON object per line, e.g.
+
+    {"time": 1718000000.0, "url": "...", "event": "progress", "slot": 0, "current": 1048576, ...}
+
+Per-slot "progress" events are thinned out to one per PROGRESS_INTERVAL seconds.
+Bandwidth limits given with --limit-file are re-read whenever the file changes, so they can be
+adjusted while a download runs. --metrics-port serves the metrics of every run in the Prometheus
+text format on http://127.0.0.1:PORT/metrics while the command runs. --engine async runs the
+network stages on an asyncio loop instead of threads (see ffdownloader.aio, needs aiohttp).
+--profile, --profile-cpu and --profile-memory save a profile of every run into the download
+folder (see ffdownloader.profiling).
+The exit code is 0 when every selected file downloaded, 1 if any failed and 2 on bad arguments.
+
+Repacks can also go through the persistent job queue (see ffdownloader.jobs):
+
+    python -m ffdownloader --enqueue URL1 URL2 -o /data/games    # each into /data/games/<repack>
+    python -m ffdownloader --run-queue --workers 4 --limit 5M     # works through it, resumable
+    python -m ffdownloader --show-queue
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from ffdownloader.discovery import DISCOVERY_PER_HOST, DISCOVERY_WORKERS
+from ffdownloader.jobs import JOB_PARALLEL, JobQueue, JobRunner, default_queue_path, job_folder_name
+from ffdownloader.metrics import Metrics, MetricsServer
+from ffdownloader.profiling import RunProfiler
+from ffdownloader.ratelimit import BandwidthLimiter, RateSchedule, parse_limits, parse_rate
+from ffdownloader.scheduler import (
+    DOWNLOAD_ORDER, DOWNLOAD_PER_HOST, DOWNLOAD_RETRIES, DOWNLOAD_WORKERS, DownloadScheduler, SlotPool,
+)
+from ffdownloader.selection import SelectionRule
+
+PROGRESS_INTERVAL = 1.0  # Min seconds between printed progress events per slot
+LIMIT_FILE_POLL_INTERVAL = 2.0  # Seconds between checks of --limit-file for changes
+ENGINES = ("threads", "async")
+
+
+def _rate(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _window(text):
+    try:
+        RateSchedule.parse([text])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m ffdownloader",
+        description="Download FitGirl repacks from fuckingfast.co links without the GUI.",
+    )
+    parser.add_argument("urls", nargs="*", metavar="URL", help="Repack page URL(s) to process")
+    parser.add_argument("-f", "--url-file", help="File with one repack URL per line (# starts a comment)")
+    parser.add_argument("-o", "--output", default=".", help="Download folder (default: current directory)")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="Only download files whose name matches GLOB (repeatable, default: all)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip files whose name matches GLOB (repeatable)")
+    parser.add_argument("--skip-optional", action="store_true",
+                        help="Skip FitGirl's optional parts (fg-optional-*)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Start downloading each file as soon as it is discovered instead of after discovery "
+                             "(--order then only applies among files waiting for a worker)")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help="Files downloaded at once")
+    parser.add_argument("--per-host", type=int, default=DOWNLOAD_PER_HOST, help="Files downloaded at once per host")
+    parser.add_argument("--order", choices=DownloadScheduler.ORDERS, default=DOWNLOAD_ORDER,
+                        help="Order in which files are started (default: largest first, needs the probed sizes)")
+    parser.add_argument("--discovery-workers", type=int, default=DISCOVERY_WORKERS,
+                        help="File pages resolved at once")
+    parser.add_argument("--discovery-per-host", type=int, default=DISCOVERY_PER_HOST,
+                        help="File pages resolved at once per host")
+    parser.add_argument("--checksums", metavar="FILE",
+                        help="md5sum/sha1sum style file to verify downloads against (in addition to the page's)")
+    parser.add_argument("--retries", type=int, default=DOWNLOAD_RETRIES,
+                        help="Times a file that fails its checksum is downloaded again")
+    parser.add_argument("--preallocate", action="store_true",
+                        help="Reserve each file's full size on disk before downloading it")
+    parser.add_argument("--limit", type=_rate, metavar="RATE",
+                        help="Cap the total download rate, e.g. 500K or 2M (bytes per second, default: unlimited)")
+    parser.add_argument("--limit-per-file", type=_rate, metavar="RATE", help="Cap the download rate of each file")
+    parser.add_argument("--limit-schedule", action="append", default=[], type=_window, metavar="HH:MM-HH:MM=RATE",
+                        help="Total rate during a time-of-day window instead of --limit (repeatable), "
+                             "e.g. 09:00-18:00=2M")
+    parser.add_argument("--limit-file", metavar="FILE",
+                        help="Read the limits from FILE (e.g. \"0 per-file=1M 09:00-18:00=2M\") and again "
+                             "whenever it changes, overriding the other --limit options")
+    parser.add_argument("--engine", choices=ENGINES, default="threads",
+                        help="Network engine: a thread per request, or one asyncio loop (needs aiohttp)")
+    parser.add_argument("--no-mirrors", dest="mirrors", action="store_false",
+                        help="Only download from the preferred file hoster, without speed probes or switching to "
+                             "the other hosters' mirrors")
+    parser.add_argument("--list", action="store_true", help="Only discover and print the files, download nothing")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time every phase of each run (wall and CPU time) into a .profile_<hash> folder "
+                             "in the download folder")
+    parser.add_argument("--profile-cpu", action="store_true",
+                        help="Profile with cProfile and stack samples as well (pstats and collapsed stacks for "
+                             "flame graphs), implies --profile")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Trace memory allocations with tracemalloc as well, implies --profile")
+
+    queue = parser.add_argument_group("job queue")
+    queue.add_argument("--queue", default=default_queue_path(), metavar="FILE",
+                       help="Job queue file (default: ~/.ffdownloader/queue.json)")
+    queue.add_argument("--enqueue", action="store_true",
+                       help="Add the URLs to the queue, each downloading into a subfolder of -o, and exit")
+    queue.add_argument("--run-queue", action="store_true",
+                       help="Download the queued jobs in order; --workers and the limits are shared by all of them")
+    queue.add_argument("--queue-parallel", type=int, default=JOB_PARALLEL, metavar="N",
+                       help="Jobs of the queue running at once")
+    queue.add_argument("--show-queue", action="store_true", help="Print the queued jobs and exit")
+    queue.add_argument("--pause-job", type=int, metavar="ID", help="Keep a queued job from running")
+    queue.add_argument("--resume-job", type=int, metavar="ID", help="Queue a paused or failed job again")
+    queue.add_argument("--remove-job", type=int, metavar="ID", help="Remove a job from the queue")
+    queue.add_argument("--move-job", type=int, nargs=2, metavar=("ID", "OFFSET"),
+                       help="Move a job OFFSET places back in the queue (negative: forward)")
+    return parser
+
+
+class LimitFileWatcher:
+    """Re-applies the limits in `path` to `limiter` every time the file changes."""
+
+    def __init__(self, path, limiter, log):
+        self.path = path
+        self.limiter = limiter
+        self.log = log
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="limit-file", daemon=True)
+
+    def start(self):
+        self.check()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.limiter.set_limits(**parse_limits(f.read()))
+            self.log("Bandwidth limit changed", self.limiter.describe(), "info")
+        except (OSError, ValueError) as e:
+            self.log("Could not read limit file", f"{self.path}: {e}", "warning")
+
+    def _watch(self):
+        while not self._stop.wait(LIMIT_FILE_POLL_INTERVAL):
+            self.check()
+
+
+def read_url_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class JsonLinesPrinter:
+    """Pipeline event callback that writes one JSON object per event to `stream`."""
+
+    def __init__(self, url, stream=None):
+        self.url = url
+        self.stream = stream or sys.stdout
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._last_progress = {}
+
+    def __call__(self, kind, data):
+        if kind == "error":
+            self.errors += 1
+        if kind == "progress":
+            now = time.monotonic()
+            done = data['total'] and data['current'] >= data['total']
+            if not done and now - self._last_progress.get(data['slot'], 0) < PROGRESS_INTERVAL:
+                return
+            self._last_progress[data['slot']] = now
+        if kind == "files":
+            data = {'files': [{'name': f['name'], 'url': f['url'], 'page_link': f['page_link'],
+                               'size': f.get('size')} for f in data['files']]}
+        self.write(kind, data)
+
+    def write(self, kind, data):
+        line = json.dumps({'time': round(time.time(), 3), 'url': self.url, 'event': kind, **data},
+                          default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def print_log(message, obj, tag="info"):
+    """Prints a log line that belongs to no URL in particular."""
+    JsonLinesPrinter(None).write("log", {'message': message, 'obj': obj, 'tag': tag})
+
+
+def make_pipeline(args, url, folder, printer, limiter, slot_pool=None, metrics=None):
+    """A DownloadPipeline for `url` configured from `args`, and the keyword arguments for its run()."""
+    # With requests (and aiohttp), only once there is something to download
+    if args.engine == "async":
+        from ffdownloader.aio import AsyncDownloadPipeline as pipeline_class
+    else:
+        from ffdownloader.core import DownloadPipeline as pipeline_class
+
+    pipeline = pipeline_class(
+        folder, on_event=printer,
+        max_workers=args.workers, per_host=args.per_host, order=args.order,
+        discovery_workers=args.discovery_workers, discovery_per_host=args.discovery_per_host,
+        preallocate=args.preallocate, manifest_path=args.checksums, retries=args.retries, limiter=limiter,
+        slot_pool=slot_pool, metrics=metrics, mirrors=args.mirrors,
+        profiler=(RunProfiler(cpu=args.profile_cpu, memory=args.profile_memory)
+                  if args.profile or args.profile_cpu or args.profile_memory else None),
+    )
+    rule = SelectionRule(args.include, args.exclude, skip_optional=args.skip_optional)
+
+    def select(files):
+        if args.list:
+            return []
+        chosen = rule.select(files)
+        printer.write("selected", {'count': len(chosen), 'bytes': sum(f.get('size') or 0 for f in chosen),
+                                   'files': [f['name'] for f in chosen]})
+        return chosen
+
+    if args.pipeline and not args.list:
+        return pipeline, {'rule': rule}
+    return pipeline, {'select': select}
+
+
+def edit_queue(args, urls):
+    """Handles the queue options that only change or print the queue. Returns the exit code."""
+    job_queue = JobQueue.load(args.queue)
+    for url in urls if args.enqueue else ():
+        job = job_queue.add(url, os.path.join(os.path.abspath(args.output), job_folder_name(url)))
+        print(json.dumps({'event': "queued", **job}))
+    if args.pause_job is not None:
+        job_queue.set_status(args.pause_job, "paused")
+    if args.resume_job is not None:
+        job_queue.set_status(args.resume_job, "queued")
+    if args.remove_job is not None:
+        job_queue.remove(args.remove_job)
+    if args.move_job:
+        job_queue.move(*args.move_job)
+    if args.show_queue:
+        for job in job_queue.snapshot():
+            print(json.dumps({'event': "job", **job}))
+    return 0
+
+
+def run_queue(args, limiter, metrics):
+    """Downloads every queued job, sharing one worker budget and the bandwidth limiter. Returns the exit code."""
+    job_queue = JobQueue.load(args.queue)
+    slot_pool = SlotPool(args.workers)
+    printers = []
+
+    def make_job_pipeline(job):
+        printer = JsonLinesPrinter(job['url'])
+        printers.append(printer)
+        return make_pipeline(args, job['url'], job['folder'], printer, limiter, slot_pool, metrics)
+
+    runner = JobRunner(job_queue, make_job_pipeline, parallel=args.queue_parallel, log=print_log)
+    runner.start()
+    try:
+        runner.wait()
+    except KeyboardInterrupt:
+        runner.stop()  # Running jobs go back to "queued" and resume from their sessions next time
+        runner.wait()
+        return 1
+    failed = [job for job in job_queue.snapshot() if job['status'] == "failed"]
+    return 1 if failed or any(printer.errors for printer in printers) else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.url_file:
+        try:
+            urls += read_url_file(args.url_file)
+        except OSError as e:
+            parser.error(f"cannot read URL file: {e}")
+
+    if args.enqueue and not urls:
+        parser.error("give the URLs to --enqueue")
+    if (args.enqueue or args.show_queue or args.pause_job is not None or args.resume_job is not None
+            or args.remove_job is not None or args.move_job):
+        try:
+            return edit_queue(args, urls)
+        except (KeyError, ValueError, OSError) as e:
+            parser.error(str(e))
+    if not urls and not args.run_queue:
+        parser.error("give at least one URL or --url-file")
+    if args.engine == "async":
+        from ffdownloader.aio import engine_available
+
+        if not engine_available():
+            parser.error("--engine async needs aiohttp (pip install aiohttp)")
+
+    os.makedirs(args.output, exist_ok=True)
+    limiter = BandwidthLimiter(args.limit, args.limit_per_file, RateSchedule.parse(args.limit_schedule))
+    metrics = Metrics()
+    metrics_server = None
+    if args.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(metrics, args.metrics_port).start()
+        except OSError as e:
+            parser.error(f"cannot serve metrics on port {args.metrics_port}: {e}")
+        print_log("Serving metrics", metrics_server.url)
+    watcher = None
+    if args.limit_file:
+        watcher = LimitFileWatcher(args.limit_file, limiter, print_log).start()
+
+    try:
+        if args.run_queue:
+            return run_queue(args, limiter, metrics)
+
+        failed = 0
+        for url in urls:
+            printer = JsonLinesPrinter(url)
+            pipeline, run_kwargs = make_pipeline(args, url, args.output, printer, limiter, metrics=metrics)
+            summary = pipeline.run(url, **run_kwargs)
+            printer.write("summary", summary)
+            failed += summary['failed'] + printer.errors
+        return 1 if failed else 0
+    finally:
+        if watcher:
+            watcher.stop()
+        if metrics_server:
+            metrics_server.stop()
@@ -0,0 +1,877 @@
+"""
+The scrape -> discover -> select -> download pipeline, independent of any user interface.
+
+A front end creates a DownloadPipeline with an `on_event(kind, data)` callback and calls
+run(scrape_url, select). Events are plain dicts so they can be shown in Tk or printed as JSON:
+
+    log           {message, obj, tag}            a log line (tag: info/success/warning/error/done)
+    phase         {phase}                        scrape, discover, select, download, finished
+    files         {files}                        every discovered file, before selection
+    workers       {count}                        number of download slots about to be used
+    progress      {slot, current, total, file}   bytes of the file running on `slot`
+    file_finished {slot, file, page_link, success}   success is None if the download was stopped
+    throughput    {completed, failed, total, rate, bytes}
+    error         {message}                      unexpected failure, the run stops
+
+Discovery also probes every direct URL for its size ('size', None if unknown), which drives the
+"largest" download order and the free disk space check: a run whose files do not fit refuses to
+start with an "error" event. Direct URLs are signed and expire, so a file page is resolved again
+right before its download starts if its URL is older than DIRECT_URL_MAX_AGE, and whenever the
+server rejects the URL mid-run (403/410). A ratelimit.BandwidthLimiter passed as `limiter` caps
+the bandwidth of all downloads; the front end may change its limits while the run goes on.
+A scheduler.SlotPool passed as `slot_pool` shares one download worker budget between pipelines
+running at the same time, and stop() pauses a run, keeping its session for the next one.
+
+Repack pages link every part on several file hosters. The links are grouped per part (see
+ffdownloader.hosts): the part is known by its link on the most preferred hoster, the others are
+its mirrors, kept in the session. Hosters not measured lately are probed with a small Range
+request when a run starts, and every file is downloaded from the fastest hoster of its part, by
+the speeds remembered from this and earlier runs. When that download fails or stalls, the next
+mirror takes over and continues from the bytes on disk. mirrors=False keeps to the preferred
+hoster only.
+
+Before each download the folder's FolderIndex (see ffdownloader.folderindex) is consulted: a
+file already on disk with the size the server announced (and the published checksum, if any)
+is not downloaded again, and a shorter one the session knows nothing about is continued.
+
+Every run records metrics (see ffdownloader.metrics) and writes them, with the summary and the
+time spent in each phase, as a JSON report next to the session state when it ends. A shared
+metrics.Metrics passed as `metrics` receives everything as well, e.g. to serve it on /metrics.
+A profiling.RunProfiler passed as `profiler` times every phase (optionally with cProfile, stack
+samples and tracemalloc) and its bundle is saved next to the report.
+
+select(files) is called once with the discovered files and returns the ones to download
+(an empty list cancels). It is called on the pipeline's thread and may block.
+Alternatively run(scrape_url, rule=SelectionRule(...)) pipelines the two stages: files the rule
+picks start downloading as soon as they are discovered, and "files" is emitted at the end.
+Files that no longer fit on the disk are then skipped instead.
+"""
+
+import functools
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from ffdownloader.cache import DiscoveryCache
+from ffdownloader.checksums import Manifest, load_manifest, scrape_manifest
+from ffdownloader.discovery import (
+    DIRECT_URL_MAX_AGE, DISCOVERY_CACHE_MAX_ENTRIES, DISCOVERY_CACHE_TTL, DISCOVERY_PER_HOST, DISCOVERY_WORKERS,
+    discover_file_page, discover_files,
+)
+from ffdownloader.download import INCOMPLETE, PART_SUFFIX, download_file
+from ffdownloader.extract import extract_links
+from ffdownloader.folderindex import FolderIndex
+from ffdownloader.hosts import (
+    RESOLVERS, HostRanking, TransferWatch, group_links, host_name, probe_speed, resolver_for,
+)
+from ffdownloader.metrics import Metrics, write_report
+from ffdownloader.net import HttpClient
+from ffdownloader.scheduler import (
+    DOWNLOAD_ORDER, DOWNLOAD_PER_HOST, DOWNLOAD_RETRIES, DOWNLOAD_WORKERS, DownloadScheduler,
+)
+from ffdownloader.segmented import SEGMENT_MAX_CONNECTIONS
+from ffdownloader.session import SessionStore, profile_dir_path, run_report_path, state_file_path
+
+THROUGHPUT_EVENT_INTERVAL = 0.5  # Min seconds between "throughput" events while bytes flow
+PIPELINE_QUEUE_SIZE = 16  # Discovered files waiting for a download worker in pipelined mode
+FREE_SPACE_MARGIN = 256 * 1024 * 1024  # Bytes left free on the target disk on top of the downloads
+
+DEFAULT_HEADERS = {
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'accept-language': 'en-US,en;q=0.5',
+    'referer': 'https://fitgirl-repacks.site/',
+    'sec-ch-ua': '"Brave";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+}
+
+
+# --- Scraping ---
+
+def scrape_links(http, target_url, log, on_page=None, resolvers=None, on_error=None):
+    """
+    Scrapes a webpage for file hoster links, see links_from_page().
+    on_page(content) receives the raw page, for anything else the caller wants from it, and
+    on_error(message) is called if the page cannot be fetched.
+    """
+    log("Scraping URL for links", target_url, "info")
+    try:
+        response = http.get(target_url)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        log("Failed to retrieve webpage for scraping", str(e), "error")
+        if on_error:
+            on_error(f"Failed to retrieve {target_url}: {e}")
+        return [], {}
+
+    if on_page:
+        on_page(response.content)
+    return links_from_page(response.content, log, http.metrics, resolvers)
+
+
+def _saved_name(file_info):
+    """The name `file_info` is saved under in the download folder: the one its server sends, else its page title."""
+    return file_info.get('file_name') or file_info['name']
+
+
+def links_from_page(page, log, metrics=None, resolvers=None):
+    """
+    The file hoster links of a fetched repack page, by `resolvers` (default: hosts.RESOLVERS):
+    (one link per part, in page order and without duplicates, {part link: [its mirror links]}).
+    """
+    resolvers = RESOLVERS if resolvers is None else resolvers
+    started = time.perf_counter()
+    found_links = [link for link in extract_links(page, "http") if resolver_for(link, resolvers)]
+    if metrics:
+        metrics.observe('parse_seconds', time.perf_counter() - started, page="repack")
+
+    if not found_links:
+        log("No file hoster links found on the page", ", ".join(resolver.name for resolver in resolvers), "warning")
+        return [], {}
+
+    # Unique links, to prevent duplicates in state file
+    unique_links = list(dict.fromkeys(found_links))
+    if len(unique_links) < len(found_links):
+        log(f"Removed {len(found_links) - len(unique_links)} duplicate links.", "", "info")
+
+    links, mirrors = group_links(unique_links, resolvers)
+    mirror_count = sum(len(found) for found in mirrors.values())
+    log(f"Found {len(links)} matching links", f"and {mirror_count} mirror links" if mirror_count else "", "success")
+    return links, mirrors
+
+
+# --- Pipeline ---
+
+class DownloadPipeline:
+    """Runs one repack URL through scrape, discovery, selection and download, reporting through events."""
+
+    def __init__(self, download_folder, on_event=None, headers=None,
+                 max_workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_PER_HOST, order=DOWNLOAD_ORDER,
+                 discovery_workers=DISCOVERY_WORKERS, discovery_per_host=DISCOVERY_PER_HOST, preallocate=False,
+                 manifest_path=None, retries=DOWNLOAD_RETRIES, limiter=None, slot_pool=None, metrics=None,
+                 mirrors=True, resolvers=None, ranking=None, profiler=None):
+        self.download_folder = download_folder
+        self.on_event = on_event or (lambda kind, data: None)
+        self.headers = headers if headers is not None else DEFAULT_HEADERS
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.order = order
+        self.discovery_workers = max(1, discovery_workers)
+        self.discovery_per_host = max(1, discovery_per_host)
+        self.preallocate = preallocate  # Reserve the full size of single-stream downloads up front
+        self.manifest_path = manifest_path  # User supplied .md5/.sha1 file, takes precedence over the page
+        self.retries = retries  # Extra attempts for files that fail their checksum
+        self.limiter = limiter  # ratelimit.BandwidthLimiter shared by every download, may change while running
+        self.slot_pool = slot_pool  # scheduler.SlotPool shared with other pipelines, or None
+        self.metrics = metrics  # metrics.Metrics every run also records into, or None
+        self.use_mirrors = mirrors  # Download from the fastest hoster of each part, failing over to the others
+        self.resolvers = RESOLVERS if resolvers is None else resolvers  # hosts.HostResolver per known hoster
+        self.ranking = ranking  # hosts.HostRanking, loaded from ~/.ffdownloader/hosts.json when first needed
+        self.profiler = profiler  # profiling.RunProfiler for the next run, or None
+        self.http = None
+        self._phases = []  # (phase, monotonic start time) of the current run
+        self._stop = threading.Event()
+        self._scheduler = None
+        self._folder_index = None  # FolderIndex of the download folder during a run
+        self._mirrors = {}  # page link -> its mirror links, during a run
+
+    def stop(self):
+        """Stops the run from any thread: no new page fetches or downloads start and running downloads are paused."""
+        self._stop.set()
+        if self._scheduler:
+            self._scheduler.stop()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def emit(self, kind, **data):
+        if kind == "phase":
+            self._phases.append((data['phase'], time.monotonic()))
+            if self.profiler:
+                self.profiler.phase(data['phase'])
+        self.on_event(kind, data)
+
+    def log(self, message, obj, tag="info"):
+        """Same signature as the old DownloaderApp.log_to_gui, so every helper can log through it."""
+        self.emit("log", message=message, obj=obj, tag=tag)
+
+    def run(self, scrape_url, select=None, rule=None):
+        """
+        Processes `scrape_url` and returns a summary dict
+        {discovered, selected, completed, failed, verified, retried, url_refreshes, already_complete,
+        mirror_switches, remaining} ('completed' includes the 'already_complete' files found on disk).
+        Files are chosen either by select(files) once discovery is complete, or, when a
+        SelectionRule `rule` is given instead, pipelined: every file the rule picks is queued for
+        download the moment discovery resolves it.
+        """
+        summary = {'discovered': 0, 'selected': 0, 'completed': 0, 'failed': 0, 'verified': 0, 'retried': 0,
+                   'url_refreshes': 0, 'already_complete': 0, 'mirror_switches': 0, 'remaining': 0}
+        download_folder = self.download_folder
+        state_file = state_file_path(download_folder, scrape_url)
+        links_to_discover = []
+        cache = None
+        session = None
+        manifest = Manifest()
+
+        if self.profiler:
+            self.profiler.start()
+        self.http = self._open_http(Metrics(parent=self.metrics))
+        self._phases = []
+        started = time.time()
+
+        try:
+            # --- PHASE 1: DISCOVERY (with Resume Logic) ---
+            self.emit("phase", phase="scrape")
+            if SessionStore.exists(state_file):
+                try:
+                    session = SessionStore.open(state_file)
+                    links_to_discover = session.pending_links
+                    if links_to_discover:
+                        self.log(f"Resuming previous session. Found {len(links_to_discover)} remaining links.",
+                                 os.path.basename(state_file), "info")
+                    else:
+                        self.log("State file was empty. Starting fresh scrape.", os.path.basename(state_file),
+                                 "warning")
+                        # Force re-scrape by falling through
+                except Exception as e:
+                    self.log(f"Error reading state file '{os.path.basename(state_file)}'. Starting fresh scrape.",
+                             str(e), "error")
+                    links_to_discover = []  # Ensure list is empty to trigger scrape
+                    session = None
+
+            if not links_to_discover:
+                self.log("No previous session found. Starting fresh scrape...", scrape_url, "info")
+
+                mirrors = {}
+                links_to_discover = self._scrape(scrape_url, manifest, mirrors)
+                if links_to_discover:
+                    self.log(f"Scrape complete. Found {len(links_to_discover)} links.", "Saving state...", "info")
+                    if session is None:
+                        session = SessionStore(state_file)
+                        session.remove()  # Drop whatever is left of an unreadable session
+                    session.discovered(links_to_discover)
+                    session.add_checksums(manifest.to_dict())
+                    session.add_mirrors(mirrors)
+                else:
+                    self.log("No matching links found to process.", "", "warning")
+                    return summary  # Stop if scraping found nothing
+
+            manifest = Manifest.from_dict(session.checksums)
+            if self.manifest_path:
+                try:
+                    user_manifest = load_manifest(self.manifest_path)
+                    self.log(f"Loaded checksums for {len(user_manifest)} files", self.manifest_path, "info")
+                    manifest.update(user_manifest)
+                    session.add_checksums(user_manifest.to_dict())
+                except OSError as e:
+                    self.log("Could not read checksum file", f"{self.manifest_path}: {e}", "error")
+
+            self.emit("phase", phase="discover")
+            self._mirrors = session.mirrors if self.use_mirrors else {}
+            if self._mirrors:
+                self._rank_hosters(session)
+            self.log(f"Discovering file details for {len(links_to_discover)} links...", "", "info")
+
+            # Pages resolved by an earlier run come from the discovery cache
+            try:
+                cache = DiscoveryCache.for_folder(download_folder, ttl=DISCOVERY_CACHE_TTL,
+                                                  max_entries=DISCOVERY_CACHE_MAX_ENTRIES)
+            except Exception as e:
+                cache = None
+                self.log("Discovery cache unavailable, resolving every page.", str(e), "warning")
+            self._folder_index = self._open_folder_index(download_folder)
+
+            scheduler = self._scheduler = self._create_scheduler(session, state_file, manifest, cache, summary)
+            if self._stop.is_set():
+                scheduler.stop()
+            if rule is not None:
+                discovered_files = self._discover_and_download(links_to_discover, session, cache, rule, scheduler,
+                                                               summary)
+            else:
+                discovered_files = self._discover_then_download(links_to_discover, session, cache, select,
+                                                                scheduler, summary)
+            if discovered_files is None:
+                summary['remaining'] = len(session.pending_links)
+                return summary  # Cancelled, stopped or not enough disk space, the session is kept as it is
+
+            if not discovered_files:
+                self.log("Discovery finished, but no valid files were found.", "", "error")
+                # Clean up state file if discovery fails for all links
+                session.remove()
+                self.log("Removed state file due to discovery failure.", "", "warning")
+                return summary
+
+            summary['completed'] = scheduler.completed
+            summary['failed'] = scheduler.failed
+            summary['retried'] = scheduler.retried
+
+            if summary['url_refreshes']:
+                self.log(f"Resolved {summary['url_refreshes']} expired download links again.", "", "info")
+            if summary['mirror_switches']:
+                self.log(f"Switched to another mirror {summary['mirror_switches']} times.", "", "info")
+            self.log("Processing complete for selected files.", "", "done")
+
+            # Final cleanup
+            links_to_discover = session.pending_links
+            summary['remaining'] = len(links_to_discover)
+            if not links_to_discover:
+                self.log("All links in session processed.", "Removing session file.", "done")
+                try:
+                    session.remove()
+                except Exception as e:
+                    self.log("Could not remove session file.", str(e), "warning")
+            else:
+                self.log(f"{len(links_to_discover)} links remain in session file for next time.",
+                         os.path.basename(state_file), "info")
+            return summary
+
+        except Exception as e:
+            self.log("An unexpected error occurred in the worker thread", str(e), "error")
+            self.emit("error", message=str(e))
+            return summary
+
+        finally:
+            if session is not None:
+                try:
+                    session.close()
+                except OSError as e:
+                    self.log("Failed to save state file!", f"{os.path.basename(state_file)}: {e}", "error")
+            if cache:
+                cache.close()
+            if self._folder_index:
+                self._folder_index.close()
+                self._folder_index = None
+            if self._mirrors and self.ranking:
+                self.ranking.save()
+                self._mirrors = {}
+            self.http.log_stats(self.log)
+            self._write_report(scrape_url, started, summary)
+            self._close_http()
+            if self.profiler:
+                self._write_profile(scrape_url)
+            self.emit("phase", phase="finished")
+
+    # --- Network stages, overridden by the asyncio engine (see ffdownloader.aio) ---
+
+    def _open_http(self, metrics):
+        """One pooled session for the whole run, sized so every download connection can stay open."""
+        return HttpClient(self.headers, pool_size=max(self.discovery_per_host, self.per_host * SEGMENT_MAX_CONNECTIONS),
+                          metrics=metrics)
+
+    def _close_http(self):
+        self.http.close()
+
+    def _scrape(self, scrape_url, manifest, mirrors):
+        """
+        The file page links of the repack page, adding the checksums it publishes to `manifest`
+        and the other hosters' links of every part to `mirrors`.
+        """
+
+        def read_checksums(page):
+            manifest.update(scrape_manifest(self.http, page, self.log))
+
+        links, found_mirrors = scrape_links(self.http, scrape_url, self.log, on_page=read_checksums,
+                                            resolvers=self.resolvers,
+                                            on_error=lambda message: self.emit("error", message=message))
+        mirrors.update(found_mirrors)
+        return links
+
+    def _discover(self, links, cache, on_file=None):
+        return discover_files(links, self.http, self.log, max_workers=self.discovery_workers,
+                              per_host=self.discovery_per_host, cache=cache, on_file=on_file, probe=True,
+                              resolvers=self.resolvers, mirrors=self._mirrors, ranking=self.ranking,
+                              stop=self._stop)
+
+    def _probe_hosters(self, links):
+        """Resolves one file on every hoster of `links` ({hoster name: link}) at once and times a small part of it."""
+
+        def probe(name, link):
+            try:
+                record = discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except requests.exceptions.RequestException as e:
+                self.log("Could not resolve the mirror link", f"{link}: {e}", "warning")
+                record = None
+            self._record_probe(name, probe_speed(self.http, record['url']) if record else None)
+
+        with ThreadPoolExecutor(len(links), thread_name_prefix="probe") as pool:
+            for future in [pool.submit(probe, name, link) for name, link in links.items()]:
+                future.result()
+
+    def _run_downloads(self, scheduler, files):
+        scheduler.run(files)
+
+    def _write_report(self, scrape_url, started, summary):
+        """Saves the run's summary, phase durations, per-host stats and metrics next to the session state."""
+        self.http.metrics.set('download_rate_bytes_per_second', 0)
+        now = time.monotonic()
+        phases = {}
+        for (phase, phase_started), (_, phase_ended) in zip(self._phases, self._phases[1:] + [(None, now)]):
+            phases[phase] = round(phases.get(phase, 0) + phase_ended - phase_started, 3)
+        report = {
+            'url': scrape_url,
+            'folder': self.download_folder,
+            'started': round(started, 3),
+            'seconds': round(time.time() - started, 3),
+            'phases': phases,
+            'summary': summary,
+            'hosts': self.http.stats.snapshot(),
+            'metrics': self.http.metrics.report(),
+        }
+        path = run_report_path(self.download_folder, scrape_url)
+        try:
+            write_report(path, report)
+        except OSError as e:
+            self.log("Could not write the run report", f"{os.path.basename(path)}: {e}", "warning")
+            return
+        self.log("Run report saved", os.path.basename(path), "info")
+
+    def _write_profile(self, scrape_url):
+        """Stops the profiler and saves its bundle next to the run report."""
+        self.profiler.stop()
+        path = profile_dir_path(self.download_folder, scrape_url)
+        try:
+            self.profiler.write(path)
+        except OSError as e:
+            self.log("Could not write the profile", f"{os.path.basename(path)}: {e}", "warning")
+            return
+        self.log("Profile saved", path, "info")
+
+    def _open_folder_index(self, download_folder):
+        """The download folder's FolderIndex, brought up to date, or None if it cannot be opened."""
+        try:
+            folder_index = FolderIndex.for_folder(download_folder)
+            started = time.perf_counter()
+            files, changed = folder_index.refresh()
+        except Exception as e:
+            self.log("Folder index unavailable, files on disk are not checked.", str(e), "warning")
+            return None
+        if files:
+            self.log(f"Indexed {files} files in the download folder ({changed} new or changed).",
+                     f"{(time.perf_counter() - started) * 1000:.0f}ms", "info")
+        return folder_index
+
+    def _rank_hosters(self, session):
+        """
+        Loads the hoster ranking and probes the hosters of this repack it has no recent speed for,
+        on the pending part with the most mirrors.
+        """
+        if self.ranking is None:
+            self.ranking = HostRanking.load()
+        parts = [link for link in session.pending_links if link in self._mirrors] or list(self._mirrors)
+        part = max(parts, key=lambda link: len(self._mirrors[link]))
+        hosters = {}
+        for link in [part] + self._mirrors[part]:
+            hosters.setdefault(host_name(link, self.resolvers), link)
+        stale = {name: link for name, link in hosters.items() if not self.ranking.fresh(name)}
+        if stale:
+            self.log(f"Measuring the speed of {len(stale)} file hosters...", ", ".join(stale), "info")
+            self._probe_hosters(stale)
+        self.log("File hosters by speed", self.ranking.describe(hosters), "info")
+
+    def _record_probe(self, name, rate):
+        """Adds the probed speed of hoster `name` (None if the probe failed) to the ranking."""
+        if rate is None:
+            self.ranking.failure(name)
+        else:
+            self.ranking.record(name, rate)
+
+    def _sources(self, file_info):
+        """The links to download `file_info` from: its page link and its mirrors, fastest hoster first."""
+        links = [file_info['page_link']] + self._mirrors.get(file_info['page_link'], [])
+        return self.ranking.ranked(links, self.resolvers) if len(links) > 1 else links
+
+    def _partial_for(self, session, page_link, url, save_partial):
+        """
+        The resume record of `page_link` for a download from `url`. The validators (ETag,
+        Last-Modified) another host sent say nothing about this host's copy, so they are dropped:
+        the download continues if the size matches, and a known checksum still covers the result.
+        """
+        partial = session.get_partial(page_link)
+        if (partial and (partial.get('etag') or partial.get('last_modified'))
+                and urlsplit(partial.get('url') or url).netloc != urlsplit(url).netloc):
+            partial = dict(partial, url=url, etag=None, last_modified=None)
+            save_partial(page_link, partial)
+        return partial
+
+    def _attempt_finished(self, file_info, sources, number, watch, result, summary):
+        """
+        Ranks the hoster of download attempt `number` (from sources[number]) by its outcome.
+        Returns True if the next source should be tried.
+        """
+        if result == DownloadScheduler.STOPPED:
+            return False
+        name = host_name(sources[number], self.resolvers)
+        if self.ranking and result is True:
+            if watch.rate():
+                self.ranking.record(name, watch.rate())
+        elif self.ranking:
+            self.ranking.failure(name)
+        if result is not False or number + 1 >= len(sources):
+            return False
+        summary['mirror_switches'] += 1
+        self.http.metrics.inc('download_retries_total', reason="mirror")
+        self.log(f"Download from {name} {'stalled' if watch.stalled else 'failed'}, "
+                 f"switching to {host_name(sources[number + 1], self.resolvers)}", file_info['name'], "warning")
+        return True
+
+    def _bytes_needed(self, file_info, session):
+        """Bytes `file_info` still adds to the disk: its size minus its .part file, or None if unknown."""
+        size = file_info.get('size')
+        if size is None:
+            return None
+        existing = self._folder_index.get(_saved_name(file_info)) if self._folder_index else None
+        if existing and existing['size'] == size:
+            return 0  # Most likely complete already (the checksum is only checked before its download)
+        partial = session.get_partial(file_info['page_link'])
+        file_name = partial['file_name'] if partial else _saved_name(file_info)
+        try:
+            return max(0, size - os.path.getsize(os.path.join(self.download_folder, file_name + PART_SUFFIX)))
+        except OSError:
+            return size
+
+    def _free_space(self):
+        """Free bytes on the download folder's disk, less FREE_SPACE_MARGIN."""
+        return shutil.disk_usage(self.download_folder).free - FREE_SPACE_MARGIN
+
+    def _check_free_space(self, files, session):
+        """Returns False (after an "error" event) if what is left of `files` does not fit on the disk."""
+        needed = 0
+        unknown = 0
+        for file_info in files:
+            nbytes = self._bytes_needed(file_info, session)
+            if nbytes is None:
+                unknown += 1
+            else:
+                needed += nbytes
+        free = self._free_space()
+        details = f"{needed / 1024 / 1024:.1f}MB needed, {max(0, free) / 1024 / 1024:.1f}MB free"
+        if unknown:
+            details += f", {unknown} files of unknown size not counted"
+        if needed > free:
+            self.log("Not enough free disk space in the download folder.", details, "error")
+            self.emit("error", message=f"Not enough free disk space in the download folder ({details}).")
+            return False
+        self.log("Free disk space checked.", details, "info")
+        return True
+
+    def _log_limits(self):
+        if self.limiter and self.limiter.active:
+            self.log("Bandwidth limit", self.limiter.describe(), "info")
+
+    def _discover_then_download(self, links, session, cache, select, scheduler, summary):
+        """
+        The classic flow: discover everything, let select() choose, then download.
+        Returns the discovered files, or None if the selection was cancelled, the run stopped or the
+        files do not fit on the disk.
+        """
+        discovered_files = self._discover(links, cache)
+        summary['discovered'] = len(discovered_files)
+        if self._stop.is_set():
+            return None
+        if not discovered_files:
+            return discovered_files
+
+        # --- PHASE 2: USER SELECTION ---
+        self.emit("phase", phase="select")
+        self.log(f"Discovery complete. Found {len(discovered_files)} valid files.",
+                 "Waiting for user selection...", "done")
+        self.emit("files", files=discovered_files)
+        selected_files = select(discovered_files)
+
+        # --- PHASE 3: DOWNLOADING ---
+        if self._stop.is_set():
+            return None
+        if not selected_files:
+            self.log("Download cancelled by user.", "State file with remaining links is preserved.", "warning")
+            return None
+
+        summary['selected'] = len(selected_files)
+        selected_bytes = sum(f.get('size') or 0 for f in selected_files)
+        self.log(f"User selected {len(selected_files)} of {len(discovered_files)} files to download.",
+                 f"{selected_bytes / 1024 / 1024:.1f}MB", "info")
+        if not self._check_free_space(selected_files, session):
+            return None
+        self.emit("phase", phase="download")
+        self._log_limits()
+        self.emit("workers", count=self.slot_pool.size if self.slot_pool else min(scheduler.max_workers,
+                                                                                  len(selected_files)))
+        self._run_downloads(scheduler, selected_files)
+        return discovered_files
+
+    def _discover_and_download(self, links, session, cache, rule, scheduler, summary):
+        """
+        Pipelined flow: every resolved file that `rule` picks goes through a bounded queue straight
+        to the download workers, so downloads start while discovery is still running. The disk
+        space is booked file by file; files that no longer fit are skipped.
+        Returns the discovered files, or None if the run stopped.
+        """
+        self.log("Pipelined mode: downloads start as files are discovered.", f"Selection: {rule.describe()}",
+                 "info")
+        discovered_files = []
+        feed = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        downloads = threading.Thread(target=scheduler.run, kwargs={'feed': feed}, name="pipeline-downloads",
+                                     daemon=True)
+        space = {'free': self._free_space(), 'skipped': 0}
+        admit = self._admission(rule, session, summary, space, discovered_files)
+
+        def on_file(file_info):
+            if admit(file_info):
+                feed.put(file_info)  # Blocks while the download stage is saturated
+
+        self._start_pipelined_downloads(scheduler)
+        downloads.start()
+        try:
+            self._discover(links, cache, on_file=on_file)
+        finally:
+            feed.put(None)
+            downloads.join()
+        return self._pipelined_discovery_finished(discovered_files, space, summary)
+
+    def _admission(self, rule, session, summary, space, discovered_files):
+        """
+        The pipelined flow's on_file() decision: records every file resolved before a stop in
+        `discovered_files` and returns True for those `rule` picks that still fit into space['free']
+        (which they book).
+        """
+
+        def admit(file_info):
+            if self._stop.is_set():
+                return False  # Resolved after the stop, neither matched nor left out
+            discovered_files.append(file_info)
+            if not rule.matches(file_info):
+                return False
+            nbytes = self._bytes_needed(file_info, session) or 0
+            if nbytes > space['free']:
+                space['skipped'] += 1
+                self.log("Not enough free disk space, skipping", file_info['name'], "error")
+                return False
+            space['free'] -= nbytes
+            summary['selected'] += 1
+            return True
+
+        return admit
+
+    def _start_pipelined_downloads(self, scheduler):
+        self.emit("phase", phase="download")
+        self._log_limits()
+        self.emit("workers", count=self.slot_pool.size if self.slot_pool else scheduler.max_workers)
+
+    def _pipelined_discovery_finished(self, discovered_files, space, summary):
+        """Reports the end of the pipelined discovery. Returns the discovered files, or None if the run stopped."""
+        summary['discovered'] = len(discovered_files)
+        if self._stop.is_set():
+            self.log(f"Discovery stopped. {summary['selected']} of {len(discovered_files)} files matched the selection "
+                     "so far.", "State file with remaining links is preserved.", "warning")
+            return None  # Paused or stopped, run() keeps the session with its pending links
+        self.emit("files", files=discovered_files)
+        self.log(f"Discovery complete. {summary['selected']} of {len(discovered_files)} files matched the selection.",
+                 "", "done")
+        if space['skipped']:
+            self.emit("error", message=f"Not enough free disk space for {space['skipped']} of the selected files.")
+        return discovered_files
+
+    def _create_scheduler(self, session, state_file, manifest, cache, summary):
+        """A DownloadScheduler wired to the session, the checksum manifest and this pipeline's events."""
+        verified = {}  # page_link -> (algorithm, digest, ok) of its last checked download
+        scheduler = self._new_scheduler(self._download_job(session, state_file, manifest, cache, summary, verified))
+        last_throughput = [0.0]
+
+        def emit_throughput(force=False):
+            now = time.monotonic()
+            if not force and now - last_throughput[0] < THROUGHPUT_EVENT_INTERVAL:
+                return
+            last_throughput[0] = now
+            self.http.metrics.set('download_rate_bytes_per_second', scheduler.meter.rate())
+            self.emit("throughput", completed=scheduler.completed, failed=scheduler.failed,
+                      total=summary['selected'], rate=scheduler.meter.rate(),
+                      bytes=scheduler.meter.total_bytes)
+
+        def on_progress(slot, current_bytes, total_bytes, filename):
+            self.emit("progress", slot=slot, current=current_bytes, total=total_bytes, file=filename)
+            emit_throughput()
+
+        def on_finished(slot, file_info, success):
+            self.emit("file_finished", slot=slot, file=file_info['name'], page_link=file_info['page_link'],
+                      success=success)
+            emit_throughput(force=True)
+            if success is None:
+                return  # Stopped, neither finished nor failed
+            self.http.metrics.inc('files_total', result="completed" if success else "failed")
+            if not success:
+                error = "checksum mismatch" if file_info['page_link'] in verified else None
+                session.fail(file_info['page_link'], error)
+                return
+            # Update state file on success, with the digest that was verified
+            info = {'name': file_info['name']}
+            if file_info['page_link'] in verified:
+                algorithm, digest, _ = verified[file_info['page_link']]
+                info[algorithm] = digest
+                summary['verified'] += 1
+            if not session.complete(file_info['page_link'], **info):
+                self.log("Link not in state list (already processed?)", file_info['page_link'], "warning")
+            if self._folder_index:
+                self._folder_index.add(_saved_name(file_info), verified[file_info['page_link']][:2]
+                                       if file_info['page_link'] in verified else None)
+
+        scheduler.on_progress = on_progress
+        scheduler.on_finished = on_finished
+        return scheduler
+
+    def _new_scheduler(self, download):
+        return DownloadScheduler(download, max_workers=self.max_workers, per_host=self.per_host, order=self.order,
+                                 log=self.log, retries=self.retries, slot_pool=self.slot_pool)
+
+    def _partial_saver(self, session, state_file):
+        def save_partial(page_link, record):
+            """Records (or with record=None forgets) the unfinished download of `page_link`."""
+            try:
+                session.commit_bytes(page_link, record)
+            except OSError as e:
+                self.log("Failed to save state file!", f"{os.path.basename(state_file)}: {e}", "error")
+
+        return save_partial
+
+    def _use_fresh_url(self, file_info, fresh, cache, summary):
+        """Takes the direct URL of `fresh` (a file page resolved again, or None) into `file_info`; returns it."""
+        if fresh is None:
+            if cache:
+                cache.invalidate(file_info['page_link'])
+            return None
+        file_info['url'] = fresh['url']
+        file_info['fetched_at'] = fresh['fetched_at']
+        if cache and 'source' not in file_info:
+            cache.put(file_info)
+        summary['url_refreshes'] += 1
+        return fresh['url']
+
+    def _reuse_existing(self, file_info, manifest, verified, session, save_partial, summary):
+        """
+        Looks for `file_info` in the folder index before its download. Returns True if the file on
+        disk is complete: the size the server announced and, if a checksum is known, the same
+        digest. A shorter file with no resume record becomes the ".part" file the download
+        continues (from scratch if the server ignores the Range; a known checksum still covers it).
+        """
+        page_link = file_info['page_link']
+        name = _saved_name(file_info)
+        size = file_info.get('size')
+        existing = self._folder_index.get(name) if self._folder_index else None
+        if existing is None or not size or session.get_partial(page_link):
+            return False
+
+        if existing['size'] == size:
+            expected = manifest.lookup(file_info['name'])
+            if expected:
+                algorithm, expected_digest = expected
+                digest = self._folder_index.digest(name, algorithm)
+                if digest != expected_digest:
+                    self.log(f"{algorithm.upper()} of the file on disk does not match, downloading it again", name,
+                             "warning")
+                    return False
+                verified[page_link] = (algorithm, digest, True)
+                self.log(f"Already downloaded, {algorithm.upper()} verified", name, "success")
+            else:
+                self.log("Already downloaded (same size), skipping", name, "success")
+            summary['already_complete'] += 1
+            return True
+
+        output_path = os.path.join(self.download_folder, name)
+        if existing['size'] < size and not os.path.exists(output_path + PART_SUFFIX):
+            os.replace(output_path, output_path + PART_SUFFIX)
+            save_partial(page_link, {'url': file_info['url'], 'file_name': name, 'size': size, 'etag': None,
+                                     'last_modified': None, 'mode': 'stream', 'preallocated': False})
+            self.log(f"Continuing the incomplete file on disk at {existing['size'] / 1024 / 1024:.1f}MB", name, "info")
+            return False
+        self.log("A different file with this name is on disk, it will be replaced", name, "warning")
+        return False
+
+    def _download_result(self, success, page_link, verified):
+        """What the scheduler makes of a finished download_file(): success, STOPPED or RETRY."""
+        if (not success or success == INCOMPLETE) and self._stop.is_set():
+            return DownloadScheduler.STOPPED  # Paused, the partial download stays in the session
+        if success == INCOMPLETE:
+            self.http.metrics.inc('download_retries_total', reason="incomplete")
+            return DownloadScheduler.RETRY  # Cut off, continued from its ".part" file when its turn comes again
+        if not success and page_link in verified and not verified[page_link][2]:
+            self.http.metrics.inc('download_retries_total', reason="checksum")
+            return DownloadScheduler.RETRY  # Corrupt download, fetch it again from scratch
+        return success
+
+    def _download_job(self, session, state_file, manifest, cache, summary, verified):
+        """The scheduler's download(file_info, progress): one file with URL refreshes, resume and verification."""
+        download_folder = self.download_folder
+        save_partial = self._partial_saver(session, state_file)
+
+        def refresh_url(file_info):
+            """Resolves the file page (or the mirror it was found on) again, returning its fresh direct URL or None."""
+            link = file_info.get('source', file_info['page_link'])
+            try:
+                fresh = discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except requests.exceptions.RequestException as e:
+                self.log("Could not resolve a fresh download link", f"{link}: {e}", "error")
+                fresh = None
+            return self._use_fresh_url(file_info, fresh, cache, summary)
+
+        def resolve_mirror(link):
+            """The direct URL of mirror `link`, resolved now (mirror URLs are not cached), or None."""
+            try:
+                record = discover_file_page(link, 0, self.http, self.log, resolver_for(link, self.resolvers))
+            except requests.exceptions.RequestException as e:
+                self.log("Could not resolve the mirror link", f"{link}: {e}", "error")
+                return None
+            return record['url'] if record else None
+
+        def download(file_info, progress):
+            page_link = file_info['page_link']
+            session.start(page_link)
+            if self._reuse_existing(file_info, manifest, verified, session, save_partial, summary):
+                progress(file_info['size'], file_info['size'], file_info['name'])
+                return True
+
+            def on_verified(algorithm, digest, ok):
+                verified[page_link] = (algorithm, digest, ok)
+
+            def save_record(record):
+                if record:
+                    file_info['file_name'] = record['file_name']  # What the folder index will know the file as
+                save_partial(page_link, record)
+
+            sources = self._sources(file_info)
+            for number, source in enumerate(sources):
+                if source == file_info.get('source', page_link):
+                    if time.time() - file_info.get('fetched_at', 0) > DIRECT_URL_MAX_AGE:
+                        # Resolved long ago (the user took a while to select, or the queue is long)
+                        self.log("Download link is old, resolving it again", file_info['name'], "info")
+                        refresh_url(file_info)
+                    url = file_info['url']
+                    on_url_expired = functools.partial(refresh_url, file_info)
+                else:
+                    url = resolve_mirror(source)
+                    on_url_expired = functools.partial(resolve_mirror, source)
+                # Stalls only count while there is another mirror to switch to, and no limit slows the file down
+                watch = TransferWatch(self._stop, progress, stall=number + 1 < len(sources)
+                                      and not (self.limiter and self.limiter.active))
+                success = False
+                if url:
+                    success = download_file(self.http, url, download_folder, file_info['name'], watch.progress,
+                                            self.log, partial=self._partial_for(session, page_link, url, save_partial),
+                                            save_partial=save_record,
+                                            on_url_expired=on_url_expired,
+                                            preallocate=self.preallocate,
+                                            expected_digest=manifest.lookup(file_info['name']),
+                                            on_verified=on_verified,
+                                            throttle=self.limiter.for_file() if self.limiter else None,
+                                            stop=watch)
+                result = self._download_result(success, page_link, verified)
+                if not self._attempt_finished(file_info, sources, number, watch, result, summary):
+                    return result
+            return False
+
+        return download
@@ -0,0 +1,273 @@
+"""
+Phase 1: resolving file hoster pages (fuckingfast.co by default, see ffdownloader.hosts) into
+{name, direct URL} records, optionally followed by a HEAD request per direct URL for its size
+and byte range support.
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from requests.exceptions import RequestException
+
+from ffdownloader.download import file_name_from_response
+from ffdownloader.extract import extract_file_page
+from ffdownloader.hosts import resolver_for
+
+DISCOVERY_WORKERS = 8  # Total file pages fetched at the same time
+DISCOVERY_PER_HOST = 4  # Max pages fetched at the same time from a single host
+PROGRESS_LOG_INTERVAL = 2.0  # Seconds between aggregate "Discovered x/y" log lines
+DISCOVERY_CHUNK_SIZE = 16 * 1024  # Bytes handed to the page scanner at a time
+DISCOVERY_DRAIN_LIMIT = 256 * 1024  # Unread page bytes worth draining to keep the connection alive
+DISCOVERY_CACHE_TTL = 24 * 3600  # Seconds a resolved page is reused from the discovery cache
+DISCOVERY_CACHE_MAX_ENTRIES = 5000  # Least recently used pages are evicted beyond this
+PROBE_TIMEOUT = 15  # Seconds a size probe of a direct URL may take
+DIRECT_URL_MAX_AGE = 20 * 60  # Seconds after which a direct URL is resolved again before its download starts
+PROBE_RANGE_HEADERS = {'Range': 'bytes=0-0'}  # Size probe for servers that refuse HEAD or omit the length
+
+
+class HostLimiter:
+    """Hands out a per-host semaphore so no single host gets more than `per_host` requests at once."""
+
+    def __init__(self, per_host):
+        self.per_host = max(1, per_host)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def slot(self, url):
+        """Returns the semaphore guarding the host of `url` (use it as a context manager)."""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+            return semaphore
+
+
+def discover_file_page(link, index, http, log, resolver=None):
+    """
+    Fetches a single file page and extracts its name and direct download URL.
+    The page is scanned as it streams in and reading stops once both values are found.
+    With a hosts.HostResolver `resolver` its scanner is used, and no page is fetched at all if
+    the link gives the direct URL away.
+    Returns a {'name', 'url', 'page_link', 'fetched_at'} dict, or None if the page is unusable.
+    """
+    direct_url = resolver.direct_url(link) if resolver else None
+    if direct_url:
+        return page_record(link, index, resolver.part_name(link), direct_url, log)
+
+    started = time.perf_counter()
+    with http.get(link, stream=True) as response:
+        if response.status_code != 200:
+            log("Failed To Fetch Page", f"Status: {response.status_code} for {link}", "error")
+            return None
+
+        waited = [0.0]
+        parse_started = time.perf_counter()
+        chunks = _timed_chunks(response.iter_content(DISCOVERY_CHUNK_SIZE), waited)
+        title, download_url, _, _ = extract_file_page(chunks, resolver.scanner() if resolver else None)
+        if http.metrics:
+            http.metrics.observe('parse_seconds', time.perf_counter() - parse_started - waited[0], page="file")
+
+        # Reading a short remainder is cheaper than closing the socket and paying a new handshake
+        drained = 0
+        for chunk in response.iter_content(DISCOVERY_CHUNK_SIZE):
+            drained += len(chunk)
+            if drained > DISCOVERY_DRAIN_LIMIT:
+                break
+    if http.metrics:
+        http.metrics.observe('discovery_page_seconds', time.perf_counter() - started)
+    return page_record(link, index, title, download_url, log)
+
+
+def page_record(link, index, title, download_url, log):
+    """The discovered file of page `link` from its extracted title and direct URL, or None without a URL."""
+    if title:
+        file_name = re.sub(r'[<>:"/\\|?*]', '_', title)
+    else:
+        file_name = f"download_{datetime.now().strftime('%Y%m%d%H%M%S')}_{index}"
+        log("Could not find meta title, using default filename", file_name, "warning")
+
+    if not download_url:
+        log("No Download URL Found in download function for", link, "error")
+        return None
+
+    return {
+        'name': file_name,
+        'url': download_url,
+        'page_link': link,  # --- IMPORTANT: We store this to update the state file
+        'fetched_at': time.time(),  # The direct URL is signed and expires, see DIRECT_URL_MAX_AGE
+    }
+
+
+def _timed_chunks(chunks, waited):
+    """Yields from `chunks`, adding the seconds spent waiting for each one to waited[0]."""
+    chunks = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        waited[0] += time.perf_counter() - started
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _header_int(value):
+    return int(value) if value and value.strip().isdigit() else None
+
+
+def head_probe_result(status, headers):
+    """(size or None, ranges) from the answer to a HEAD request (an encoded body says nothing about its size)."""
+    if status != 200 or headers.get('content-encoding', 'identity').lower() != 'identity':
+        return None, False
+    return _header_int(headers.get('content-length')), headers.get('accept-ranges', '').lower() == 'bytes'
+
+
+def range_probe_result(status, headers, ranges=False):
+    """(size or None, ranges) from the answer to a PROBE_RANGE_HEADERS request."""
+    if status == 206:
+        return _header_int(headers.get('content-range', '').rpartition('/')[2]), True
+    if status == 200:
+        return _header_int(headers.get('content-length')), ranges
+    return None, ranges
+
+
+def probe_file(file_info, http, log):
+    """
+    Asks the direct URL of `file_info` for its size and byte range support without downloading it:
+    a HEAD request, or a one-byte Range request for servers that refuse HEAD or omit the length.
+    Sets file_info['size'] (None if unknown), file_info['ranges'] and file_info['file_name'] (the
+    name the download will be saved under, None if unknown), and returns file_info.
+    """
+    url = file_info['url']
+    size = None
+    ranges = False
+    file_name = None
+    try:
+        response = http.head(url, allow_redirects=True, timeout=PROBE_TIMEOUT)
+        response.close()
+        size, ranges = head_probe_result(response.status_code, response.headers)
+        if response.status_code == 200:
+            file_name = file_name_from_response(log, response, url, file_info['name'])
+        if size is None:
+            with http.get(url, headers=PROBE_RANGE_HEADERS, stream=True, timeout=PROBE_TIMEOUT) as response:
+                size, ranges = range_probe_result(response.status_code, response.headers, ranges)
+                if file_name is None and response.status_code in (200, 206):
+                    file_name = file_name_from_response(log, response, url, file_info['name'])
+    except RequestException as e:
+        log("Could not determine file size", f"{file_info['name']}: {e}", "warning")
+    file_info['size'] = size
+    file_info['ranges'] = ranges
+    file_info['file_name'] = file_name
+    return file_info
+
+
+def discover_files(links, http, log, max_workers=DISCOVERY_WORKERS, per_host=DISCOVERY_PER_HOST, cache=None,
+                   on_file=None, probe=False, resolvers=None, mirrors=None, ranking=None, stop=None):
+    """
+    Resolves every file page in `links` through a bounded worker pool.
+    Returns the discovered files in the same order as `links`; failed pages are left out.
+    Progress is logged in aggregate every PROGRESS_LOG_INTERVAL seconds instead of once per link.
+    With a DiscoveryCache, pages it already knows are not fetched and new results are stored in it.
+    With probe=True every file also gets 'size' and 'ranges' from probe_file(), done by the same
+    pool (cached sizes are reused).
+    on_file(file_info) is called on the calling thread as soon as each file is resolved (cached
+    files first, the rest in completion order); it may block to slow discovery down.
+    Every link is resolved by its hoster's resolver among `resolvers` (default: hosts.RESOLVERS);
+    a page that cannot be resolved is tried on its `mirrors` (page link -> mirror links) in turn,
+    fastest hoster first by `ranking` (a hosts.HostRanking), so a dead hoster is not waited for first.
+    Once `stop` (a threading.Event) is set, pages and probes not started yet are skipped and the
+    files resolved so far are returned.
+    """
+    total = len(links)
+    results = [None] * total
+    limiter = HostLimiter(per_host)
+
+    # Serve what we can from the discovery cache
+    cached = cache.get_many(links) if cache else {}
+    if cached:
+        log(f"Loaded {len(cached)}/{total} pages from the discovery cache.", "", "info")
+    to_fetch = []
+    for i, link in enumerate(links):
+        if link in cached and not (probe and cached[link].get('size') is None):
+            results[i] = cached[link]
+            if on_file:
+                on_file(cached[link])
+        else:
+            to_fetch.append((i, link))  # Not cached, or cached without a size to probe for
+    if not to_fetch:
+        return [file_info for file_info in results if file_info]
+
+    def resolve(index, link):
+        """The file of page `link`, from its page or, failing that, from its mirrors' pages."""
+        sources = [link] + (mirrors or {}).get(link, [])
+        if ranking and len(sources) > 1:
+            sources = ranking.ranked(sources, resolvers)
+        for number, source in enumerate(sources):
+            if stopped():
+                return None
+            try:
+                with limiter.slot(source):
+                    file_info = discover_file_page(source, index, http, log, resolver_for(source, resolvers))
+            except Exception as e:
+                if number + 1 == len(sources):
+                    raise
+                log(f"Error discovering link {source}", str(e), "error")
+                continue
+            if file_info:
+                if source != link:
+                    file_info['page_link'] = link  # Still known by its part's link...
+                    file_info['source'] = source  # ...but its direct URL is the mirror's (not cached)
+                return file_info
+        return None
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    def worker(index, link):
+        if stopped():
+            return None  # Cancelled along with the rest of the queue
+        file_info = cached.get(link) or resolve(index, link)
+        if probe and file_info and not stopped():
+            with limiter.slot(file_info['url']):
+                probe_file(file_info, http, log)
+        return file_info
+
+    completed = total - len(to_fetch)
+    failed = 0
+    started = time.monotonic()
+    last_report = started
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="discovery") as pool:
+        futures = {pool.submit(worker, i, link): i for i, link in to_fetch}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                log(f"Error discovering link {links[index]}", str(e), "error")
+            if results[index] is None:
+                failed += 1
+            elif on_file:
+                on_file(results[index])
+            completed += 1
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_LOG_INTERVAL and completed < total:
+                last_report = now
+                log(f"Discovered {completed}/{total} pages...", f"{failed} failed, {now - started:.1f}s elapsed",
+                    "info")
+            if stopped():
+                for pending in futures:
+                    pending.cancel()  # Only the pages being fetched right now are waited for
+                break
+
+    log(f"Discovery {'stopped' if stopped() else 'pass finished'}: {completed - failed}/{total} pages resolved.",
+        f"{time.monotonic() - started:.1f}s", "info")
+    if cache:
+        cache.put_many([results[i] for i, _ in to_fetch if results[i] and 'source' not in results[i]])
+    return [file_info for file_info in results if file_info]
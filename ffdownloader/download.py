@@ -0,0 +1,336 @@
+"""
+Downloading a single file: picks the output name, resumes ".part" files with Range/If-Range,
+hands large range-capable files to SegmentedDownloader and only renames the ".part" file once
+its length matches what the server announced. When the signed direct URL expires (403/410),
+the caller can hand over a fresh one and the download continues from the bytes on disk. A body
+that ends early is reported as INCOMPLETE, so the caller can try again from the ".part" file.
+"""
+
+import os
+import re
+import time
+
+from ffdownloader.checksums import StreamHasher
+from ffdownloader.net import URL_EXPIRED_STATUSES, UrlExpired
+from ffdownloader.segmented import (
+    SEGMENT_PIECE_SIZE, RangeNotSupported, SegmentedDownloader, supports_segmented_download,
+)
+from ffdownloader.transfer import TransferStopped, copy_response, preallocate as preallocate_file
+
+PART_SUFFIX = ".part"  # Unfinished downloads are written to "<name>.part" and renamed when complete
+PARTIAL_SAVE_INTERVAL = 1.0  # Min seconds between state file writes while segments finish
+URL_REFRESH_LIMIT = 3  # Fresh direct URLs tried per download before an expired link counts as a failure
+INCOMPLETE = "incomplete"  # download_file() result: the body ended early, the ".part" file and its record are kept
+
+
+class TransferIncomplete(IOError):
+    """The connection dropped before the whole body arrived; what arrived is on disk for a resume."""
+
+
+def download_file(http, download_url, output_folder, file_label, progress, log, partial=None, save_partial=None,
+                  on_url_expired=None, preallocate=False, expected_digest=None, on_verified=None, throttle=None,
+                  stop=None):
+    """
+    Downloads a file, reporting progress through progress(current_bytes, total_bytes, filename).
+    It determines the filename from response headers or URL.
+    Data is written to "<name>.part" and only renamed once the length matches content-length.
+    If `partial` (the record saved by an earlier attempt) is given, the download resumes
+    from the bytes already on disk. save_partial(record) is called whenever that record changes.
+    on_url_expired() is called when the server rejects the direct URL with 403/410; if it returns
+    a fresh URL (at most URL_REFRESH_LIMIT times) the download resumes from there.
+    With `preallocate`, single-stream downloads reserve the full content-length on disk first.
+    With `expected_digest` ((algorithm, hex digest)) the file is hashed while it is written and
+    only renamed if the digest matches; on_verified(algorithm, digest, ok) reports the result.
+    A mismatching file is deleted so the next attempt starts from scratch.
+    `throttle` (a ratelimit.FileThrottle) holds every connection of the file to a bandwidth limit.
+    Setting the threading.Event `stop` pauses the download: it returns False and keeps the
+    ".part" file and resume record.
+    Returns True on success, INCOMPLETE if the body ended before content-length (the ".part" file
+    and resume record are kept, worth another attempt) and False on other failures.
+    """
+    save_partial = save_partial or (lambda record: None)
+    verify = Verification(expected_digest, on_verified) if expected_digest else None
+    latest = [partial]
+
+    def save(record):
+        latest[0] = record  # What a retry with a fresh URL resumes from
+        save_partial(record)
+
+    refreshes = 0
+    while True:
+        try:
+            return _download(http, download_url, output_folder, file_label, progress, log, latest[0], save,
+                             preallocate, verify, throttle, stop)
+        except UrlExpired as e:
+            fresh_url = on_url_expired() if on_url_expired and refreshes < URL_REFRESH_LIMIT else None
+            if not fresh_url:
+                log(f"Failed To Download File (Status: {e.status})", f"{file_label} from {download_url}", "error")
+                return False
+            refreshes += 1
+            if http.metrics:
+                http.metrics.inc('download_retries_total', reason="url_expired")
+            log("Download link expired, continuing with a fresh one", file_label, "warning")
+            download_url = fresh_url
+            if verify:
+                verify.hasher = StreamHasher(verify.algorithm)  # Rebuilt from the bytes on disk on resume
+        except TransferStopped:
+            log("Download paused, keeping partial file for resume", file_label, "warning")
+            return False
+        except TransferIncomplete as e:
+            log("Download interrupted, keeping partial file for resume", f"{file_label}: {e}", "warning")
+            return INCOMPLETE
+        except Exception as e:
+            log(f"Failed To Download File '{file_label}'", str(e), "error")
+            return False
+
+
+def _download(http, download_url, output_folder, file_label, progress, log, partial, save_partial, preallocate,
+              verify, throttle, stop):
+    """One attempt of download_file. Raises UrlExpired when the server rejects `download_url`."""
+    # --- Byte-level resume of a single-stream ".part" file ---
+    resume_from = 0
+    request_headers = {}
+    if partial and partial.get('mode') == 'stream':
+        part_path = os.path.join(output_folder, partial['file_name'] + PART_SUFFIX)
+        if os.path.exists(part_path):
+            # A preallocated file is full length from the start, only its committed bytes count
+            resume_from = partial.get('committed', 0) if partial.get('preallocated') else os.path.getsize(part_path)
+    if resume_from:
+        request_headers['Range'] = f"bytes={resume_from}-"
+        validator = partial.get('etag') or partial.get('last_modified')
+        if validator:
+            request_headers['If-Range'] = validator  # Server sends the whole file if it changed
+
+    response = http.get(download_url, stream=True, headers=request_headers)
+
+    if response.status_code == 416 and resume_from and resume_from == partial.get('size'):
+        # The ".part" file already holds every byte, it only needs verifying and renaming
+        response.close()
+        return finish_part_file(log, os.path.join(output_folder, partial['file_name']),
+                                 resume_from, partial['size'], save_partial, verify)
+
+    if response.status_code == 206 and resume_from:
+        file_name = partial['file_name']
+        total_size = total_size_from_content_range(response) or partial.get('size', 0)
+        log(f"Resuming download at {resume_from / 1024 / 1024:.1f}MB", file_name, "info")
+    elif response.status_code == 200:
+        if resume_from:
+            log("Server sent the whole file, restarting download", file_label, "warning")
+        resume_from = 0
+        file_name = file_name_from_response(log, response, download_url, file_label)
+        total_size = int(response.headers.get('content-length', 0))
+    else:
+        response.close()
+        return refused(log, response.status_code, file_label, download_url)
+
+    output_path = os.path.join(output_folder, file_name)
+    part_path = output_path + PART_SUFFIX
+    record = {
+        'url': download_url,
+        'file_name': file_name,
+        'size': total_size,
+        'etag': strong_etag(response),
+        'last_modified': response.headers.get('last-modified'),
+    }
+
+    # --- Large files on servers that support ranges are fetched over several connections ---
+    if response.status_code == 200 and supports_segmented_download(response, total_size):
+        response.close()
+        try:
+            return _download_segmented(http, log, download_url, output_path, total_size, record, partial,
+                                       progress, save_partial, verify, throttle, stop)
+        except RangeNotSupported as e:
+            log("Range requests not honoured, falling back to a single stream", str(e), "warning")
+            if verify:
+                verify.hasher = StreamHasher(verify.algorithm)
+            response = http.get(download_url, stream=True)
+            if response.status_code != 200:
+                response.close()
+                return refused(log, response.status_code, file_label, download_url)
+
+    record['mode'] = 'stream'
+    if resume_from:
+        record['preallocated'] = bool(partial.get('preallocated'))
+    else:
+        record['preallocated'] = bool(preallocate and total_size)
+    downloaded = _download_stream(response, part_path, record, resume_from, progress, save_partial, verify,
+                                  throttle, stop, http.metrics)
+    return finish_part_file(log, output_path, downloaded, total_size, save_partial, verify)
+
+
+def refused(log, status, file_label, download_url):
+    """A download answered with an unusable `status`: raises UrlExpired if its link expired, else logs it (False)."""
+    if status in URL_EXPIRED_STATUSES:
+        raise UrlExpired(status)
+    log(f"Failed To Download File (Status: {status})", f"{file_label} from {download_url}", "error")
+    return False
+
+
+def _download_stream(response, part_path, record, resume_from, progress, save_partial, verify, throttle=None,
+                     stop=None, metrics=None):
+    """Writes a single-stream response into the ".part" file from `resume_from` on, returning the file's byte count."""
+    total_size = record['size']
+    hasher = verify.hasher if verify else None
+    if hasher and resume_from:
+        hasher.advance_to(part_path, resume_from)  # The resumed prefix is the only part read back
+    downloaded = resume_from
+    preallocated = record['preallocated']
+    save_partial(dict(record, committed=downloaded) if preallocated else record)
+    progress(downloaded, total_size, record['file_name'])
+
+    mode = 'wb' if not resume_from else ('r+b' if preallocated else 'ab')
+    with open(part_path, mode) as f:
+        if preallocated and not resume_from:
+            preallocate_file(f, total_size)
+        f.seek(resume_from)
+        last_save = time.monotonic()
+
+        def on_chunk(nbytes):
+            nonlocal downloaded, last_save
+            downloaded += nbytes
+            progress(downloaded, total_size, record['file_name'])
+            # The file size no longer tells how far a preallocated download got, so record it
+            if preallocated and time.monotonic() - last_save >= PARTIAL_SAVE_INTERVAL:
+                last_save = time.monotonic()
+                f.flush()
+                save_partial(dict(record, committed=downloaded))
+
+        try:
+            copy_response(response, f, on_chunk, stop=stop, hasher=hasher, throttle=throttle, metrics=metrics)
+        except TransferStopped:
+            raise
+        except Exception as e:
+            raise TransferIncomplete(f"Connection lost at {downloaded}/{total_size} bytes ({e})") from e
+        finally:
+            if preallocated:
+                f.flush()
+                save_partial(dict(record, committed=downloaded))
+    if stop and stop.is_set() and downloaded != total_size:
+        response.close()
+        raise TransferStopped(f"Stopped at {downloaded}/{total_size} bytes")
+    return downloaded
+
+
+def _download_segmented(http, log, download_url, output_path, total_size, record, partial, progress, save_partial,
+                        verify, throttle=None, stop=None):
+    """
+    Runs SegmentedDownloader into the ".part" file, reusing finished pieces of a matching earlier run
+    (same size and validators, or none recorded, as after switching to another mirror).
+    """
+    part_path = output_path + PART_SUFFIX
+    done_pieces = []
+    if (partial and partial.get('mode') == 'segmented'
+            and partial.get('size') == total_size
+            and partial.get('piece_size') == SEGMENT_PIECE_SIZE
+            and (partial.get('etag'), partial.get('last_modified')) in ((record['etag'], record['last_modified']),
+                                                                        (None, None))
+            and os.path.exists(part_path) and os.path.getsize(part_path) == total_size):
+        done_pieces = partial.get('pieces_done', [])
+        log(f"Resuming segmented download ({len(done_pieces)} pieces already done)", record['file_name'], "info")
+
+    record = dict(record, mode='segmented', piece_size=SEGMENT_PIECE_SIZE, pieces_done=done_pieces)
+    save_partial(record)
+    last_save = [time.monotonic()]
+
+    def on_piece_done(pieces_done):
+        if verify:
+            # Pieces finish out of order, hash whatever is contiguous from the start while it is still cached
+            verify.hasher.advance_to(part_path, contiguous_end(pieces_done, SEGMENT_PIECE_SIZE, total_size))
+        # Saving after every piece would rewrite the state file constantly on a fast link
+        now = time.monotonic()
+        if now - last_save[0] >= PARTIAL_SAVE_INTERVAL:
+            last_save[0] = now
+            save_partial(dict(record, pieces_done=pieces_done))
+
+    downloader = SegmentedDownloader(download_url, part_path, total_size, http, progress,
+                                     record['file_name'], log, done_pieces=done_pieces,
+                                     on_piece_done=on_piece_done, throttle=throttle, stop=stop)
+    try:
+        downloader.run()
+    finally:
+        save_partial(dict(record, pieces_done=sorted(downloader.done_pieces)))
+    return finish_part_file(log, output_path, downloader.downloaded, total_size, save_partial, verify)
+
+
+def contiguous_end(pieces_done, piece_size, total_size):
+    """Offset up to which every piece (given by its start offset) is finished."""
+    end = 0
+    for start in sorted(pieces_done):
+        if start != end:
+            break
+        end = min(start + piece_size, total_size)
+    return end
+
+
+class Verification:
+    """The expected digest of one download and the hasher fed while it is written."""
+
+    def __init__(self, expected_digest, on_verified):
+        self.algorithm, self.expected = expected_digest
+        self.hasher = StreamHasher(self.algorithm)
+        self.on_verified = on_verified or (lambda algorithm, digest, ok: None)
+
+
+def finish_part_file(log, output_path, downloaded, total_size, save_partial, verify=None):
+    """
+    Checks the ".part" file is complete (and matches its checksum), then renames it to its final name.
+    Returns True, INCOMPLETE for a short file or False for a checksum mismatch.
+    """
+    part_path = output_path + PART_SUFFIX
+    on_disk = os.path.getsize(part_path)
+    if total_size and (downloaded != total_size or on_disk != total_size):
+        log("Download incomplete, keeping partial file for resume",
+            f"{os.path.basename(output_path)}: {on_disk}/{total_size} bytes", "warning")
+        return INCOMPLETE
+
+    if verify:
+        verify.hasher.advance_to(part_path, on_disk)
+        digest = verify.hasher.hexdigest()
+        ok = digest == verify.expected
+        verify.on_verified(verify.algorithm, digest, ok)
+        if not ok:
+            log(f"{verify.algorithm.upper()} mismatch, deleting corrupt file",
+                f"{os.path.basename(output_path)}: got {digest}, expected {verify.expected}", "error")
+            os.remove(part_path)
+            save_partial(None)
+            return False
+        log(f"{verify.algorithm.upper()} verified", os.path.basename(output_path), "success")
+
+    os.replace(part_path, output_path)
+    save_partial(None)
+    log("Successfully Downloaded File", os.path.basename(output_path), "success")
+    return True
+
+
+def file_name_from_response(log, response, download_url, file_label):
+    """Picks the output file name from Content-Disposition, then the URL path, then the label."""
+    file_name = file_label
+    content_disposition = response.headers.get('content-disposition')
+    if content_disposition:
+        match = re.search(r'filename="?([^"]+)"?', content_disposition)
+        if match:
+            file_name = match.group(1)
+    else:
+        parsed_url_path = download_url.split('?')[0].split('#')[0]
+        url_filename = parsed_url_path.split('/')[-1]
+        if url_filename:
+            file_name = url_filename
+
+    file_name = re.sub(r'[<>:"/\\|?*]', '_', file_name)
+
+    if not file_name or file_name.endswith('.'):
+        file_name = file_label + "_download"
+        log("Could not determine filename, using label", file_name, "warning")
+    return file_name
+
+
+def total_size_from_content_range(response):
+    """Returns the full length from a "Content-Range: bytes a-b/total" header, or 0 if unknown."""
+    match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('content-range', ''))
+    return int(match.group(1)) if match else 0
+
+
+def strong_etag(response):
+    """If-Range only accepts strong validators, so weak ETags (W/"...") are not recorded."""
+    etag = response.headers.get('etag')
+    return etag if etag and not etag.startswith('W/') else None
@@ -0,0 +1,165 @@
+"""
+Fast extraction of the few values the downloader needs from HTML pages.
+
+File pages (fuckingfast.co) only matter for two values: the `<meta name="title">` content and the
+URL inside `window.open(...)` in the script that defines `function download`. Building a full
+BeautifulSoup tree for that is slow and memory hungry, so FilePageScanner scans the raw bytes as
+they arrive and reports when both values are known, letting the caller stop reading.
+If a page does not match the expected layout the scanner falls back to a full BeautifulSoup parse
+of the bytes it has seen.
+
+Repack pages only need their `<a href>` values, which extract_links() pulls out with a
+precompiled regex (again with a BeautifulSoup fallback). BeautifulSoup is only imported when
+a fallback actually runs, it costs more start-up time than everything else in this package.
+"""
+
+import html
+import re
+
+# --- Precompiled patterns (bytes, so chunks never need decoding until a match is found) ---
+META_TAG_RE = re.compile(rb'<meta\b[^>]*>', re.IGNORECASE)
+META_NAME_TITLE_RE = re.compile(rb'\sname\s*=\s*["\']?title["\'\s/>]', re.IGNORECASE)
+META_CONTENT_RE = re.compile(rb'\scontent\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+DOWNLOAD_FUNCTION_RE = re.compile(rb'function\s+download\b')
+SCRIPT_END_RE = re.compile(rb'</script\s*>', re.IGNORECASE)
+WINDOW_OPEN_RE = re.compile(rb'window\.open\(["\'](https?://[^\s"\'\)]+)')
+ANCHOR_HREF_RE = re.compile(rb'<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+HEAD_END_RE = re.compile(rb'</head\s*>', re.IGNORECASE)
+
+# Bytes kept from the previous scan position so a tag split across two chunks is still matched
+SCAN_OVERLAP = 4096
+
+
+def _decode(value):
+    return html.unescape(value.decode('utf-8', errors='replace'))
+
+
+class FilePageScanner:
+    """
+    Incrementally scans a file page for its title and direct download URL.
+
+        scanner = FilePageScanner()
+        for chunk in response.iter_content(16384):
+            if scanner.feed(chunk):
+                break
+        title, url = scanner.finish()
+
+    `title` and `url` are None when the page does not contain them.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.title = None
+        self.download_url = None
+        self.used_fallback = False
+        self._title_done = False  # Set once a title is found or the <head> has ended without one
+        self._meta_pos = 0
+        self._script_pos = 0
+
+    @property
+    def done(self):
+        return self._title_done and self.download_url is not None
+
+    def feed(self, chunk):
+        """Adds the next chunk of the page. Returns True once both values are known."""
+        self.buffer += chunk
+        if not self._title_done:
+            self._scan_title()
+        if self.download_url is None:
+            self._scan_download_url()
+        return self.done
+
+    def finish(self):
+        """Call after the last chunk. Falls back to a full parse if the fast scan missed anything."""
+        if self.title is None or self.download_url is None:
+            self._fallback()
+        return self.title, self.download_url
+
+    def _scan_title(self):
+        buffer = self.buffer
+        for match in META_TAG_RE.finditer(buffer, self._meta_pos):
+            tag = match.group(0)
+            if META_NAME_TITLE_RE.search(tag):
+                content = META_CONTENT_RE.search(tag)
+                if content:
+                    self.title = _decode(content.group(1) if content.group(1) is not None else content.group(2))
+                self._title_done = True
+                return
+            self._meta_pos = match.end()
+        # <meta> belongs in <head>, once that is closed there is nothing left to find
+        if HEAD_END_RE.search(buffer, max(0, self._meta_pos - SCAN_OVERLAP)):
+            self._title_done = True
+        else:
+            self._meta_pos = max(self._meta_pos, len(buffer) - SCAN_OVERLAP)
+
+    def _scan_download_url(self):
+        buffer = self.buffer
+        while True:
+            function = DOWNLOAD_FUNCTION_RE.search(buffer, self._script_pos)
+            if not function:
+                self._script_pos = max(self._script_pos, len(buffer) - SCAN_OVERLAP)
+                return
+            script_end = SCRIPT_END_RE.search(buffer, function.end())
+            window_open = WINDOW_OPEN_RE.search(buffer, function.end(),
+                                                script_end.start() if script_end else len(buffer))
+            if window_open:
+                self.download_url = _decode(window_open.group(1))
+                return
+            if not script_end:
+                return  # The rest of this script has not arrived yet
+            # `function download` without window.open in this script, keep looking after it
+            self._script_pos = script_end.end()
+
+    def _fallback(self):
+        """Parses the whole page with BeautifulSoup, exactly like the original discovery loop did."""
+        from bs4 import BeautifulSoup
+
+        self.used_fallback = True
+        soup = BeautifulSoup(bytes(self.buffer), 'html.parser')
+        if self.title is None:
+            meta_title = soup.find('meta', attrs={'name': 'title'})
+            if meta_title and meta_title.get('content'):
+                self.title = meta_title['content']
+        if self.download_url is None:
+            for script in soup.find_all('script'):
+                if script.string and 'function download' in script.string:
+                    match = WINDOW_OPEN_RE.search(script.string.encode('utf-8'))
+                    if match:
+                        self.download_url = _decode(match.group(1))
+                    break
+
+
+def extract_file_page(chunks, scanner=None):
+    """
+    Runs FilePageScanner (or `scanner`, another hoster's) over an iterable of byte chunks, stopping
+    as soon as both values are found. Returns (title, download_url, bytes_read, used_fallback).
+    """
+    scanner = scanner or FilePageScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    title, download_url = scanner.finish()
+    return title, download_url, len(scanner.buffer), scanner.used_fallback
+
+
+def extract_links(page, prefix):
+    """
+    Returns every `<a href>` of `page` (bytes or str) that starts with `prefix`, in page order.
+    Falls back to BeautifulSoup if the regex finds no anchors at all.
+    """
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+
+    hrefs = []
+    for match in ANCHOR_HREF_RE.finditer(page):
+        raw = match.group(1) if match.group(1) is not None else (
+            match.group(2) if match.group(2) is not None else match.group(3))
+        hrefs.append(_decode(raw))
+
+    if not hrefs:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(page, 'html.parser')
+        hrefs = [a['href'] for a in soup.find_all('a', href=True)]
+
+    return [href for href in hrefs if href.startswith(prefix)]
@@ -0,0 +1,138 @@
+"""
+Persistent index of the finished files in a download folder, so complete files are not downloaded again.
+
+Without it a lost session state, or a second repack URL pointed at the same folder, downloads
+(and overwrites) every part again, multi-GB ones included. FolderIndex keeps
+name -> size, modification time and, once known, the file's digest in a small SQLite database
+next to the downloads.
+
+refresh() brings the index up to date from one directory listing: only sizes and modification
+times are compared, no file is read, so a folder with thousands of parts is indexed in
+milliseconds. Entries of changed files lose their digest, entries of deleted files are dropped.
+A digest is only computed when a checksum is known for a file of the expected size, and kept
+until the file changes, so every file is hashed at most once.
+"""
+
+import os
+import sqlite3
+import stat
+import threading
+
+from ffdownloader.checksums import StreamHasher
+from ffdownloader.download import PART_SUFFIX
+
+INDEX_FILE_NAME = ".folder_index.sqlite3"
+
+
+class FolderIndex:
+    """Thread-safe SQLite-backed map of file name -> {name, size, mtime_ns, digest} for the files of `folder`."""
+
+    def __init__(self, folder, path=None):
+        self.folder = folder
+        self.path = path or os.path.join(folder, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " name TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " algorithm TEXT,"
+            " digest TEXT)"
+        )
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Opens (or creates) the index stored in `folder`."""
+        return cls(folder)
+
+    def refresh(self):
+        """
+        Syncs the index with the folder from one listing (stat only, nothing is read).
+        Returns (files on disk, entries added, changed or dropped).
+        """
+        on_disk = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.name.endswith(PART_SUFFIX):
+                    continue  # State, cache and unfinished downloads
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                on_disk[entry.name] = (st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            known = {name: (size, mtime_ns) for name, size, mtime_ns
+                     in self._db.execute("SELECT name, size, mtime_ns FROM files")}
+            changed = [(name, size, mtime_ns) for name, (size, mtime_ns) in on_disk.items()
+                       if known.get(name) != (size, mtime_ns)]
+            gone = [(name,) for name in known if name not in on_disk]
+            if changed or gone:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO files (name, size, mtime_ns) VALUES (?, ?, ?)", changed)
+                self._db.executemany("DELETE FROM files WHERE name = ?", gone)
+                self._db.execute("COMMIT")
+        return len(on_disk), len(changed) + len(gone)
+
+    def get(self, name):
+        """
+        The entry of file `name` as {'name', 'size', 'mtime_ns', 'digest'} ('digest' is
+        (algorithm, hex digest) or None), or None if it is not on disk. The file is stat'ed, so
+        changes since refresh() count.
+        """
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            st = None
+        with self._lock:
+            if st is None or not stat.S_ISREG(st.st_mode):
+                self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+                return None
+            row = self._db.execute("SELECT size, mtime_ns, algorithm, digest FROM files WHERE name = ?",
+                                   (name,)).fetchone()
+            digest = None
+            if row is None or (row[0], row[1]) != (st.st_size, st.st_mtime_ns):
+                self._db.execute("INSERT OR REPLACE INTO files (name, size, mtime_ns) VALUES (?, ?, ?)",
+                                 (name, st.st_size, st.st_mtime_ns))
+            elif row[3]:
+                digest = (row[2], row[3])
+        return {'name': name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': digest}
+
+    def digest(self, name, algorithm):
+        """
+        The `algorithm` hex digest of file `name` (None if it is not on disk): from the index, or
+        by hashing the file once and remembering the result until the file changes.
+        """
+        entry = self.get(name)
+        if entry is None:
+            return None
+        if entry['digest'] and entry['digest'][0] == algorithm:
+            return entry['digest'][1]
+        hasher = StreamHasher(algorithm)
+        hasher.advance_to(os.path.join(self.folder, name), entry['size'])
+        digest = hasher.hexdigest()
+        with self._lock:
+            # Only if the file is still what was hashed
+            self._db.execute("UPDATE files SET algorithm = ?, digest = ? WHERE name = ? AND size = ? AND mtime_ns = ?",
+                             (algorithm, digest, name, entry['size'], entry['mtime_ns']))
+        return digest
+
+    def add(self, name, digest=None):
+        """Records a file that was just finished, with its verified (algorithm, hex digest) if any."""
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return
+        algorithm, hexdigest = digest or (None, None)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files (name, size, mtime_ns, algorithm, digest) "
+                             "VALUES (?, ?, ?, ?, ?)", (name, st.st_size, st.st_mtime_ns, algorithm, hexdigest))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,297 @@
+"""
+The file hosters a repack page links to, and which of them each part is downloaded from.
+
+FitGirl lists every part on several hosters (FuckingFast, Pixeldrain, DataNodes, 1fichier, ...).
+A HostResolver knows one of them: which links are its file pages (matches()), which part a link
+stands for (part_name(), from the "#<file name>" fragment or the last path segment) and how to
+get the direct download URL: straight from the link (direct_url()), or by scanning the file page
+as it streams in (scanner()), so both network engines fetch pages their own way. RESOLVERS is the
+registry, most preferred hoster first; register() adds a hoster with its own page layout.
+
+group_links() turns the links of a repack page into one link per part, on the most preferred
+hoster the page uses (so sessions keep their keys), plus that part's mirrors on the others.
+
+HostRanking remembers how fast every hoster was: an exponentially weighted average of quick
+probes (a MIRROR_PROBE_BYTES Range request) and finished downloads, with failures counting as
+0 bytes/s, stored in ~/.ffdownloader/hosts.json so the ranking improves from run to run.
+ranked() orders the links of a part fastest hoster first. The pipeline downloads from the first
+and fails over to the next one when a download fails or stalls (TransferWatch), continuing from
+the bytes already on disk.
+"""
+
+import json
+import os
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from ffdownloader.extract import FilePageScanner
+
+MIRROR_PROBE_BYTES = 256 * 1024  # Bytes read from each hoster to measure its speed
+MIRROR_PROBE_TIMEOUT = 10  # Seconds a probe may take
+MIRROR_PROBE_INTERVAL = 3600  # Seconds a measured speed is trusted before the hoster is probed again
+MIRROR_STALL_SECONDS = 30  # A download that moves less than MIRROR_STALL_RATE over this long stalled...
+MIRROR_STALL_RATE = 16 * 1024  # ...bytes per second, and switches to the next mirror if there is one
+RANKING_WEIGHT = 0.3  # Weight of a new measurement in a hoster's average speed
+
+
+class HostResolver:
+    """
+    One file hoster. Subclasses set `name` and `prefixes` (the start of its file page links) and
+    override direct_url() or scanner(); both can also be given to the constructor, e.g. to point
+    a resolver at a test server.
+    """
+
+    name = None
+    prefixes = ()
+
+    def __init__(self, name=None, prefixes=None):
+        if name is not None:
+            self.name = name
+        if prefixes is not None:
+            self.prefixes = tuple(prefixes)
+
+    def matches(self, link):
+        return link.startswith(self.prefixes)
+
+    def part_name(self, link):
+        """The file name `link` stands for (its "#fragment", else its last path segment), or None."""
+        parts = urlsplit(link)
+        name = unquote(parts.fragment or parts.path.rstrip("/").rpartition("/")[2])
+        return name if "." in name else None  # A bare file id says nothing about the part
+
+    def direct_url(self, link):
+        """The direct download URL when the link alone gives it away (no page to fetch), else None."""
+        return None
+
+    def scanner(self):
+        """A fresh extract.FilePageScanner-like object (feed(chunk), finish() -> (title, url)) for a file page."""
+        return FilePageScanner()
+
+
+class FuckingFastResolver(HostResolver):
+    """fuckingfast.co: the direct URL is in the `window.open(...)` of the page's download script."""
+
+    name = "fuckingfast"
+    prefixes = ("https://fuckingfast.co/",)
+
+
+class PixeldrainResolver(HostResolver):
+    """pixeldrain.com: every file is served by its API, no page needs to be fetched."""
+
+    name = "pixeldrain"
+    prefixes = ("https://pixeldrain.com/",)
+
+    def direct_url(self, link):
+        segments = [segment for segment in urlsplit(link).path.split("/") if segment]
+        if segments[:1] == ["u"]:
+            segments = segments[1:]  # pixeldrain.com/u/<id>
+        if not segments or segments[0] in ("api", "l"):
+            return None
+        return f"https://pixeldrain.com/api/file/{segments[0]}?download"
+
+
+RESOLVERS = [FuckingFastResolver(), PixeldrainResolver()]
+
+
+def register(resolver, first=False):
+    """Adds `resolver` to RESOLVERS, last or (with first=True) as the most preferred hoster."""
+    RESOLVERS.insert(0 if first else len(RESOLVERS), resolver)
+
+
+def resolver_for(link, resolvers=None):
+    """The resolver of `link` among `resolvers` (default: RESOLVERS), or None for an unknown hoster."""
+    for resolver in RESOLVERS if resolvers is None else resolvers:
+        if resolver.matches(link):
+            return resolver
+    return None
+
+
+def host_name(link, resolvers=None):
+    """The name `link`'s hoster is ranked under: its resolver's, or the host name for unknown hosters."""
+    resolver = resolver_for(link, resolvers)
+    return resolver.name if resolver else (urlsplit(link).hostname or link)
+
+
+def group_links(links, resolvers=None):
+    """
+    Splits the file hoster links of a repack page into the parts to download and their mirrors.
+    The parts are the links of the most preferred hoster the page uses, in page order; links of
+    the other hosters become mirrors of the part with the same name, and are dropped if there is
+    none (a part is never downloaded twice). Links of unknown hosters are dropped.
+    Returns (parts, {part link: [mirror links]}).
+    """
+    resolvers = RESOLVERS if resolvers is None else resolvers
+    by_resolver = [[] for _ in resolvers]
+    for link in links:
+        for position, resolver in enumerate(resolvers):
+            if resolver.matches(link):
+                by_resolver[position].append(link)
+                break
+    primary = next((position for position, found in enumerate(by_resolver) if found), None)
+    if primary is None:
+        return [], {}
+
+    parts = by_resolver[primary]
+    by_name = {}
+    for link in parts:
+        by_name.setdefault(resolvers[primary].part_name(link), link)
+    by_name.pop(None, None)
+    mirrors = {}
+    for position, found in enumerate(by_resolver):
+        if position == primary:
+            continue
+        for link in found:
+            part = by_name.get(resolvers[position].part_name(link))
+            if part:
+                mirrors.setdefault(part, []).append(link)
+    return parts, mirrors
+
+
+def probe_speed(http, url, nbytes=MIRROR_PROBE_BYTES, timeout=MIRROR_PROBE_TIMEOUT):
+    """
+    Bytes per second of the first `nbytes` of `url` (one Range request, timed from sending it, so
+    a slow first byte counts too), or None if the request fails.
+    """
+    from requests.exceptions import RequestException  # Loaded by the HTTP client already, not at start-up
+
+    started = time.monotonic()
+    received = 0
+    try:
+        with http.get(url, headers={'Range': f"bytes=0-{nbytes - 1}"}, stream=True, timeout=timeout) as response:
+            if response.status_code not in (200, 206):
+                return None
+            for chunk in response.iter_content(64 * 1024):
+                received += len(chunk)
+                if received >= nbytes:
+                    break  # A server ignoring the Range sends everything
+    except RequestException:
+        return None
+    elapsed = time.monotonic() - started
+    return received / elapsed if received and elapsed > 0 else None
+
+
+def default_ranking_path():
+    return os.path.join(os.path.expanduser("~"), ".ffdownloader", "hosts.json")
+
+
+class HostRanking:
+    """Thread-safe average download speed per hoster name, persisted as JSON at `path`."""
+
+    def __init__(self, path=None):
+        self.path = path or default_ranking_path()
+        self._lock = threading.Lock()
+        self._hosts = {}  # name -> {'rate': bytes/s, 'samples': n, 'updated': unix time}
+
+    @classmethod
+    def load(cls, path=None):
+        """Reads the ranking at `path` (missing or unreadable: an empty ranking)."""
+        ranking = cls(path)
+        try:
+            with open(ranking.path, 'r', encoding='utf-8') as f:
+                hosts = json.load(f).get('hosts', {})
+        except (OSError, ValueError, AttributeError):
+            hosts = {}
+        ranking._hosts = {name: entry for name, entry in hosts.items()
+                          if isinstance(entry, dict) and isinstance(entry.get('rate'), (int, float))}
+        return ranking
+
+    def save(self):
+        """Best effort: a ranking that cannot be written only means the next run probes again."""
+        with self._lock:
+            data = {'hosts': dict(self._hosts)}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def record(self, name, rate):
+        """Adds a measured speed (bytes per second) of hoster `name`."""
+        with self._lock:
+            entry = self._hosts.get(name)
+            if entry:
+                rate = entry['rate'] + RANKING_WEIGHT * (rate - entry['rate'])
+            self._hosts[name] = {'rate': round(rate, 1), 'samples': (entry['samples'] if entry else 0) + 1,
+                                 'updated': round(time.time())}
+
+    def failure(self, name):
+        """A failed probe or download of hoster `name` counts as a measurement of 0 bytes/s."""
+        self.record(name, 0.0)
+
+    def rate(self, name):
+        """The average speed of hoster `name`, or None if it was never measured."""
+        with self._lock:
+            entry = self._hosts.get(name)
+            return entry['rate'] if entry else None
+
+    def fresh(self, name):
+        """True if hoster `name` was measured within MIRROR_PROBE_INTERVAL."""
+        with self._lock:
+            entry = self._hosts.get(name)
+            return bool(entry) and time.time() - entry.get('updated', 0) < MIRROR_PROBE_INTERVAL
+
+    def ranked(self, links, resolvers=None):
+        """`links` (one part on several hosters) fastest hoster first; unmeasured ones keep their order, last."""
+        rates = [self.rate(host_name(link, resolvers)) for link in links]
+        order = sorted(range(len(links)), key=lambda i: (rates[i] is None, -(rates[i] or 0), i))
+        return [links[i] for i in order]
+
+    def describe(self, names):
+        """"name 1.2MB/s, ..." for the hosters `names`, fastest first."""
+        rates = sorted(((self.rate(name), name) for name in names), key=lambda item: -(item[0] or 0))
+        return ", ".join(f"{name} {rate / 1024 / 1024:.1f}MB/s" if rate is not None else f"{name} ?"
+                         for rate, name in rates)
+
+
+class TransferWatch:
+    """
+    The `stop` of one download attempt: set when `stop` is, and, with stall=True, also once the
+    attempt moved less than MIRROR_STALL_RATE bytes/s over MIRROR_STALL_SECONDS, so the caller can
+    switch to another mirror. progress() wraps the download's progress callback; rate() is the
+    attempt's average speed, for the ranking.
+    """
+
+    def __init__(self, stop, progress, stall=False):
+        self.stop = stop
+        self.stalled = False
+        self._progress = progress
+        self._stall = stall
+        self._first = None  # (monotonic time, bytes) of the first progress report
+        self._last = None
+        self._mark = None  # Start of the current stall window
+
+    def progress(self, current, total, file_name):
+        now = time.monotonic()
+        if self._first is None:
+            self._first = self._mark = (now, current)
+        self._last = (now, current)
+        self._check(now)
+        self._progress(current, total, file_name)
+
+    def _check(self, now):
+        # Also called while no bytes arrive at all, the stalled connections do not report progress
+        if not self._stall or self._mark is None or now - self._mark[0] < MIRROR_STALL_SECONDS:
+            return
+        if self._last[1] - self._mark[1] < MIRROR_STALL_RATE * (now - self._mark[0]):
+            self.stalled = True
+        self._mark = (now, self._last[1])
+
+    def is_set(self):
+        if not self.stalled:
+            self._check(time.monotonic())
+        return self.stalled or self.stop.is_set()
+
+    def wait(self, timeout=None):
+        """threading.Event.wait() for the segmented downloader, which waits on its stop between adjustments."""
+        self.stop.wait(timeout)
+        return self.is_set()
+
+    def rate(self):
+        """Bytes per second moved by this attempt, or None if it moved nothing."""
+        if self._first is None or self._last[1] <= self._first[1] or self._last[0] <= self._first[0]:
+            return None
+        return (self._last[1] - self._first[1]) / (self._last[0] - self._first[0])
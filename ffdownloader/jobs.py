@@ -0,0 +1,262 @@
+"""
+A persistent queue of repacks to download, worked through in order.
+
+Each job is one repack URL with its own target folder (a subfolder named after the repack),
+and so its own session state. The queue is a small JSON file, rewritten through a temp file +
+fsync + rename after every change, so it survives restarts: jobs that were running when the
+program stopped are queued again and resume from their sessions.
+
+JobRunner runs the first queued jobs, up to `parallel` at once. Their pipelines share one
+scheduler.SlotPool and one ratelimit.BandwidthLimiter, so a global worker and bandwidth budget
+holds however many repacks are in flight. Jobs can be reordered, paused and resumed at any time.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from ffdownloader.session import fsync_dir
+
+JOB_QUEUE_VERSION = 1
+JOB_PARALLEL = 2  # Jobs running at once, so the next repack is discovered while the last one finishes
+JOB_STATUSES = ("queued", "running", "paused", "done", "failed")
+
+
+def default_queue_path():
+    return os.path.join(os.path.expanduser("~"), ".ffdownloader", "queue.json")
+
+
+def job_folder_name(url):
+    """The subfolder for a repack URL: its last path segment ("some-game" for .../some-game/)."""
+    parts = urlsplit(url)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    name = segments[-1] if segments else parts.hostname or "download"
+    return re.sub(r'[<>:"/\\|?*]', '_', name)
+
+
+class JobQueue:
+    """
+    Thread-safe ordered list of jobs stored at `path`. A job is a dict
+    {id, url, folder, status, added, summary}; status is one of JOB_STATUSES.
+    on_change() is called after every change (from the thread that made it).
+    """
+
+    def __init__(self, path, on_change=None):
+        self.path = path
+        self.on_change = on_change
+        self.jobs = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Reads the queue at `path` (a missing file is an empty queue). Raises ValueError/OSError."""
+        queue = cls(path, **kwargs)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                queue.jobs = json.load(f).get('jobs', [])
+            for job in queue.jobs:
+                if job['status'] == "running":
+                    job['status'] = "queued"  # Interrupted by a restart, its session resumes it
+        return queue
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(job) for job in self.jobs]
+
+    def get(self, job_id):
+        with self._lock:
+            for job in self.jobs:
+                if job['id'] == job_id:
+                    return dict(job)
+        raise KeyError(f"No job {job_id}")
+
+    def add(self, url, folder):
+        """Queues `url` to download into `folder`. A URL that is already waiting is not added twice."""
+        with self._lock:
+            for job in self.jobs:
+                if job['url'] == url and job['status'] in ("queued", "paused", "running"):
+                    return dict(job)
+            job = {
+                'id': max((job['id'] for job in self.jobs), default=0) + 1,
+                'url': url,
+                'folder': folder,
+                'status': "queued",
+                'added': round(time.time(), 3),
+                'summary': None,
+            }
+            self.jobs.append(job)
+            self._changed()
+            return dict(job)
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self._find(job_id)
+            if job['status'] == "running":
+                raise ValueError("Pause a running job before removing it")
+            self.jobs.remove(job)
+            self._changed()
+
+    def move(self, job_id, offset):
+        """Moves a job `offset` places towards the end of the queue (negative: towards the front)."""
+        with self._lock:
+            job = self._find(job_id)
+            index = self.jobs.index(job)
+            new_index = max(0, min(len(self.jobs) - 1, index + offset))
+            if new_index != index:
+                self.jobs.insert(new_index, self.jobs.pop(index))
+                self._changed()
+
+    def set_status(self, job_id, status, **fields):
+        if status not in JOB_STATUSES:
+            raise ValueError(f"Unknown job status: {status}")
+        with self._lock:
+            job = self._find(job_id)
+            job['status'] = status
+            job.update(fields)
+            self._changed()
+
+    def next_queued(self):
+        """The first queued job in queue order, or None."""
+        with self._lock:
+            for job in self.jobs:
+                if job['status'] == "queued":
+                    return dict(job)
+        return None
+
+    def _find(self, job_id):
+        for job in self.jobs:
+            if job['id'] == job_id:
+                return job
+        raise KeyError(f"No job {job_id}")
+
+    def _changed(self):
+        self._save()
+        if self.on_change:
+            self.on_change()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': JOB_QUEUE_VERSION, 'jobs': self.jobs}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+
+
+class JobRunner:
+    """
+    Runs the jobs of a JobQueue in queue order, up to `parallel` at once, until none is queued.
+    make_pipeline(job) returns (DownloadPipeline, keyword arguments for its run()); pipelines
+    should share one SlotPool and BandwidthLimiter. A finished job is "done" when every selected
+    file downloaded and "failed" otherwise, also when its page could not be scraped or no file
+    was discovered; paused jobs wait until resume().
+    """
+
+    def __init__(self, job_queue, make_pipeline, parallel=JOB_PARALLEL, log=None):
+        self.queue = job_queue
+        self.make_pipeline = make_pipeline
+        self.parallel = max(1, parallel)
+        self.log = log or (lambda message, obj, tag="info": None)
+        self._cond = threading.Condition()
+        self._running = {}  # job id -> its pipeline (None while it is being created)
+        self._pausing = set()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts working through the queue in the background (no-op if already running)."""
+        with self._cond:
+            if self.running:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Blocks until the runner is idle: nothing queued is left, or stop() was called."""
+        if self._thread:
+            self._thread.join()
+
+    def pause(self, job_id):
+        """Pauses a job: a queued one is skipped, a running one stops and keeps its progress."""
+        with self._cond:
+            if job_id in self._running:
+                self._pausing.add(job_id)
+                if self._running[job_id]:
+                    self._running[job_id].stop()
+                return
+        self.queue.set_status(job_id, "paused")
+
+    def resume(self, job_id):
+        """Queues a paused or failed job again, in its current position."""
+        self.queue.set_status(job_id, "queued")
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self):
+        """Stops every running job (they are queued again, to resume later) and starts no new ones."""
+        with self._cond:
+            self._stopping = True
+            for pipeline in self._running.values():
+                if pipeline:
+                    pipeline.stop()
+            self._cond.notify_all()
+
+    def _loop(self):
+        threads = []
+        with self._cond:
+            while not self._stopping:
+                while len(self._running) < self.parallel:
+                    job = self.queue.next_queued()
+                    if job is None:
+                        break
+                    self._running[job['id']] = None
+                    self.queue.set_status(job['id'], "running")
+                    thread = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job['id']}",
+                                              daemon=True)
+                    threads.append(thread)
+                    thread.start()
+                if not self._running:
+                    break  # Nothing running and nothing queued
+                self._cond.wait()
+        for thread in threads:
+            thread.join()
+
+    def _run_job(self, job):
+        summary = None
+        try:
+            os.makedirs(job['folder'], exist_ok=True)
+            pipeline, run_kwargs = self.make_pipeline(job)
+            with self._cond:
+                self._running[job['id']] = pipeline
+                if self._stopping or job['id'] in self._pausing:
+                    pipeline.stop()
+            self.log(f"Starting job {job['id']}", job['url'], "info")
+            summary = pipeline.run(job['url'], **run_kwargs)
+        except Exception as e:
+            self.log(f"Job {job['id']} failed", str(e), "error")
+
+        with self._cond:
+            del self._running[job['id']]
+            if job['id'] in self._pausing:
+                self._pausing.discard(job['id'])
+                status = "paused"
+            elif self._stopping:
+                status = "queued"
+            elif (summary is None or not summary['discovered'] or summary['failed']
+                  or summary['completed'] < summary['selected']):
+                status = "failed"  # Also when the page could not be scraped or listed no files
+            else:
+                status = "done"
+            self.queue.set_status(job['id'], status, summary=summary)
+            self._cond.notify_all()
+        self.log(f"Job {job['id']} {status}", job['url'], "done" if status == "done" else "info")
@@ -0,0 +1,226 @@
+"""
+Counters, gauges and histograms showing where the time of a run goes: page discovery and
+parsing, time to first byte and connection setup per host, HTTP statuses and retries, stream
+and aggregate download rates, and disk write latency.
+
+Every pipeline run records into its own Metrics, written as a JSON run report next to the
+session state when the run ends. A run's Metrics also forwards everything to a parent: the
+process-wide Metrics that MetricsServer serves in the Prometheus text format on a local
+/metrics endpoint, so a scraper sees totals over every run of the process.
+"""
+
+import json
+import os
+import threading
+
+METRICS_PREFIX = "ffdownloader_"
+METRICS_HOST = "127.0.0.1"  # The endpoint is only meant for the local machine
+REPORT_VERSION = 1
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PARSE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+DISK_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+RATE_BUCKETS = tuple(2 ** n * 64 * 1024 for n in range(0, 13, 2))  # 64 KiB/s ... 256 MiB/s
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'discovery_page_seconds': ("histogram", "Time to resolve one file page: request, transfer and parse",
+                               LATENCY_BUCKETS),
+    'parse_seconds': ("histogram", "Time spent parsing pages (not waiting for them), by page kind", PARSE_BUCKETS),
+    'http_ttfb_seconds': ("histogram", "Time from sending a request to its response headers, by host",
+                          LATENCY_BUCKETS),
+    'http_connect_seconds': ("histogram", "Time to open a connection (DNS lookup, TCP and TLS), by host",
+                             LATENCY_BUCKETS),
+    'http_responses_total': ("counter", "HTTP responses by method and status", None),
+    'http_errors_total': ("counter", "Requests that failed without a response, by exception", None),
+    'http_retries_total': ("counter", "Requests repeated by the HTTP layer after connection errors or 429/5xx", None),
+    'stream_bytes_per_second': ("histogram", "Average rate of each response body streamed to disk", RATE_BUCKETS),
+    'download_bytes_total': ("counter", "Bytes downloaded and written to disk", None),
+    'download_rate_bytes_per_second': ("gauge", "Combined download rate of the running downloads", None),
+    'disk_write_seconds': ("histogram", "Time of each write to a download file", DISK_BUCKETS),
+    'download_retries_total': ("counter", "Downloads continued or repeated, by reason", None),
+    'files_total': ("counter", "Finished downloads by result", None),
+}
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+class Metrics:
+    """
+    Thread-safe store of the METRICS above, keyed by name and labels (keyword arguments).
+    Everything recorded is passed on to `parent` as well.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self._values = {}  # (name, ((label, value), ...)) -> float, or _Histogram
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.parent:
+            self.parent.inc(name, amount, **labels)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+        if self.parent:
+            self.parent.set(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _Histogram(buckets)
+            index = 0
+            while index < len(buckets) and value > buckets[index]:
+                index += 1
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+            histogram.max = max(histogram.max, value)
+        if self.parent:
+            self.parent.observe(name, value, **labels)
+
+    def _items(self):
+        """(name, labels, value) of everything recorded, grouped by name in METRICS order."""
+        with self._lock:
+            items = [(name, labels, value if not isinstance(value, _Histogram) else _copy_histogram(value))
+                     for (name, labels), value in self._values.items()]
+        order = list(METRICS)
+        return sorted(items, key=lambda item: (order.index(item[0]), item[1]))
+
+    def render(self):
+        """Everything recorded, in the Prometheus text exposition format."""
+        lines = []
+        current = None
+        for name, labels, value in self._items():
+            kind, help_text, buckets = METRICS[name]
+            full_name = METRICS_PREFIX + name
+            if name != current:
+                current = name
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+            if kind != "histogram":
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), value.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else _format_number(bound)
+                lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_number(value.sum)}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """Everything recorded as JSON-friendly dicts: {name: [{labels..., value} or {labels..., count, ...}]}."""
+        report = {}
+        for name, labels, value in self._items():
+            entry = dict(labels)
+            if isinstance(value, _Histogram):
+                buckets = METRICS[name][2]
+                entry.update(count=value.count, sum=round(value.sum, 6),
+                             mean=round(value.sum / value.count, 6) if value.count else 0, max=round(value.max, 6),
+                             p50=_quantile(buckets, value, 0.5), p95=_quantile(buckets, value, 0.95))
+            else:
+                entry['value'] = value
+            report.setdefault(name, []).append(entry)
+        return report
+
+
+def _copy_histogram(histogram):
+    copy = _Histogram(())
+    copy.counts = list(histogram.counts)
+    copy.sum, copy.count, copy.max = histogram.sum, histogram.count, histogram.max
+    return copy
+
+
+def _quantile(buckets, histogram, q):
+    """Upper bound of the bucket holding the q-quantile (the maximum for the +Inf bucket)."""
+    if not histogram.count:
+        return 0
+    seen = 0
+    for bound, count in zip(buckets, histogram.counts):
+        seen += count
+        if seen >= q * histogram.count:
+            return round(min(bound, histogram.max), 6)
+    return round(histogram.max, 6)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_report(path, report):
+    """Writes a run report as JSON through a temp file + rename, so a reader never sees half of it."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(report, version=REPORT_VERSION), f, indent=1)
+    os.replace(tmp_path, path)
+
+
+class MetricsServer:
+    """Serves `metrics` in the Prometheus text format at http://host:port/metrics, from a daemon thread."""
+
+    def __init__(self, metrics, port, host=METRICS_HOST):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self._httpd = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        """Binds the port (raises OSError if it is taken) and starts serving. Returns self."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only when the endpoint is wanted
+
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
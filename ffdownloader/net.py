@@ -0,0 +1,198 @@
+"""
+Shared HTTP layer: one pooled requests.Session per run with keep-alive, retries and timeouts,
+plus per-host handshake and latency counters to confirm the pooling works. With a
+metrics.Metrics the same timings, every response status, failed requests and retries are
+recorded there too.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+HTTP_CONNECT_TIMEOUT = 10  # Seconds to establish a connection (TCP + TLS)
+HTTP_READ_TIMEOUT = 60  # Seconds to wait for the next bytes from the server
+HTTP_RETRIES = 4  # Retries for connection errors and the statuses below
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_BACKOFF_FACTOR = 0.5  # Waits 0.5s, 1s, 2s, 4s... between retries (Retry-After wins when sent)
+HTTP_BACKOFF_MAX = 60
+URL_EXPIRED_STATUSES = (403, 410)  # What fuckingfast.co answers once a signed direct URL expired
+
+
+class UrlExpired(Exception):
+    """Raised when a direct download URL is rejected as expired, so the caller can resolve a fresh one."""
+
+    def __init__(self, status):
+        super().__init__(f"Status {status}, the download link expired")
+        self.status = status
+
+
+class HostStats:
+    """
+    Per-host connection and latency counters, used to check that pooling actually reuses connections.
+    Handshake and latency times also go to the http_connect_seconds / http_ttfb_seconds histograms
+    of `metrics`, if given.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = {'handshakes': 0, 'handshake_time': 0.0, 'requests': 0,
+                                         'latency_total': 0.0, 'latency_max': 0.0}
+        return entry
+
+    def record_handshake(self, host, seconds):
+        with self._lock:
+            entry = self._host(host)
+            entry['handshakes'] += 1
+            entry['handshake_time'] += seconds
+        if self.metrics:
+            self.metrics.observe('http_connect_seconds', seconds, host=host)
+
+    def record_request(self, host, seconds):
+        with self._lock:
+            entry = self._host(host)
+            entry['requests'] += 1
+            entry['latency_total'] += seconds
+            entry['latency_max'] = max(entry['latency_max'], seconds)
+        if self.metrics:
+            self.metrics.observe('http_ttfb_seconds', seconds, host=host)
+
+    def snapshot(self):
+        """Returns {host: {handshakes, requests, avg_handshake_ms, avg_latency_ms, max_latency_ms}}."""
+        with self._lock:
+            return {
+                host: {
+                    'handshakes': e['handshakes'],
+                    'requests': e['requests'],
+                    'avg_handshake_ms': round(e['handshake_time'] / e['handshakes'] * 1000, 1) if e['handshakes'] else 0,
+                    'avg_latency_ms': round(e['latency_total'] / e['requests'] * 1000, 1) if e['requests'] else 0,
+                    'max_latency_ms': round(e['latency_max'] * 1000, 1),
+                }
+                for host, e in self._hosts.items()
+            }
+
+    def log_summary(self, log):
+        """Logs one line per host with its handshake count and latency."""
+        for host, s in self.snapshot().items():
+            log(f"Connections to {host}",
+                f"{s['handshakes']} handshakes for {s['requests']} requests, "
+                f"avg handshake {s['avg_handshake_ms']}ms, avg latency {s['avg_latency_ms']}ms "
+                f"(max {s['max_latency_ms']}ms)", "info")
+
+
+class _Retry(Retry):
+    """Retry with HTTP_BACKOFF_MAX as the longest wait on urllib3 1.x, which reads it from the class on every retry."""
+
+    DEFAULT_BACKOFF_MAX = HTTP_BACKOFF_MAX
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new TCP/TLS connection to a HostStats."""
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self.stats
+
+        def counting(connection_cls):
+            class CountingConnection(connection_cls):
+                def connect(self):
+                    started = time.monotonic()
+                    super().connect()
+                    stats.record_handshake(self.host, time.monotonic() - started)
+            return CountingConnection
+
+        class CountingHTTPPool(HTTPConnectionPool):
+            ConnectionCls = counting(HTTPConnection)
+
+        class CountingHTTPSPool(HTTPSConnectionPool):
+            ConnectionCls = counting(HTTPSConnection)
+
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPPool, 'https': CountingHTTPSPool}
+
+
+class HttpClient:
+    """
+    One requests.Session shared by every request of a run.
+    Connections are kept alive and pooled (`pool_size` per host), connection errors and
+    HTTP_RETRY_STATUSES are retried with exponential backoff (honouring Retry-After),
+    and every request gets a (connect, read) timeout unless the caller passes its own.
+    `metrics` (a metrics.Metrics, or None) is also used by the code downloading through this client.
+    """
+
+    def __init__(self, headers=None, pool_size=10, retries=HTTP_RETRIES,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), metrics=None):
+        self.timeout = timeout
+        self.metrics = metrics
+        self.stats = HostStats(metrics)
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+
+        settings = dict(
+            total=retries,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # After the last retry hand back the response, callers check the status
+        )
+        try:
+            retry = _Retry(backoff_max=HTTP_BACKOFF_MAX, **settings)  # urllib3 2.x
+        except TypeError:
+            retry = _Retry(**settings)  # urllib3 1.x, capped by the class attribute
+        adapter = _CountingAdapter(self.stats, pool_connections=10, pool_maxsize=max(1, pool_size),
+                                   max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if self.metrics:
+                self.metrics.inc('http_errors_total', error=type(e).__name__)
+            raise
+        # Time until the response headers arrived (the body may still be streaming)
+        self.stats.record_request(urlsplit(url).hostname or url, time.monotonic() - started)
+        if self.metrics:
+            self.metrics.inc('http_responses_total', method=method, status=str(response.status_code))
+            retries = getattr(response.raw, 'retries', None)  # urllib3's Retry, its history lists every retry
+            if retries and retries.history:
+                self.metrics.inc('http_retries_total', len(retries.history))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def log_stats(self, log):
+        """Logs one line per host with its handshake count and latency."""
+        self.stats.log_summary(log)
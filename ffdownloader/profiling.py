@@ -0,0 +1,255 @@
+"""
+Opt-in profiling of a pipeline run, for finding out where the time of a slow run went.
+
+A RunProfiler passed to DownloadPipeline as `profiler` is started when the run starts and
+follows its "phase" events (scrape, discover, select, download). For every phase it records the
+wall time and the CPU time of the process: a phase with much more wall than CPU time waited, on
+the network, the disk or, for "select", the user. Front ends add their own measurements with
+sample(), e.g. how late the Tk event loop draws its frames.
+
+Two heavier tools can be switched on as well:
+
+    cpu=True     cProfile on the run's thread and every thread it starts, merged into one
+                 pstats file, plus a sampler that takes the Python stack of every thread each
+                 PROFILE_SAMPLE_INTERVAL. The samples are written as collapsed stacks
+                 ("thread;outer;...;inner count"), the input of flamegraph.pl and speedscope,
+                 and show where threads wait as well as where they compute.
+    memory=True  tracemalloc, with the current and peak traced memory per phase and the
+                 PROFILE_MEMORY_TOP lines holding the most memory at the end of the phase
+                 that held the most.
+
+write() saves the bundle in a folder next to the session state (see session.profile_dir_path):
+
+    profile.json         phases, samples and settings
+    cpu.pstats           python -m pstats cpu.pstats
+    stacks.collapsed     flamegraph.pl stacks.collapsed > flame.svg
+    memory_top.txt
+
+cProfile and tracemalloc measure the whole process, so only one profiler uses them at a time;
+another one running at the same time (parallel queue jobs) only times its phases.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+PROFILE_SAMPLE_INTERVAL = 0.01  # Seconds between two stack samples of every thread
+PROFILE_MEMORY_TOP = 30  # Allocation sites listed in memory_top.txt
+PROFILE_TRACE_FRAMES = 1  # Frames tracemalloc keeps per allocation, more makes every allocation slower
+PROFILE_STACK_DEPTH = 64  # Innermost frames kept per stack sample
+
+_tools_lock = threading.Lock()  # Held by the profiler running cProfile and tracemalloc
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_group(name):
+    """Worker threads of one pool share a flame graph root ("discovery_3" -> "discovery")."""
+    return re.sub(r"[-_ ]?\d+(?: \(.*\))?$", "", name) or name
+
+
+class RunProfiler:
+    """Timers per phase, optionally cProfile, stack samples and tracemalloc, for one pipeline run."""
+
+    def __init__(self, cpu=False, memory=False, sample_interval=PROFILE_SAMPLE_INTERVAL,
+                 memory_top=PROFILE_MEMORY_TOP):
+        self.cpu = cpu
+        self.memory = memory
+        self.sample_interval = sample_interval
+        self.memory_top = memory_top
+        self._lock = threading.Lock()
+        self._phases = []  # {'phase', 'started', 'cpu_started', ...} per phase, in order
+        self._samples = {}  # name -> [count, sum, max] of sample()
+        self._profiles = []  # One cProfile.Profile per profiled thread
+        self._stacks = {}  # collapsed stack -> number of samples
+        self._sampler = None
+        self._sampling = threading.Event()
+        self._owns_tools = False
+        self._started_tracing = False
+        self._memory_snapshot = None  # (phase, tracemalloc.Snapshot)
+        self._memory_held = -1
+        self._started = None
+        self._seconds = None
+
+    # --- Run ---
+
+    def start(self):
+        """Starts measuring. Returns self."""
+        self._started = time.time()
+        if (self.cpu or self.memory) and _tools_lock.acquire(blocking=False):
+            self._owns_tools = True
+            if self.memory:
+                import tracemalloc  # Only when memory tracing was asked for
+
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(PROFILE_TRACE_FRAMES)
+                    self._started_tracing = True
+            if self.cpu:
+                self._start_cpu()
+        self.phase("start")
+        return self
+
+    def _start_cpu(self):
+        import cProfile
+
+        def hook(frame, event, arg):
+            # The first event of a thread started during the run: replace this hook by a profiler of its own
+            sys.setprofile(None)
+            self._enable_profile(cProfile.Profile())
+
+        threading.setprofile(hook)
+        self._enable_profile(cProfile.Profile())
+        self._sampling.clear()
+        self._sampler = threading.Thread(target=self._sample_stacks, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def _enable_profile(self, profile):
+        try:
+            profile.enable()
+        except ValueError:
+            return  # Python 3.12+ has one profiler per process, which already sees this thread
+        with self._lock:
+            self._profiles.append(profile)
+
+    def phase(self, phase):
+        """Ends the current phase and starts `phase` (the pipeline's "phase" events)."""
+        if self._seconds is not None:
+            return  # Stopped
+        now, cpu_now = time.monotonic(), time.process_time()
+        with self._lock:
+            ended = self._phases[-1] if self._phases else None
+            if ended:
+                ended['seconds'] = round(now - ended['started'], 4)
+                ended['cpu_seconds'] = round(cpu_now - ended['cpu_started'], 4)
+        if ended and self._tracing():
+            import tracemalloc
+
+            ended['memory_current'], ended['memory_peak'] = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            if ended['memory_current'] > self._memory_held:
+                # The allocation sites are listed as of the end of the phase that held the most memory
+                self._memory_held = ended['memory_current']
+                self._memory_snapshot = (ended['phase'], tracemalloc.take_snapshot())
+        with self._lock:
+            # Started after the snapshot, which takes a while with many allocations and is no part of any phase
+            self._phases.append({'phase': phase, 'started': time.monotonic(), 'cpu_started': time.process_time()})
+
+    def _tracing(self):
+        if not (self.memory and self._owns_tools):
+            return False
+        import tracemalloc
+
+        return tracemalloc.is_tracing()
+
+    def sample(self, name, value):
+        """Adds one measurement of `name`, e.g. the lag of a GUI frame; profile.json has count, mean and max."""
+        with self._lock:
+            entry = self._samples.setdefault(name, [0, 0.0, value])
+            entry[0] += 1
+            entry[1] += value
+            entry[2] = max(entry[2], value)
+
+    def stop(self):
+        """Stops measuring (on the thread that called start()); the results stay for write()."""
+        if self._started is None or self._seconds is not None:
+            return
+        self.phase("stopped")
+        self._seconds = time.time() - self._started
+        if not self._owns_tools:
+            return
+        if self.cpu:
+            threading.setprofile(None)
+            self._sampling.set()
+            self._sampler.join()
+            with self._lock:
+                profiles = list(self._profiles)
+            for profile in profiles:
+                profile.disable()  # Only disables the calling thread; the other threads' runs are over
+        if self._started_tracing:
+            import tracemalloc
+
+            tracemalloc.stop()
+        self._owns_tools = False
+        _tools_lock.release()
+
+    def _sample_stacks(self):
+        own = threading.get_ident()
+        while not self._sampling.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < PROFILE_STACK_DEPTH:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(_thread_group(names.get(ident, str(ident))))
+                stack = ";".join(reversed(labels))
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    # --- Results ---
+
+    def report(self):
+        """The phases and samples as a dict (what profile.json holds)."""
+        with self._lock:
+            phases = [{key: value for key, value in entry.items() if key not in ('started', 'cpu_started')}
+                      for entry in self._phases if 'seconds' in entry and entry['phase'] != "start"]
+            samples = {name: {'count': count, 'mean': total / count, 'max': peak}
+                       for name, (count, total, peak) in self._samples.items()}
+        return {
+            'started': round(self._started, 3) if self._started else None,
+            'seconds': round(self._seconds, 3) if self._seconds is not None else None,
+            'cpu': bool(self._profiles),  # False as well when another profiler had the tools
+            'memory': self._memory_snapshot is not None,
+            'sample_interval': self.sample_interval,
+            'phases': phases,
+            'samples': samples,
+        }
+
+    def write(self, folder):
+        """Saves the bundle (see the module docstring) into `folder`. Returns the paths written."""
+        os.makedirs(folder, exist_ok=True)
+        written = []
+
+        path = os.path.join(folder, "profile.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=1)
+        written.append(path)
+
+        if self._profiles:
+            import pstats
+
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            path = os.path.join(folder, "cpu.pstats")
+            stats.dump_stats(path)
+            written.append(path)
+
+        if self._stacks:
+            path = os.path.join(folder, "stacks.collapsed")
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self._stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            written.append(path)
+
+        if self._memory_snapshot is not None:
+            import tracemalloc
+
+            phase, snapshot = self._memory_snapshot
+            path = os.path.join(folder, "memory_top.txt")
+            top = snapshot.filter_traces([tracemalloc.Filter(False, __file__),
+                                          tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"Top {min(self.memory_top, len(top))} of {len(top)} allocation sites at the end of the "
+                        f"{phase} phase, {sum(stat.size for stat in top) / 1024 / 1024:.1f} MiB in total\n\n")
+                for stat in top[:self.memory_top]:
+                    frame = stat.traceback[0]
+                    f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+            written.append(path)
+        return written
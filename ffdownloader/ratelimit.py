@@ -0,0 +1,229 @@
+"""
+Bandwidth limiting for every download stream of a run.
+
+One TokenBucket holds the global limit and every file gets its own bucket for the per-file
+limit. Reads are charged to both after they happen, and a reader that overdraws a bucket
+sleeps until the debt is paid. Readers that come later see the debt left by earlier ones and
+wait their turn, so several connections share the rate evenly. Chunks are capped at
+RATE_LIMIT_SLICE seconds' worth of the rate, so a stream moves a little data often and never
+a large burst followed by a long pause.
+
+The global limit can follow a time-of-day RateSchedule ("09:00-18:00=2M" means 2 MiB/s during
+office hours). Every limit can be changed while downloads run.
+"""
+
+import datetime
+import re
+import threading
+import time
+
+RATE_LIMIT_BURST = 0.25  # Seconds of unused rate a bucket may save up for a burst
+RATE_LIMIT_SLICE = 0.1  # Reads are capped at this many seconds' worth of the current rate
+RATE_LIMIT_MIN_CHUNK = 16 * 1024  # Smallest read a limit shrinks chunks to
+SCHEDULE_CHECK_INTERVAL = 1.0  # Seconds between re-evaluations of the schedule
+
+_RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$', re.IGNORECASE)
+_WINDOW_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)$')
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text):
+    """
+    Bytes per second from "2M", "500K", "1.5MB/s" or a plain byte count (binary units).
+    "", "0", "none" and "unlimited" mean no limit (None). Raises ValueError otherwise.
+    """
+    text = (text or "").strip()
+    if text.lower() in ("", "none", "unlimited", "off"):
+        return None
+    match = _RATE_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r} (use e.g. 500K, 2M or 1.5MB/s)")
+    rate = float(match.group(1)) * _UNITS[match.group(2).lower()]
+    return rate or None
+
+
+def parse_limits(text):
+    """
+    Reads limits written as whitespace separated words: a RATE (the global limit),
+    "per-file=RATE" and any number of "HH:MM-HH:MM=RATE" schedule windows, e.g.
+    "0 per-file=1M 09:00-18:00=2M". Returns keyword arguments for BandwidthLimiter.set_limits().
+    """
+    limits = {'rate': None, 'per_file_rate': None}
+    windows = []
+    for word in text.split():
+        if word.lower().startswith("per-file="):
+            limits['per_file_rate'] = parse_rate(word.partition("=")[2])
+        elif "=" in word:
+            windows.append(word)
+        else:
+            limits['rate'] = parse_rate(word)
+    limits['schedule'] = RateSchedule.parse(windows)
+    return limits
+
+
+def format_rate(rate):
+    return "unlimited" if not rate else f"{rate / 1024 / 1024:.2f} MB/s"
+
+
+class RateSchedule:
+    """
+    Time-of-day windows with their own rate: [(start, end, rate)] with datetime.time bounds.
+    A window whose end is before its start runs over midnight. The first matching window wins.
+    """
+
+    def __init__(self, windows=()):
+        self.windows = list(windows)
+
+    def __bool__(self):
+        return bool(self.windows)
+
+    @classmethod
+    def parse(cls, specs):
+        """Builds a schedule from "HH:MM-HH:MM=RATE" strings (or one comma separated string)."""
+        if isinstance(specs, str):
+            specs = specs.split(",")
+        windows = []
+        for spec in specs:
+            if not spec.strip():
+                continue
+            match = _WINDOW_RE.match(spec)
+            if not match:
+                raise ValueError(f"Invalid schedule window: {spec!r} (use e.g. 09:00-18:00=2M)")
+            h1, m1, h2, m2, rate = match.groups()
+            try:
+                start, end = datetime.time(int(h1), int(m1)), datetime.time(int(h2), int(m2))
+            except ValueError:
+                raise ValueError(f"Invalid time in schedule window: {spec!r}") from None
+            windows.append((start, end, parse_rate(rate)))
+        return cls(windows)
+
+    def rate_at(self, moment, default=None):
+        """The rate in force at `moment` (a datetime), or `default` outside every window."""
+        now = moment.time()
+        for start, end, rate in self.windows:
+            if (start <= now < end) if start <= end else (now >= start or now < end):
+                return rate
+        return default
+
+    def describe(self):
+        return ", ".join(f"{start:%H:%M}-{end:%H:%M}={format_rate(rate)}" for start, end, rate in self.windows)
+
+
+class TokenBucket:
+    """Thread-safe token bucket in bytes; rate=None lets everything through."""
+
+    def __init__(self, rate=None, burst_seconds=RATE_LIMIT_BURST):
+        self.burst_seconds = burst_seconds
+        self.rate = None
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            rate = rate or None
+            if rate != self.rate:
+                self.rate = rate
+                self._tokens = 0.0  # Start the new rate without saved-up burst or old debt
+                self._last = time.monotonic()
+
+    def reserve(self, nbytes):
+        """Charges `nbytes` and returns the seconds the caller has to wait to stay within the rate."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.rate * self.burst_seconds, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, nbytes):
+        """Blocks until `nbytes` fit in the rate."""
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BandwidthLimiter:
+    """
+    The limits of one run: a global `rate` (bytes/s, None for unlimited), optionally replaced by
+    `schedule` inside its windows, and a `per_file_rate` each file is held to on its own.
+    Thread-safe; change the limits at any time with set_limits().
+    """
+
+    def __init__(self, rate=None, per_file_rate=None, schedule=None):
+        self.rate = None
+        self.per_file_rate = None
+        self.schedule = RateSchedule()
+        self._bucket = TokenBucket()
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self.set_limits(rate=rate, per_file_rate=per_file_rate, schedule=schedule or RateSchedule())
+
+    def set_limits(self, rate=..., per_file_rate=..., schedule=...):
+        """Changes any of the limits (arguments left out stay as they are)."""
+        with self._lock:
+            if rate is not ...:
+                self.rate = rate or None
+            if per_file_rate is not ...:
+                self.per_file_rate = per_file_rate or None
+            if schedule is not ...:
+                self.schedule = schedule or RateSchedule()
+            self._next_check = 0.0  # Apply on the next read
+
+    def current_rate(self):
+        """The global rate in force right now."""
+        with self._lock:
+            return self.schedule.rate_at(datetime.datetime.now(), self.rate) if self.schedule else self.rate
+
+    @property
+    def active(self):
+        return bool(self.rate or self.per_file_rate or self.schedule)
+
+    def describe(self):
+        parts = [f"global {format_rate(self.rate)}"]
+        if self.schedule:
+            parts.append(f"schedule {self.schedule.describe()}")
+        if self.per_file_rate:
+            parts.append(f"per file {format_rate(self.per_file_rate)}")
+        return ", ".join(parts)
+
+    def for_file(self):
+        """A FileThrottle for one download; all its connections share it."""
+        return FileThrottle(self)
+
+    def global_bucket(self):
+        """The shared bucket, its rate refreshed from the schedule at most every SCHEDULE_CHECK_INTERVAL."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + SCHEDULE_CHECK_INTERVAL
+            self._bucket.set_rate(self.current_rate())
+        return self._bucket
+
+
+class FileThrottle:
+    """Charges the reads of one file to its own per-file bucket and to the limiter's global bucket."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self._bucket = TokenBucket()
+
+    def chunk_size(self, size):
+        """Caps a read of `size` bytes to RATE_LIMIT_SLICE seconds' worth of the tightest limit."""
+        self._bucket.set_rate(self.limiter.per_file_rate)
+        rates = [rate for rate in (self.limiter.global_bucket().rate, self._bucket.rate) if rate]
+        if not rates:
+            return size
+        return max(RATE_LIMIT_MIN_CHUNK, min(size, int(min(rates) * RATE_LIMIT_SLICE)))
+
+    def reserve(self, nbytes):
+        """Charges `nbytes` just read to both limits and returns the seconds to wait before the next read."""
+        return max(self._bucket.reserve(nbytes), self.limiter.global_bucket().reserve(nbytes))
+
+    def consume(self, nbytes):
+        """Blocks until `nbytes` just read fit in both limits."""
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,256 @@
+"""
+Phase 3: running the downloads of many files at once.
+"""
+
+import collections
+import threading
+import time
+from urllib.parse import urlsplit
+
+DOWNLOAD_WORKERS = 3  # Files downloaded at the same time
+DOWNLOAD_PER_HOST = 3  # Max files downloaded at the same time from a single host
+DOWNLOAD_ORDER = "largest"  # Default start order, see DownloadScheduler.ORDERS
+DOWNLOAD_RETRIES = 2  # Times a file asking for a retry (e.g. failed its checksum) is queued again
+
+
+class ThroughputMeter:
+    """Thread-safe byte counter that reports a moving-average transfer rate."""
+
+    def __init__(self, window=3.0):
+        self.window = window
+        self.total_bytes = 0
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        now = time.monotonic()
+        with self._lock:
+            self.total_bytes += nbytes
+            self._samples.append((now, nbytes))
+            self._trim(now)
+
+    def rate(self):
+        """Bytes per second over the last `window` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if not self._samples:
+                return 0.0
+            span = max(now - self._samples[0][0], 0.5)
+            return sum(n for _, n in self._samples) / span
+
+    def _trim(self, now):
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+
+class SlotPool:
+    """
+    Download slot numbers shared by several schedulers, so runs going on at the same time (e.g.
+    the jobs of a queue) stay within one global worker budget and report progress per slot.
+    """
+
+    def __init__(self, size=DOWNLOAD_WORKERS):
+        self.size = max(1, size)
+        self._free = list(range(self.size))
+        self._cond = threading.Condition()
+
+    def acquire(self, cancelled=lambda: False):
+        """Waits for a free slot and returns its number, or None once cancelled() is true."""
+        with self._cond:
+            while not self._free:
+                if cancelled():
+                    return None
+                self._cond.wait(0.5)
+            return self._free.pop(0)
+
+    def release(self, slot):
+        with self._cond:
+            self._free.append(slot)
+            self._free.sort()
+            self._cond.notify()
+
+
+class DownloadScheduler:
+    """
+    Runs the download of many files on a fixed number of worker slots.
+    At most `max_workers` files run at once, and at most `per_host` of them
+    against the same host. Files are started in `order`:
+      - "selection": the order the user selected them in
+      - "largest":   largest known 'size' first, i.e. longest-processing-time first, so no big
+                     file starts last and keeps one slot busy after the others ran dry
+      - "smallest":  smallest known 'size' first
+    Files of unknown size keep their selection order, after the sized ones.
+    A download_func that returns RETRY puts its file back at the end of the queue, up to
+    `retries` times, after which it counts as failed. One that returns STOPPED was interrupted
+    by stop(); it is reported to on_finished with success=None and not counted.
+    Files can also arrive while downloads run, through a bounded queue.Queue `feed` ended by None.
+    With a shared SlotPool every download also needs one of its slots, and progress is reported
+    under that slot's number instead of the worker's.
+    """
+
+    ORDERS = ("largest", "selection", "smallest")
+    RETRY = "retry"
+    STOPPED = "stopped"
+
+    def __init__(self, download_func, max_workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_PER_HOST,
+                 order=DOWNLOAD_ORDER, log=None, on_progress=None, on_finished=None, retries=DOWNLOAD_RETRIES,
+                 slot_pool=None):
+        if order not in self.ORDERS:
+            raise ValueError(f"Unknown download order: {order}")
+        self.download_func = download_func  # download_func(file_info, progress) -> bool or RETRY
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.order = order
+        self.log = log or (lambda message, obj, tag="info": None)
+        self.on_progress = on_progress  # on_progress(slot, current_bytes, total_bytes, filename)
+        self.on_finished = on_finished  # on_finished(slot, file_info, success)
+        self.retries = max(0, retries)
+        self.slot_pool = slot_pool
+        self.meter = ThroughputMeter()
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._active_per_host = collections.Counter()
+        self._slot_bytes = {}
+        self._attempts = collections.Counter()  # page link -> retries used
+        self._feeding = False
+        self._stopped = False
+
+    def prioritize(self, files):
+        """Returns `files` sorted by the configured priority order."""
+        if self.order == "largest":
+            return sorted(files, key=lambda f: (f.get('size') is None, -(f.get('size') or 0)))
+        if self.order == "smallest":
+            return sorted(files, key=lambda f: (f.get('size') is None, f.get('size') or 0))
+        return list(files)
+
+    def stop(self):
+        """Starts no further downloads; run() returns once the running ones gave up (see STOPPED)."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def run(self, files=(), feed=None):
+        """
+        Downloads every file in `files`, plus everything put on `feed` until it yields None,
+        blocking until all workers are done.
+        """
+        self._pending = self.prioritize(files)
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._feeding = feed is not None
+        worker_count = self.max_workers if feed is not None else min(self.max_workers, len(self._pending))
+        workers = [
+            threading.Thread(target=self._worker, args=(slot,), name=f"download-{slot}", daemon=True)
+            for slot in range(worker_count)
+        ]
+        if feed is not None:
+            workers.append(threading.Thread(target=self._feed, args=(feed,), name="download-feed", daemon=True))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def _feed(self, feed):
+        """Moves files from `feed` to the pending list, taking only what idle workers can start."""
+        while True:
+            with self._cond:
+                # Leaving the rest in the bounded feed makes the producer wait instead of piling up files
+                while len(self._pending) >= self.max_workers and not self._stopped:
+                    self._cond.wait()
+            file_info = feed.get()
+            with self._cond:
+                if file_info is None:
+                    self._feeding = False
+                else:
+                    self._pending = self.prioritize(self._pending + [file_info])
+                self._cond.notify_all()
+            if file_info is None:
+                return
+
+    def _next_job(self):
+        """Pops the first pending file whose host still has a free slot, waiting if every host is busy."""
+        with self._cond:
+            while (self._pending or self._feeding) and not self._stopped:
+                for i, file_info in enumerate(self._pending):
+                    host = urlsplit(file_info['url']).netloc.lower()
+                    if self._active_per_host[host] < self.per_host:
+                        self._active_per_host[host] += 1
+                        file_info = self._pending.pop(i)
+                        self._cond.notify_all()  # The feed may hand over the next file now
+                        return file_info, host
+                self._cond.wait()
+            return None, None
+
+    def _release(self, host):
+        with self._cond:
+            self._active_per_host[host] -= 1
+            self._cond.notify_all()
+
+    def _report(self, slot, current_bytes, total_bytes, filename):
+        previous = self._slot_bytes.get(slot, 0)
+        self._slot_bytes[slot] = current_bytes
+        if current_bytes > previous:
+            self.meter.add(current_bytes - previous)
+        if self.on_progress:
+            self.on_progress(slot, current_bytes, total_bytes, filename)
+
+    def _worker(self, worker_slot):
+        while True:
+            file_info, host = self._next_job()
+            if file_info is None:
+                return
+            if not self.slot_pool:
+                self._download(worker_slot, file_info, host)
+                continue
+            slot = self.slot_pool.acquire(cancelled=lambda: self._stopped)
+            if slot is None:
+                self._release(host)
+                return
+            try:
+                self._download(slot, file_info, host)
+            finally:
+                self.slot_pool.release(slot)  # Only after on_finished, the next user of the slot reports on it
+
+    def _download(self, slot, file_info, host):
+        self._slot_bytes[slot] = 0
+        self.log(f"Worker {slot + 1} downloading...", file_info['name'], "info")
+        success = False
+        try:
+            success = self.download_func(
+                file_info, lambda current, total, name: self._report(slot, current, total, name))
+        except Exception as e:
+            self.log(f"Error processing link {file_info['page_link']}", str(e), "error")
+        finally:
+            self._release(host)
+
+        if success == self.STOPPED:
+            if self.on_finished:
+                self.on_finished(slot, file_info, None)
+            return
+
+        if success == self.RETRY:
+            with self._cond:
+                retry = self._attempts[file_info['page_link']] < self.retries
+                if retry:
+                    self._attempts[file_info['page_link']] += 1
+                    self.retried += 1
+                    self._pending.append(file_info)
+                    self._cond.notify_all()
+            if retry:
+                self.log("Queued again for another attempt", file_info['name'], "warning")
+                return
+            success = False
+
+        with self._cond:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if self.on_finished:
+            self.on_finished(slot, file_info, success)
@@ -0,0 +1,220 @@
+"""
+Multi-connection downloads of a single file using HTTP Range requests.
+"""
+
+import collections
+import queue
+import threading
+import time
+
+from ffdownloader.net import URL_EXPIRED_STATUSES, UrlExpired
+from ffdownloader.transfer import TransferStopped, copy_response, preallocate
+
+SEGMENT_MIN_SIZE = 32 * 1024 * 1024  # Files smaller than this always use one stream
+SEGMENT_PIECE_SIZE = 8 * 1024 * 1024  # Bytes fetched per Range request
+SEGMENT_START_CONNECTIONS = 2  # Connections opened per file right away
+SEGMENT_MAX_CONNECTIONS = 6  # Upper bound when adding connections adaptively
+SEGMENT_ADAPT_INTERVAL = 2.0  # Seconds between throughput checks
+SEGMENT_STOP_POLL = 0.1  # Seconds between checks of `stop` while the connections run
+SEGMENT_MIN_GAIN = 0.10  # An extra connection must raise throughput by 10% to keep growing
+SEGMENT_PIECE_RETRIES = 3  # Attempts per piece before the whole file fails
+
+
+class RangeNotSupported(Exception):
+    """Raised when the server ignores Range requests, so the caller can fall back to one stream."""
+
+
+class SegmentedDownloader:
+    """
+    Downloads one file over several connections using HTTP Range requests.
+    The file is split into `piece_size` pieces which connections pull from a shared queue and
+    write into a preallocated output file at their own offsets.
+    It starts with `start_connections` and adds one more every SEGMENT_ADAPT_INTERVAL seconds
+    while the extra connection still raises total throughput by at least SEGMENT_MIN_GAIN.
+    """
+
+    def __init__(self, url, output_path, total_size, http, progress, file_name, log,
+                 max_connections=SEGMENT_MAX_CONNECTIONS, start_connections=SEGMENT_START_CONNECTIONS,
+                 piece_size=SEGMENT_PIECE_SIZE, done_pieces=None, on_piece_done=None, throttle=None, stop=None):
+        self.url = url
+        self.output_path = output_path
+        self.total_size = total_size
+        self.http = http
+        self.progress = progress
+        self.file_name = file_name
+        self.log = log
+        self.max_connections = max(1, max_connections)
+        self.start_connections = max(1, min(start_connections, self.max_connections))
+        self.piece_size = max(256 * 1024, piece_size)
+        self.on_piece_done = on_piece_done  # on_piece_done(sorted list of finished piece offsets)
+        self.throttle = throttle  # Bandwidth limit shared by every connection of this file
+        self.stop = stop or threading.Event()  # Set from outside to pause the download
+
+        # Pieces already on disk from an earlier run (offsets) are not fetched again
+        self.done_pieces = set(done_pieces or ())
+        self.resuming = bool(self.done_pieces)
+        self.pieces = queue.Queue()
+        self.downloaded = 0
+        for start in range(0, total_size, self.piece_size):
+            end = min(start + self.piece_size, total_size) - 1
+            if start in self.done_pieces:
+                self.downloaded += end + 1 - start
+            else:
+                self.pieces.put((start, end))
+
+        self.connection_speeds = {}  # connection id -> bytes/s of its last finished piece
+        self.error = None
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._active = 0  # Connection threads still running
+        self._finished = threading.Event()  # Set when the last of them ends
+        self._piece_failures = collections.Counter()
+
+    def run(self):
+        """
+        Downloads the whole file. Raises RangeNotSupported, UrlExpired, TransferStopped (once `stop`
+        is set) or the first fatal error.
+        """
+        if not self.resuming:
+            with open(self.output_path, 'wb') as f:
+                preallocate(f, self.total_size)  # So every connection can write at its own offset
+
+        self.progress(self.downloaded, self.total_size, self.file_name)
+        connections = []
+        for _ in range(self.start_connections):
+            connections.append(self._start_connection(len(connections)))
+
+        last_rate = None
+        last_time, last_bytes = time.monotonic(), self.downloaded
+        next_check = last_time + SEGMENT_ADAPT_INTERVAL
+        growing = True
+        while not self._finished.is_set():
+            if self.stop.is_set():
+                self._abort.set()
+            if self._abort.is_set():
+                self._finished.wait()  # Each connection gives up after its current read
+                break
+            # Returns as soon as the last connection is done, not at the end of the interval
+            self._finished.wait(min(SEGMENT_STOP_POLL, max(0.0, next_check - time.monotonic())))
+            now = time.monotonic()
+            if now < next_check or self._finished.is_set():
+                continue
+            next_check = now + SEGMENT_ADAPT_INTERVAL
+            with self._lock:
+                rate = (self.downloaded - last_bytes) / (now - last_time)
+                last_time, last_bytes = now, self.downloaded
+
+            if not growing or self.pieces.empty():
+                continue
+            if last_rate is not None and rate < last_rate * (1 + SEGMENT_MIN_GAIN):
+                growing = False  # The last connection we added did not help, keep the current count
+                self.log(f"Segmented download settled on {len(connections)} connections",
+                         f"{self.file_name} ({rate / 1024 / 1024:.1f} MB/s)", "info")
+                continue
+            if len(connections) < self.max_connections:
+                last_rate = rate
+                connections.append(self._start_connection(len(connections)))
+
+        for connection in connections:
+            connection.join()
+        if self.stop.is_set() and self.downloaded != self.total_size:
+            raise TransferStopped(f"Stopped at {self.downloaded}/{self.total_size} bytes")
+        if self.error:
+            raise self.error
+        if self.downloaded != self.total_size:
+            raise IOError(f"Segmented download incomplete ({self.downloaded}/{self.total_size} bytes)")
+
+    def _start_connection(self, connection_id):
+        with self._lock:
+            self._active += 1
+            self._finished.clear()
+        thread = threading.Thread(target=self._connection_worker, args=(connection_id,),
+                                  name=f"segment-{connection_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def _connection_worker(self, connection_id):
+        try:
+            self._pull_pieces(connection_id)
+        finally:
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    self._finished.set()
+
+    def _pull_pieces(self, connection_id):
+        with open(self.output_path, 'r+b') as f:
+            while not self._abort.is_set():
+                try:
+                    start, end = self.pieces.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self._fetch_piece(f, connection_id, start, end)
+                except (RangeNotSupported, UrlExpired) as e:
+                    self._fail(e)
+                except Exception as e:
+                    self._piece_failures[start] += 1
+                    if self._piece_failures[start] > SEGMENT_PIECE_RETRIES:
+                        self._fail(e)
+                    else:
+                        if self.http.metrics:
+                            self.http.metrics.inc('download_retries_total', reason="piece")
+                        self.pieces.put((start, end))  # Let any connection retry it
+
+    def _fetch_piece(self, f, connection_id, start, end):
+        started = time.monotonic()
+        offset = start
+
+        def on_chunk(nbytes):
+            nonlocal offset
+            offset += nbytes
+            with self._lock:
+                self.downloaded += nbytes
+                downloaded = self.downloaded
+            self.progress(downloaded, self.total_size, self.file_name)
+
+        try:
+            with self.http.get(self.url, headers={'Range': f"bytes={start}-{end}"}, stream=True) as response:
+                if response.status_code != 206:
+                    if response.status_code == 200:
+                        raise RangeNotSupported(f"Server ignored Range request for {self.file_name}")
+                    if response.status_code in URL_EXPIRED_STATUSES:
+                        raise UrlExpired(response.status_code)
+                    raise IOError(f"Status {response.status_code} for bytes {start}-{end}")
+
+                f.seek(start)
+                copy_response(response, f, on_chunk, stop=self._abort, throttle=self.throttle,
+                              metrics=self.http.metrics)
+                if self._abort.is_set():
+                    return
+
+            if offset != end + 1:
+                raise IOError(f"Short read for bytes {start}-{end} ({offset - start} bytes)")
+        except Exception:
+            # Give back what this attempt counted, the whole piece is fetched again
+            with self._lock:
+                self.downloaded -= offset - start
+            raise
+        self.connection_speeds[connection_id] = (end + 1 - start) / max(time.monotonic() - started, 1e-6)
+
+        if self.on_piece_done:
+            f.flush()
+            with self._lock:
+                self.done_pieces.add(start)
+                done = sorted(self.done_pieces)
+            self.on_piece_done(done)
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._abort.set()
+
+
+def supports_segmented_download(response, total_size):
+    """True if `response` advertises byte ranges for an unencoded body worth splitting up."""
+    return (
+        total_size >= SEGMENT_MIN_SIZE
+        and response.headers.get('accept-ranges', '').lower() == 'bytes'
+        and response.headers.get('content-encoding', 'identity').lower() == 'identity'
+    )
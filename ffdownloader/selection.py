@@ -0,0 +1,81 @@
+"""
+Choosing files by rule instead of through the selection dialog.
+
+Pipelined runs start downloading while discovery is still going, so the choice of files has
+to be known up front. A SelectionRule picks files by name: every file, only those matching
+include globs, minus exclude globs and optionally minus FitGirl's optional parts.
+The selection dialog uses the same names to group files by part_type() and to filter them
+with name_filter().
+"""
+
+import fnmatch
+import re
+
+OPTIONAL_PART_PATTERNS = ("*optional*",)  # FitGirl names optional parts "fg-optional-<what>.bin"
+SELECTIVE_PART_PATTERNS = ("*selective*",)  # Language files, "fg-selective-<language>.bin"
+PART_TYPES = {  # part_type() -> label, in display order
+    'main': "Main parts",
+    'selective': "Language files",
+    'optional': "Optional files",
+}
+
+
+def matches_any(name, patterns):
+    """Case-insensitive glob match of `name` against any of `patterns`."""
+    name = name.lower()
+    return any(fnmatch.fnmatch(name, pattern.lower()) for pattern in patterns)
+
+
+def part_type(name):
+    """The kind of a repack file by its name: a key of PART_TYPES."""
+    if matches_any(name, OPTIONAL_PART_PATTERNS):
+        return 'optional'
+    if matches_any(name, SELECTIVE_PART_PATTERNS):
+        return 'selective'
+    return 'main'
+
+
+def name_filter(pattern, regex=False):
+    """
+    A predicate on file names for a filter typed by the user: a case-insensitive glob (text
+    without wildcards matches anywhere in the name) or, with regex=True, a regular expression
+    searched in the name. An empty pattern matches everything. Raises ValueError for a bad regex.
+    """
+    pattern = pattern.strip()
+    if not pattern:
+        return lambda name: True
+    if regex:
+        try:
+            compiled = re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}") from None
+        return lambda name: compiled.search(name) is not None
+    if not any(c in pattern for c in "*?["):
+        pattern = f"*{pattern}*"
+    return lambda name: matches_any(name, (pattern,))
+
+
+class SelectionRule:
+    """Decides per file name whether it is downloaded: include globs (default all), exclude globs, optional parts."""
+
+    def __init__(self, include=(), exclude=(), skip_optional=False):
+        self.include = list(include)
+        self.exclude = list(exclude) + (list(OPTIONAL_PART_PATTERNS) if skip_optional else [])
+
+    def matches(self, file_info):
+        name = file_info['name']
+        return (not self.include or matches_any(name, self.include)) and not matches_any(name, self.exclude)
+
+    def select(self, files):
+        """The files of `files` the rule picks, in their original order."""
+        return [f for f in files if self.matches(f)]
+
+    def describe(self):
+        if not self.include and not self.exclude:
+            return "all files"
+        parts = []
+        if self.include:
+            parts.append("only " + ", ".join(self.include))
+        if self.exclude:
+            parts.append("except " + ", ".join(self.exclude))
+        return "; ".join(parts)
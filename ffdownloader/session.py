@@ -0,0 +1,274 @@
+"""
+Crash-safe session state: which links of a repack are still pending and how far their downloads got.
+
+Rewriting the whole state file after every event is slow for large repacks and leaves a
+truncated file behind if the process dies mid-write. SessionStore keeps two files next to
+the downloads instead:
+
+    .download_state_<hash>.json      snapshot, only ever replaced via temp file + fsync + rename
+    .download_state_<hash>.journal   one JSON event per line, appended (and fsynced) as things happen
+
+Events are "discovered", "started", "bytes" (bytes-committed: the resume record of a partial
+download), "completed" (with the verified digest, if any), "failed", "checksums" (the
+repack's checksum manifest, so a resumed session verifies without fetching it again) and
+"mirrors" (the other hosters' links of every part, see ffdownloader.hosts).
+Loading replays the journal over the snapshot in one pass, ignoring a torn last line. Every
+event overwrites the state of the links it names, so replaying a journal that was already
+folded into the snapshot (a crash between the two steps of a compaction) gives the same
+result. Once the journal holds JOURNAL_COMPACT_EVENTS events it is folded into a new
+snapshot and emptied.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_VERSION = 2
+JOURNAL_COMPACT_EVENTS = 1000  # Journal events before they are folded into the snapshot
+
+
+def state_file_path(download_folder, scrape_url):
+    """A unique, "hidden" state file per scrape URL inside the download folder."""
+    url_hash = hashlib.sha1(scrape_url.encode()).hexdigest()
+    return os.path.join(download_folder, f".download_state_{url_hash}.json")
+
+
+def run_report_path(download_folder, scrape_url):
+    """The JSON run report of a scrape URL, next to its state file (see metrics.write_report)."""
+    return state_file_path(download_folder, scrape_url).replace(".download_state_", ".download_report_")
+
+
+def profile_dir_path(download_folder, scrape_url):
+    """The folder of a scrape URL's profile bundle (see profiling.RunProfiler.write), next to its state file."""
+    return state_file_path(download_folder, scrape_url).replace(".download_state_", ".profile_")[:-len(".json")]
+
+
+def fsync_dir(path):
+    """Makes a rename inside `path` durable (not possible, nor needed, on Windows)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SessionStore:
+    """
+    Thread-safe session state for one scrape URL, backed by a snapshot and an append-only journal.
+
+    links     page links still to download, in scrape order (a dict used as an ordered set)
+    partials  page link -> resume record of its unfinished download (see download.download_file)
+    completed page link -> info recorded when it finished (e.g. {'name': ...})
+    failed    page link -> last error, for links that are still pending
+    checksums manifest entries, file name -> [algorithm, hex digest] (see checksums.Manifest)
+    mirrors   page link -> links of the same file on other hosters
+    started   page links whose download started (journal only, not kept in the snapshot)
+    """
+
+    def __init__(self, path, compact_events=JOURNAL_COMPACT_EVENTS):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".journal"
+        self.compact_events = max(1, compact_events)
+        self.links = {}
+        self.partials = {}
+        self.completed = {}
+        self.failed = {}
+        self.checksums = {}
+        self.mirrors = {}
+        self.started = set()
+        self._journal = None
+        self._journal_events = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def exists(cls, path):
+        """True if a snapshot or journal is stored at `path`."""
+        return os.path.exists(path) or os.path.exists(cls(path).journal_path)
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """
+        Loads the session stored at `path` (a missing file is an empty session).
+        Raises ValueError/OSError if the snapshot cannot be read.
+        """
+        store = cls(path, **kwargs)
+        store._load()
+        return store
+
+    # --- Reading ---
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                data = {'links': data}  # The first versions stored only the pending links
+            self.links = dict.fromkeys(data.get('links', []))
+            self.partials = data.get('partials', {})
+            self.completed = data.get('completed', {})
+            self.failed = data.get('failed', {})
+            self.checksums = data.get('checksums', {})
+            self.mirrors = data.get('mirrors', {})
+
+        if os.path.exists(self.journal_path):
+            good_bytes = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Torn write from a crash, nothing after it was committed
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        break
+                    self._apply(event)
+                    self._journal_events += 1
+                    good_bytes += len(line)
+            if good_bytes < os.path.getsize(self.journal_path):
+                # Cut the torn tail off, or the next appended event would be lost behind it
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_bytes)
+
+    def _apply(self, event):
+        kind = event['event']
+        if kind == "discovered":
+            for link in event['links']:
+                self.links.setdefault(link, None)
+                self.completed.pop(link, None)
+        elif kind == "started":
+            self.started.add(event['link'])
+        elif kind == "bytes":
+            if event['record'] is None:
+                self.partials.pop(event['link'], None)
+            else:
+                self.partials[event['link']] = event['record']
+        elif kind == "completed":
+            link = event['link']
+            self.links.pop(link, None)
+            self.partials.pop(link, None)
+            self.failed.pop(link, None)
+            self.completed[link] = event.get('info', {})
+        elif kind == "failed":
+            self.failed[event['link']] = event.get('error')
+        elif kind == "checksums":
+            self.checksums.update(event['entries'])
+        elif kind == "mirrors":
+            self.mirrors.update(event['mirrors'])
+
+    @property
+    def pending_links(self):
+        with self._lock:
+            return list(self.links)
+
+    def get_partial(self, link):
+        with self._lock:
+            return self.partials.get(link)
+
+    # --- Recording events ---
+
+    def discovered(self, links):
+        self._record({'event': "discovered", 'links': list(links)})
+
+    def start(self, link):
+        self._record({'event': "started", 'link': link})
+
+    def commit_bytes(self, link, record):
+        """Records (or with record=None forgets) the resume record of `link`'s unfinished download."""
+        with self._lock:
+            if record is None and link not in self.partials:
+                return
+        self._record({'event': "bytes", 'link': link, 'record': record})
+
+    def complete(self, link, **info):
+        """Marks `link` as downloaded. Returns False if it was not pending."""
+        with self._lock:
+            if link not in self.links:
+                return False
+        self._record({'event': "completed", 'link': link, 'info': info})
+        return True
+
+    def fail(self, link, error=None):
+        self._record({'event': "failed", 'link': link, 'error': error})
+
+    def add_checksums(self, entries):
+        """Stores manifest entries (file name -> [algorithm, hex digest])."""
+        if entries:
+            self._record({'event': "checksums", 'entries': entries})
+
+    def add_mirrors(self, mirrors):
+        """Stores the mirror links of page links (page link -> [links on other hosters])."""
+        if mirrors:
+            self._record({'event': "mirrors", 'mirrors': mirrors})
+
+    def _record(self, event):
+        event['time'] = round(time.time(), 3)
+        line = json.dumps(event, separators=(',', ':')) + "\n"
+        with self._lock:
+            self._apply(event)
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal_events += 1
+            if self._journal_events >= self.compact_events:
+                self._compact()
+
+    # --- Compaction and cleanup ---
+
+    def compact(self):
+        """Folds the journal into a new snapshot."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'links': list(self.links),
+            'partials': self.partials,
+            'completed': self.completed,
+            'failed': self.failed,
+            'checksums': self.checksums,
+            'mirrors': self.mirrors,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+
+        # Only now is it safe to drop the journal (replaying it again would be harmless)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_events = 0
+
+    def close(self):
+        """Compacts any outstanding journal events and closes the journal."""
+        with self._lock:
+            if self._journal_events:
+                self._compact()
+            elif self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def remove(self):
+        """Deletes the session's files, e.g. once every link is downloaded."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._journal_events = 0
+            for path in (self.path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
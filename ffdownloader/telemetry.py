@@ -0,0 +1,72 @@
+"""
+Shared state between the download threads and a UI that redraws at its own frame rate.
+
+Downloads report progress for every chunk they read. Handing each report to Tk with
+root.after() floods its event queue (thousands of callbacks per second at full speed), so
+workers only overwrite the latest values here and the GUI drains them on a fixed timer.
+Only the newest value per progress slot survives between two frames, and log records are
+collected so the GUI can insert a whole frame's worth at once.
+"""
+
+import collections
+import threading
+
+MAX_PENDING_LOG_RECORDS = 1000  # Oldest undrawn log records are dropped beyond this
+
+
+class Telemetry:
+    """Thread-safe latest-value store, written by workers and drained by the UI thread."""
+
+    def __init__(self, max_pending_logs=MAX_PENDING_LOG_RECORDS):
+        self._lock = threading.Lock()
+        self._worker_count = None
+        self._slots = {}  # slot -> (current_bytes, total_bytes, file_name), or None once the slot is idle
+        self._status = None
+        self._logs = collections.deque(maxlen=max_pending_logs)
+        self._dropped_logs = 0
+
+    def set_workers(self, count):
+        """Announces how many progress slots the next downloads will use (resets every slot)."""
+        with self._lock:
+            self._worker_count = count
+            self._slots.clear()
+
+    def set_progress(self, slot, current_bytes, total_bytes, file_name):
+        with self._lock:
+            self._slots[slot] = (current_bytes, total_bytes, file_name)
+
+    def clear_progress(self, slot):
+        with self._lock:
+            self._slots[slot] = None
+
+    def set_status(self, text):
+        with self._lock:
+            self._status = text
+
+    def add_log(self, record):
+        """Queues one log record (any tuple the UI knows how to draw)."""
+        with self._lock:
+            if len(self._logs) == self._logs.maxlen:
+                self._dropped_logs += 1
+            self._logs.append(record)
+
+    def drain(self):
+        """
+        Returns and resets everything written since the last call, as a dict with
+        'workers' (None if unchanged), 'slots' {slot: progress tuple or None}, 'status' (None if unchanged),
+        'logs' [records] and 'dropped_logs' (records discarded because the UI fell behind).
+        """
+        with self._lock:
+            frame = {
+                'workers': self._worker_count,
+                'slots': self._slots,
+                'status': self._status,
+                'logs': list(self._logs),
+                'dropped_logs': self._dropped_logs,
+            }
+            self._worker_count = None
+            self._slots = {}
+            self._status = None
+            self._logs.clear()
+            self._dropped_logs = 0
+        return frame
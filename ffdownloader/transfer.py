@@ -0,0 +1,142 @@
+"""
+Copying a streamed response body into a file with as little per-chunk Python work as possible.
+
+iter_content(8192) costs an allocation, a write call and a progress callback for every 8 KiB,
+which dominates CPU time on fast links. copy_response() instead reads into one reusable
+buffer (readinto on the underlying http.client response, so no bytes object per chunk) and
+sizes each read from the observed throughput, so a fast stream does a few large reads per
+second while a slow one still reports progress regularly. A `throttle` (see ratelimit) caps
+the read size and is charged for every read, to keep the stream within a bandwidth limit.
+With a metrics.Metrics every write is timed (disk_write_seconds) and the stream's bytes and
+average rate are recorded when it ends.
+"""
+
+import os
+import time
+
+TRANSFER_MIN_CHUNK = 64 * 1024  # Smallest read, used at the start of a stream and on slow links
+TRANSFER_MAX_CHUNK = 4 * 1024 * 1024  # Largest read (and size of the reusable buffer)
+TRANSFER_CHUNK_SECONDS = 0.05  # Aim for a read to take about this long at the current rate
+
+
+class TransferStopped(Exception):
+    """Raised by the download code when a stop was requested; what is on disk is kept for resuming."""
+
+
+class ChunkSizer:
+    """Picks the next read size so that one read takes about `target_seconds` at the observed rate."""
+
+    def __init__(self, min_size=TRANSFER_MIN_CHUNK, max_size=TRANSFER_MAX_CHUNK, target_seconds=TRANSFER_CHUNK_SECONDS):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.target_seconds = target_seconds
+        self.size = min_size
+
+    def update(self, nbytes, seconds):
+        """Feeds one finished read and returns the size for the next one."""
+        if nbytes < self.size:
+            return self.size  # A short read says nothing about the link speed
+        wanted = nbytes / max(seconds, 1e-6) * self.target_seconds
+        # Move by at most a factor of two per read so one odd timing does not swing the size
+        wanted = max(self.size / 2, min(self.size * 2, wanted))
+        self.size = int(max(self.min_size, min(self.max_size, wanted)))
+        return self.size
+
+
+def _direct_reader(response):
+    """
+    The http.client response under a requests Response when its bytes can be used unmodified
+    (no Content-Encoding), else None. Reading it directly skips urllib3's copy per read.
+    """
+    if response.headers.get('content-encoding', 'identity').lower() != 'identity':
+        return None
+    fp = getattr(response.raw, '_original_response', None)
+    if fp is None or not hasattr(fp, 'readinto'):
+        return None
+    return fp
+
+
+def copy_response(response, f, on_chunk=None, stop=None, sizer=None, hasher=None, throttle=None, metrics=None):
+    """
+    Writes the body of a streamed `response` to the file object `f` at its current position.
+    on_chunk(nbytes) is called after every write; `stop` is an optional threading.Event checked
+    between reads; `hasher` (anything with update()) sees every written byte; `throttle`
+    (a ratelimit.FileThrottle) limits the read size and may sleep after each read; `metrics`
+    (a metrics.Metrics) records write latency and the stream's rate.
+    Returns the number of bytes written.
+    """
+    if metrics is None:
+        return _copy_response(response, f, on_chunk, stop, sizer, hasher, throttle, f.write)
+
+    written = 0
+
+    def timed_write(data):
+        nonlocal written
+        write_started = time.perf_counter()
+        f.write(data)
+        metrics.observe('disk_write_seconds', time.perf_counter() - write_started)
+        written += len(data)
+
+    started = time.perf_counter()
+    try:
+        return _copy_response(response, f, on_chunk, stop, sizer, hasher, throttle, timed_write)
+    finally:  # Also counts what a broken stream wrote
+        elapsed = time.perf_counter() - started
+        if written:
+            metrics.inc('download_bytes_total', written)
+            metrics.observe('stream_bytes_per_second', written / max(elapsed, 1e-6))
+
+
+def _copy_response(response, f, on_chunk, stop, sizer, hasher, throttle, write):
+    """copy_response() with the file writes done by write(data)."""
+    sizer = sizer or ChunkSizer()
+    written = 0
+    reader = _direct_reader(response)
+
+    if reader is None:
+        # Encoded bodies go through urllib3 so they are decoded, still with adaptive read sizes
+        while not (stop and stop.is_set()):
+            started = time.perf_counter()
+            data = response.raw.read(throttle.chunk_size(sizer.size) if throttle else sizer.size,
+                                     decode_content=True)
+            if not data:
+                break
+            write(data)
+            if hasher:
+                hasher.update(data)
+            written += len(data)
+            sizer.update(len(data), time.perf_counter() - started)
+            if on_chunk:
+                on_chunk(len(data))
+            if throttle:
+                throttle.consume(len(data))
+        return written
+
+    buffer = memoryview(bytearray(sizer.max_size))  # Reused for every read of this stream
+    try:
+        while not (stop and stop.is_set()):
+            started = time.perf_counter()
+            n = reader.readinto(buffer[:throttle.chunk_size(sizer.size) if throttle else sizer.size])
+            if not n:
+                break
+            write(buffer[:n])
+            if hasher:
+                hasher.update(buffer[:n])
+            written += n
+            sizer.update(n, time.perf_counter() - started)
+            if on_chunk:
+                on_chunk(n)
+            if throttle:
+                throttle.consume(n)
+    finally:
+        if reader.isclosed():
+            response.raw.release_conn()  # Body fully read, hand the connection back to the pool
+    return written
+
+
+def preallocate(f, size):
+    """Reserves `size` bytes for `f` up front, so the disk fills early and the file is not fragmented."""
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        f.truncate(size)  # Not available on this platform or file system
@@ -0,0 +1,95 @@
+"""
+Checking GitHub for a newer release without slowing down every launch.
+
+The releases API answer is cached on disk together with its ETag. Within UPDATE_CHECK_INTERVAL
+of the last check the cached release is used and no request is made at all. After that the
+request carries If-None-Match, so an unchanged release costs a bodiless 304 (which GitHub does
+not count against its rate limit). The HTTP stack is only imported once a request is due.
+"""
+
+import json
+import os
+import time
+
+UPDATE_CHECK_INTERVAL = 12 * 3600  # Seconds a cached answer is used before asking GitHub again
+UPDATE_CHECK_TIMEOUT = 5  # Seconds the API request may take
+
+
+class UpdateCheckFailed(Exception):
+    """The latest release could not be determined (no connection, API error, unexpected answer)."""
+
+
+def default_cache_path():
+    return os.path.join(os.path.expanduser("~"), ".ffdownloader", "update_check.json")
+
+
+def _load_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _save_cache(path, cache):
+    """Best effort: a cache that cannot be written only means the next launch asks again."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def latest_release(repo, cache_path=None, interval=UPDATE_CHECK_INTERVAL, timeout=UPDATE_CHECK_TIMEOUT):
+    """
+    The latest release of `repo` ("OWNER/REPO") as {'tag_name', 'body', 'assets': [{'name',
+    'browser_download_url'}]}, and where it came from: "cache" (checked less than `interval`
+    seconds ago, no request made), "not-modified" (GitHub answered 304) or "api".
+    Raises UpdateCheckFailed.
+    """
+    cache_path = cache_path or default_cache_path()
+    cache = _load_cache(cache_path)
+    release = cache.get('release')
+    if release and time.time() - cache.get('checked', 0) < interval:
+        return release, "cache"
+
+    import requests  # Only now, most launches never get here
+
+    from ffdownloader.net import HttpClient
+
+    headers = {'Accept': "application/vnd.github+json"}
+    if release and cache.get('etag'):
+        headers['If-None-Match'] = cache['etag']
+    try:
+        with HttpClient(retries=1, timeout=timeout) as http:
+            response = http.get(f"https://api.github.com/repos/{repo}/releases/latest", headers=headers)
+    except requests.exceptions.ConnectionError:
+        raise UpdateCheckFailed("No internet connection.") from None
+    except requests.exceptions.RequestException as e:
+        raise UpdateCheckFailed(str(e)) from None
+
+    if response.status_code == 304 and release:
+        cache['checked'] = time.time()
+        _save_cache(cache_path, cache)
+        return release, "not-modified"
+    if response.status_code != 200:
+        raise UpdateCheckFailed(f"API Status: {response.status_code}")
+    try:
+        data = response.json()
+    except ValueError:
+        raise UpdateCheckFailed("The API answer is not JSON.") from None
+    if not data.get("tag_name"):
+        raise UpdateCheckFailed("Could not find 'tag_name' in API response.")
+
+    release = {
+        'tag_name': data["tag_name"],
+        'body': data.get("body"),
+        'assets': [{'name': asset.get("name"), 'browser_download_url': asset.get("browser_download_url")}
+                   for asset in data.get("assets", [])],
+    }
+    _save_cache(cache_path, {'checked': time.time(), 'etag': response.headers.get('etag'), 'release': release})
+    return release, "api"
@@ -1,17 +1,25 @@
 import os
-import re
-import requests
 import threading
 import queue  # Added for thread-safe communication
-import json  # --- NEW: For saving state
-import hashlib  # --- NEW: For hashing URL to create a unique state file
-from bs4 import BeautifulSoup
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import sys
-import subprocess
-import webbrowser
+import time
+
+# --- NEW: Everything except the GUI lives in the ffdownloader package (also usable via "python -m ffdownloader") ---
+# The pipeline (requests, BeautifulSoup) is imported on first use in the worker threads, so the window opens fast
+from ffdownloader.jobs import JOB_PARALLEL, JobQueue, JobRunner, default_queue_path, job_folder_name
+from ffdownloader.profiling import RunProfiler
+from ffdownloader.ratelimit import BandwidthLimiter, RateSchedule, parse_rate
+from ffdownloader.scheduler import DOWNLOAD_ORDER, DOWNLOAD_PER_HOST, DOWNLOAD_WORKERS, DownloadScheduler, SlotPool
+from ffdownloader.selection import PART_TYPES, SelectionRule, name_filter, part_type
+from ffdownloader.telemetry import Telemetry
+from ffdownloader.updates import UpdateCheckFailed, latest_release
+
+# --- NEW: GUI refresh limits (workers write to self.telemetry, the GUI draws it on a timer) ---
+GUI_REFRESH_INTERVAL_MS = 100  # Progress bars, status and logs are redrawn at most 10 times per second
+LOG_MAX_LINES = 2000  # The log widget only keeps the newest lines
 
 # --- UPDATE CHECKER: NEW CONSTANTS ---
 # !!! IMPORTANT !!!
@@ -22,56 +30,73 @@ CURRENT_VERSION = "v1.3.1"  # Start with v1.0 or your current version
 # The GitHub repository to check for updates, in "OWNER/REPO" format.
 GITHUB_REPO = "sriharan-s/fitgirl-ff-downloader"
 
+# The check waits until the window is up, and answers from its cache most of the time (see ffdownloader.updates)
+UPDATE_CHECK_DELAY_MS = 2000
+
 # --- New Selection Dialog Class ---
 
 class SelectionDialog(tk.Toplevel):
-    """A modal dialog to select which files to download."""
+    """
+    A modal dialog to select which files to download.
+    Files are rows of a ttk.Treeview, which only draws the rows in view, so a repack with hundreds
+    of files opens instantly. Rows are grouped by part type, filtered by glob or regex and sorted
+    by clicking the column headings. Clicking a row (or Space on the selected rows) toggles it.
+    """
+
+    CHECKED, UNCHECKED, PARTIAL = "\u2611", "\u2610", "\u25a3"
 
     def __init__(self, parent, files, selection_queue):
         super().__init__(parent)
         self.transient(parent)
         self.grab_set()
         self.title("Select Files to Download")
-        self.geometry("600x400")
+        self.geometry("700x500")
 
         self.files = files
         self.queue = selection_queue
-        self.vars = []  # To hold the BooleanVar for each checkbox
+        self.checked = set(range(len(files)))  # Indices into self.files, everything by default
+        self.types = [part_type(f['name']) for f in files]
+        self.visible = []  # Indices of the files shown, in display order
+        self.sort_key = None  # None (page order), "name" or "size"
+        self.sort_reverse = False
+        self.filter_text = tk.StringVar()
+        self.filter_regex = tk.BooleanVar(value=False)
+        self.group_by_type = tk.BooleanVar(value=len(set(self.types)) > 1)
 
         # --- Top frame for controls ---
         control_frame = ttk.Frame(self)
-        control_frame.pack(pady=5)
+        control_frame.pack(fill="x", padx=10, pady=5)
 
-        ttk.Button(control_frame, text="Select All", command=self.select_all).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="Select All", command=self.select_all).pack(side="left", padx=(0, 5))
         ttk.Button(control_frame, text="Deselect All", command=self.deselect_all).pack(side="left", padx=5)
-
-        # --- Frame for scrollable checkbox list ---
-        list_frame = ttk.Frame(self, relief="sunken", borderwidth=1)
+        ttk.Label(control_frame, text="Filter:").pack(side="left", padx=(10, 2))
+        filter_entry = ttk.Entry(control_frame, width=22, textvariable=self.filter_text)
+        filter_entry.pack(side="left")
+        ttk.Checkbutton(control_frame, text="Regex", variable=self.filter_regex,
+                        command=self.refresh_list).pack(side="left", padx=5)
+        ttk.Checkbutton(control_frame, text="Group by type", variable=self.group_by_type,
+                        command=self.refresh_list).pack(side="left", padx=5)
+        self.filter_text.trace_add("write", lambda *args: self.refresh_list())
+
+        # --- NEW: Virtualized list, one Treeview row per file instead of a Checkbutton widget each ---
+        list_frame = ttk.Frame(self)
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
-        self.canvas = tk.Canvas(list_frame)
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(
-                scrollregion=self.canvas.bbox("all")
-            )
-        )
-
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-
-        self.canvas.pack(side="left", fill="both", expand=True)
+        self.tree = ttk.Treeview(list_frame, columns=("size",), show="tree headings", selectmode="extended")
+        self.tree.heading("#0", text="File", command=lambda: self.sort_by("name"))
+        self.tree.heading("size", text="Size", command=lambda: self.sort_by("size"))
+        self.tree.column("#0", width=520, stretch=True)
+        self.tree.column("size", width=100, stretch=False, anchor="e")
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<space>", self.on_space)
 
-        # --- Populate the list ---
-        for file_info in self.files:
-            var = tk.BooleanVar(value=True)  # Default to checked
-            self.vars.append(var)
-            chk = ttk.Checkbutton(self.scrollable_frame, text=file_info['name'], variable=var)
-            chk.pack(anchor="w", padx=10, pady=2)
+        # --- NEW: Total size of the selection ---
+        self.total_label = ttk.Label(self)
+        self.total_label.pack(pady=(5, 0))
 
         # --- Bottom frame for OK/Cancel ---
         bottom_frame = ttk.Frame(self)
@@ -82,27 +107,126 @@ class SelectionDialog(tk.Toplevel):
 
         # Handle window close button
         self.protocol("WM_DELETE_WINDOW", self.on_cancel)
+        self.refresh_list()
 
         # Wait for the window to be visible before grabbing
         self.wait_visibility()
         self.grab_set()
-        self.focus_set()
+        filter_entry.focus_set()
+
+    @staticmethod
+    def format_size(size):
+        if size is None:
+            return "size unknown"
+        if size >= 1024 ** 3:
+            return f"{size / 1024 ** 3:.2f} GB"
+        return f"{size / 1024 / 1024:.1f} MB"
+
+    def refresh_list(self):
+        """Rebuilds the rows from the filter, grouping and sort order (the check marks are kept)."""
+        try:
+            matches = name_filter(self.filter_text.get(), regex=self.filter_regex.get())
+        except ValueError as e:
+            self.total_label.config(text=str(e))
+            return
+        visible = [i for i, f in enumerate(self.files) if matches(f['name'])]
+        if self.sort_key == "name":
+            visible.sort(key=lambda i: self.files[i]['name'].lower(), reverse=self.sort_reverse)
+        elif self.sort_key == "size":
+            # Unknown sizes always go last
+            visible.sort(key=lambda i: self.files[i].get('size') or 0, reverse=self.sort_reverse)
+            visible.sort(key=lambda i: self.files[i].get('size') is None)
+        self.visible = visible
+
+        self.tree.delete(*self.tree.get_children())
+        groups = [(None, visible)]
+        if self.group_by_type.get():
+            groups = [(kind, [i for i in visible if self.types[i] == kind]) for kind in PART_TYPES]
+        for kind, indices in groups:
+            parent = ""
+            if kind is not None:
+                if not indices:
+                    continue
+                parent = f"group:{kind}"
+                self.tree.insert("", tk.END, iid=parent, open=True)
+            for i in indices:
+                self.tree.insert(parent, tk.END, iid=str(i), values=(self.format_size(self.files[i].get('size')),))
+        self.update_marks()
+
+    def update_marks(self):
+        """Redraws the check marks of every row and group, and the totals."""
+        for i in self.visible:
+            mark = self.CHECKED if i in self.checked else self.UNCHECKED
+            self.tree.item(str(i), text=f"{mark} {self.files[i]['name']}")
+        for group in self.tree.get_children():
+            if not group.startswith("group:"):
+                continue
+            indices = [int(iid) for iid in self.tree.get_children(group)]
+            checked = sum(1 for i in indices if i in self.checked)
+            mark = self.CHECKED if checked == len(indices) else self.UNCHECKED if not checked else self.PARTIAL
+            size = sum(self.files[i].get('size') or 0 for i in indices)
+            self.tree.item(group, text=f"{mark} {PART_TYPES[group[6:]]} ({checked}/{len(indices)} files)",
+                           values=(self.format_size(size),))
+        self.update_total()
+
+    def update_total(self):
+        """Shows the count and total size of the checked files."""
+        selected = [self.files[i] for i in self.checked]
+        total_size = sum(f.get('size') or 0 for f in selected)
+        text = f"Selected {len(selected)} of {len(self.files)} files, {self.format_size(total_size)}"
+        unknown = sum(1 for f in selected if f.get('size') is None)
+        if unknown:
+            text += f" (+{unknown} of unknown size)"
+        if len(self.visible) < len(self.files):
+            text += f" \u2022 showing {len(self.visible)}"
+        self.total_label.config(text=text)
+
+    def toggle(self, indices):
+        """Checks all of `indices`, or unchecks them if they are all checked already."""
+        if all(i in self.checked for i in indices):
+            self.checked.difference_update(indices)
+        else:
+            self.checked.update(indices)
+        self.update_marks()
+
+    def _row_indices(self, iid):
+        if iid.startswith("group:"):
+            return [int(child) for child in self.tree.get_children(iid)]
+        return [int(iid)]
+
+    def on_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if not iid or "indicator" in self.tree.identify_element(event.x, event.y):
+            return  # Headings, empty space and the expand/collapse arrow keep their normal behaviour
+        self.toggle(self._row_indices(iid))
+
+    def on_space(self, event):
+        indices = []
+        for iid in self.tree.selection():
+            indices += self._row_indices(iid)
+        if indices:
+            self.toggle(sorted(set(indices)))
+        return "break"
+
+    def sort_by(self, key):
+        """Sorts by `key`; clicking the same heading again reverses the order."""
+        self.sort_reverse = not self.sort_reverse if self.sort_key == key else key == "size"
+        self.sort_key = key
+        self.refresh_list()
 
     def select_all(self):
-        for var in self.vars:
-            var.set(True)
+        """Checks every file shown (all files unless a filter is set)."""
+        self.checked.update(self.visible)
+        self.update_marks()
 
     def deselect_all(self):
-        for var in self.vars:
-            var.set(False)
+        """Unchecks every file shown (all files unless a filter is set)."""
+        self.checked.difference_update(self.visible)
+        self.update_marks()
 
     def on_ok(self):
-        """Collect selected files and put them in the queue."""
-        selected_files = []
-        for i, var in enumerate(self.vars):
-            if var.get():
-                selected_files.append(self.files[i])
-
+        """Collect selected files (in page order, also those hidden by the filter) and put them in the queue."""
+        selected_files = [f for i, f in enumerate(self.files) if i in self.checked]
         self.queue.put(selected_files)
         self.destroy()
 
@@ -189,28 +313,46 @@ class DownloaderApp:
     def __init__(self, root):
         self.root = root
         self.root.title(f"Web Page Link Downloader - {CURRENT_VERSION}")
-        self.root.geometry("800x600")
+        self.root.geometry("800x720")
 
         # --- Class Variables ---
         self.download_folder = tk.StringVar(value=os.path.join(os.path.expanduser("~"), "Downloads"))
-
-        self.headers = {
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'accept-language': 'en-US,en;q=0.5',
-            'referer': 'https://fitgirl-repacks.site/',
-            'sec-ch-ua': '"Brave";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-        }
+        self.download_workers = tk.IntVar(value=DOWNLOAD_WORKERS)
+        self.download_per_host = tk.IntVar(value=DOWNLOAD_PER_HOST)
+        self.download_order = tk.StringVar(value=DOWNLOAD_ORDER)
+        self.pipelined = tk.BooleanVar(value=False)  # Download everything as it is discovered, no selection dialog
+        self.skip_optional = tk.BooleanVar(value=False)
+        self.async_engine = tk.BooleanVar(value=False)  # Network stages on one asyncio loop (needs aiohttp)
+        self.use_mirrors = tk.BooleanVar(value=True)  # Fastest file hoster of each part, switching on failures
+        self.profile_run = tk.BooleanVar(value=False)  # Timers, cProfile and tracemalloc around the next run
+        self.limit_rate = tk.StringVar()  # Total bandwidth limit, e.g. "2M" (empty: unlimited)
+        self.limit_per_file = tk.StringVar()
+        self.limit_schedule = tk.StringVar()  # e.g. "09:00-18:00=2M, 18:00-23:00=5M"
+        self.limiter = BandwidthLimiter()  # Shared with every run, applied live
+
+        self.headers = None  # The pipeline's DEFAULT_HEADERS
+        self.telemetry = Telemetry()  # Progress and log records waiting for the next GUI frame
+        self.job_runner = None  # Works through the queue while "Run Queue" is active
+        self.profiler = None  # RunProfiler of the running "Start Processing" run, fed with GUI frame timings
 
         # --- Create GUI Widgets ---
         self.create_widgets()
+        self._frame_due = time.monotonic() + GUI_REFRESH_INTERVAL_MS / 1000
+        self.root.after(GUI_REFRESH_INTERVAL_MS, self.refresh_gui)
 
-        # --- UPDATE CHECKER: START CHECK ON LAUNCH ---
+        # --- NEW: Persistent queue of repacks, survives restarts ---
+        on_change = lambda: self.root.after(0, self.refresh_queue)
+        try:
+            self.job_queue = JobQueue.load(default_queue_path(), on_change=on_change)
+        except (ValueError, OSError) as e:
+            self.log_to_gui("Could not read the download queue, starting with an empty one.", str(e), "warning")
+            self.job_queue = JobQueue(default_queue_path(), on_change=on_change)
+        self.refresh_queue()
+
+        # --- UPDATE CHECKER: START CHECK ONCE THE WINDOW IS UP ---
         self.log_to_gui("Welcome!", f"Current version: {CURRENT_VERSION}", "info")
-        self.updater_thread = threading.Thread(target=self.check_for_updates, daemon=True)
-        self.updater_thread.start()
+        self.updater_thread = None
+        self.root.after(UPDATE_CHECK_DELAY_MS, self.start_update_check)
         # --- END UPDATE CHECKER ---
 
     def create_widgets(self):
@@ -235,18 +377,78 @@ class DownloaderApp:
         control_frame = ttk.Frame(self.root, padding=(10, 5))
         control_frame.pack(fill="x", padx=10)
 
-        self.start_button = ttk.Button(control_frame, text="Start Processing", command=self.start_processing_thread)
-        self.start_button.pack(pady=5)
+        # --- NEW: Download concurrency settings ---
+        ttk.Label(control_frame, text="Parallel downloads:").pack(side="left")
+        ttk.Spinbox(control_frame, from_=1, to=16, width=4, textvariable=self.download_workers).pack(side="left",
+                                                                                                   padx=(2, 10))
+        ttk.Label(control_frame, text="Per host:").pack(side="left")
+        ttk.Spinbox(control_frame, from_=1, to=16, width=4, textvariable=self.download_per_host).pack(side="left",
+                                                                                                     padx=(2, 10))
+        ttk.Label(control_frame, text="Order:").pack(side="left")
+        ttk.Combobox(control_frame, values=DownloadScheduler.ORDERS, width=10, state="readonly",
+                     textvariable=self.download_order).pack(side="left", padx=(2, 10))
 
-        # --- Frame 4: Progress Bar ---
+        self.start_button = ttk.Button(control_frame, text="Start Processing", command=self.start_processing_thread)
+        self.start_button.pack(side="right", pady=5)
+        ttk.Checkbutton(control_frame, text="Profile run",
+                        variable=self.profile_run).pack(side="right", padx=(0, 10))
+
+        # --- NEW: Pipelined mode (selection given up front, downloads start during discovery) ---
+        rule_frame = ttk.Frame(self.root, padding=(10, 0))
+        rule_frame.pack(fill="x", padx=10)
+        ttk.Checkbutton(rule_frame, text="Download while discovering (skip file selection)",
+                        variable=self.pipelined, command=self._update_rule_controls).pack(side="left")
+        self.skip_optional_check = ttk.Checkbutton(rule_frame, text="Skip optional parts",
+                                                   variable=self.skip_optional)
+        self.skip_optional_check.pack(side="left", padx=(10, 0))
+        ttk.Checkbutton(rule_frame, text="Async network engine",
+                        variable=self.async_engine).pack(side="right")
+        ttk.Checkbutton(rule_frame, text="Use mirrors",
+                        variable=self.use_mirrors).pack(side="right", padx=(0, 10))
+        self._update_rule_controls()
+
+        # --- NEW: Bandwidth limits, applied immediately (also to running downloads) ---
+        limit_frame = ttk.Frame(self.root, padding=(10, 0))
+        limit_frame.pack(fill="x", padx=10)
+        ttk.Button(limit_frame, text="Apply", command=self.apply_limits).pack(side="right")
+        for text, variable, width in (("Speed limit:", self.limit_rate, 7), ("Per file:", self.limit_per_file, 7),
+                                      ("Schedule:", self.limit_schedule, 28)):
+            ttk.Label(limit_frame, text=text).pack(side="left")
+            entry = ttk.Entry(limit_frame, width=width, textvariable=variable)
+            entry.pack(side="left", padx=(2, 10))
+            entry.bind("<Return>", lambda e: self.apply_limits())
+
+        # --- NEW: Queue of repacks, each downloading into its own subfolder, sharing the limits above ---
+        queue_frame = ttk.LabelFrame(self.root, text="Queue", padding=(10, 5))
+        queue_frame.pack(fill="x", padx=10, pady=5)
+
+        self.queue_tree = ttk.Treeview(queue_frame, columns=("url", "folder", "status"), show="headings", height=4)
+        for column, text, width in (("url", "Source URL", 330), ("folder", "Folder", 250), ("status", "Status", 70)):
+            self.queue_tree.heading(column, text=text)
+            self.queue_tree.column(column, width=width, stretch=column != "status")
+        self.queue_tree.pack(fill="x")
+
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.pack(fill="x", pady=(5, 0))
+        for text, command in (("Add to Queue", self.add_to_queue), ("Up", lambda: self.move_job(-1)),
+                              ("Down", lambda: self.move_job(1)), ("Pause", self.pause_job),
+                              ("Resume", self.resume_job), ("Remove", self.remove_job)):
+            ttk.Button(queue_buttons, text=text, command=command).pack(side="left", padx=(0, 5))
+        ttk.Button(queue_buttons, text="Stop", command=self.stop_queue).pack(side="right")
+        self.run_queue_button = ttk.Button(queue_buttons, text="Run Queue", command=self.run_queue)
+        self.run_queue_button.pack(side="right", padx=(0, 5))
+
+        # --- Frame 4: Progress (one row per download worker + aggregate throughput) ---
         progress_frame = ttk.LabelFrame(self.root, text="Download Progress", padding=(10, 5))
         progress_frame.pack(fill="x", padx=10, pady=5)
 
         self.status_label = ttk.Label(progress_frame, text="Waiting for download...")
         self.status_label.pack(fill="x", pady=(0, 5))
 
-        self.progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=100, mode="determinate")
-        self.progress_bar.pack(fill="x")
+        self.worker_rows_frame = ttk.Frame(progress_frame)
+        self.worker_rows_frame.pack(fill="x")
+        self.worker_rows = []  # (label, progressbar) per download worker slot
+        self._build_worker_rows(1)
 
         # --- Frame 5: Logging Output ---
         log_frame = ttk.LabelFrame(self.root, text="Logs", padding=(10, 5))
@@ -273,46 +475,172 @@ class DownloaderApp:
         if folder:
             self.download_folder.set(folder)
 
+    def _update_rule_controls(self):
+        """The selection rule only applies in pipelined mode, otherwise the selection dialog decides."""
+        self.skip_optional_check.config(state="normal" if self.pipelined.get() else "disabled")
+
+    def apply_limits(self):
+        """Hands the bandwidth limit fields to the shared limiter (rates like 500K or 2M, empty for none)."""
+        try:
+            self.limiter.set_limits(rate=parse_rate(self.limit_rate.get()),
+                                    per_file_rate=parse_rate(self.limit_per_file.get()),
+                                    schedule=RateSchedule.parse(self.limit_schedule.get()))
+        except ValueError as e:
+            self.show_error("Input Error", str(e))
+            return
+        self.log_to_gui("Bandwidth limit changed", self.limiter.describe(), "info")
+
+    def refresh_queue(self):
+        """Redraws the queue list, keeping the selected job selected (must run on main thread)."""
+        selected = self._selected_job_id()
+        self.queue_tree.delete(*self.queue_tree.get_children())
+        for job in self.job_queue.snapshot():
+            self.queue_tree.insert("", tk.END, iid=str(job['id']), values=(job['url'], job['folder'], job['status']))
+        if selected is not None and self.queue_tree.exists(str(selected)):
+            self.queue_tree.selection_set(str(selected))
+
+    def _selected_job_id(self):
+        selection = self.queue_tree.selection()
+        return int(selection[0]) if selection else None
+
+    def add_to_queue(self):
+        """Queues the URL entry, downloading into a subfolder of the download folder named after the repack."""
+        scrape_url = self.url_entry.get().strip()
+        if not scrape_url or not self.download_folder.get():
+            self.show_error("Input Error", "Please enter a URL and select a download folder.")
+            return
+        self.job_queue.add(scrape_url, os.path.join(self.download_folder.get(), job_folder_name(scrape_url)))
+        self.url_entry.delete(0, tk.END)
+
+    def move_job(self, offset):
+        job_id = self._selected_job_id()
+        if job_id is not None:
+            self.job_queue.move(job_id, offset)
+
+    def pause_job(self):
+        job_id = self._selected_job_id()
+        if job_id is None:
+            return
+        if self.job_runner:
+            self.job_runner.pause(job_id)
+        else:
+            self.job_queue.set_status(job_id, "paused")
+
+    def resume_job(self):
+        job_id = self._selected_job_id()
+        if job_id is None:
+            return
+        if self.job_runner:
+            self.job_runner.resume(job_id)
+        else:
+            self.job_queue.set_status(job_id, "queued")
+
+    def remove_job(self):
+        job_id = self._selected_job_id()
+        if job_id is None:
+            return
+        try:
+            self.job_queue.remove(job_id)
+        except ValueError as e:
+            self.show_error("Queue", str(e))
+
     def log_to_gui(self, message, obj, tag="info"):
         """
-        Safely inserts a formatted log message into the GUI Text widget
-        from any thread using root.after().
+        Queues a formatted log message for the GUI Text widget (safe from any thread).
+        refresh_gui() inserts everything queued since the last frame at once.
         """
         timestamp = datetime.now().strftime("%H:%M:%S")
         tag_prefix = tag.upper().ljust(4)
-        self.root.after(0, self._insert_log_text, timestamp, tag_prefix, message, obj, tag)
+        self.telemetry.add_log((timestamp, tag_prefix, message, obj, tag))
 
-    def _insert_log_text(self, timestamp, tag_prefix, message, obj, tag):
+    def _insert_log_text(self, records, dropped):
         """Internal helper to modify the Text widget (must run on main thread)."""
         try:
+            chunks = []
+            if dropped:
+                chunks += [f"{dropped} log lines skipped, the log could not keep up.\n", "warning"]
+            for timestamp, tag_prefix, message, obj, tag in records:
+                chunks += [f"{timestamp} » ", "timestamp", f"{tag_prefix} • ", tag, f"{message} : {obj}\n", "normal"]
             self.log_text.config(state="normal")
-            self.log_text.insert(tk.END, f"{timestamp} » ", "timestamp")
-            self.log_text.insert(tk.END, f"{tag_prefix} • ", tag)
-            self.log_text.insert(tk.END, f"{message} : {obj}\n", "normal")
+            self.log_text.insert(tk.END, *chunks)
+            # Keep the widget a fixed-size ring of the newest lines
+            line_count = int(self.log_text.index("end-1c").split(".")[0])
+            if line_count > LOG_MAX_LINES:
+                self.log_text.delete("1.0", f"{line_count - LOG_MAX_LINES + 1}.0")
             self.log_text.config(state="disabled")
             self.log_text.see(tk.END)  # Auto-scroll
         except Exception as e:
             print(f"Error logging to GUI: {e}")
 
-    def update_progress(self, current_bytes, total_bytes, filename):
-        """Safely updates the progress bar and status label from any thread."""
+    def refresh_gui(self):
+        """Draws what the worker threads reported since the last frame, then schedules the next frame."""
+        frame_started = time.monotonic()
+        try:
+            frame = self.telemetry.drain()
+            if frame['workers'] is not None:
+                self._build_worker_rows(frame['workers'])
+            for slot, progress in frame['slots'].items():
+                self._set_progress(slot, progress)
+            if frame['status'] is not None:
+                self.status_label.config(text=frame['status'])
+            if frame['logs'] or frame['dropped_logs']:
+                self._insert_log_text(frame['logs'], frame['dropped_logs'])
+            # --- NEW: While a run is profiled, how late the Tk event loop gets to each frame and how much it draws ---
+            profiler = self.profiler
+            if profiler:
+                profiler.sample('tk_frame_lag_seconds', max(0.0, frame_started - self._frame_due))
+                profiler.sample('tk_frame_seconds', time.monotonic() - frame_started)
+                profiler.sample('tk_log_backlog', len(frame['logs']) + frame['dropped_logs'])
+        finally:
+            self._frame_due = time.monotonic() + GUI_REFRESH_INTERVAL_MS / 1000
+            self.root.after(GUI_REFRESH_INTERVAL_MS, self.refresh_gui)
+
+    def _build_worker_rows(self, count):
+        """(Re)creates one label + progress bar per download worker (must run on main thread)."""
+        for label, bar in self.worker_rows:
+            label.destroy()
+            bar.destroy()
+        self.worker_rows = []
+        for slot in range(count):
+            label = ttk.Label(self.worker_rows_frame, text=f"Worker {slot + 1}: idle")
+            label.pack(fill="x")
+            bar = ttk.Progressbar(self.worker_rows_frame, orient="horizontal", length=100, mode="determinate")
+            bar.pack(fill="x", pady=(0, 4))
+            self.worker_rows.append((label, bar))
+
+    def update_progress(self, slot, current_bytes, total_bytes, filename):
+        """Records one worker's progress from any thread, the next GUI frame draws it."""
+        self.telemetry.set_progress(slot, current_bytes, total_bytes, filename)
+
+    def _set_progress(self, slot, progress):
+        """Internal helper to modify progress widgets (must run on main thread)."""
+        if slot >= len(self.worker_rows):
+            return
+        label, bar = self.worker_rows[slot]
+        if progress is None:
+            bar['value'] = 0
+            label.config(text=f"Worker {slot + 1}: idle")
+            return
+
+        current_bytes, total_bytes, filename = progress
         percent = 0
-        status_text = f"Downloading {filename[:35]}{'...' if len(filename) > 35 else ''}..."
+        status_text = f"Worker {slot + 1}: {filename[:35]}{'...' if len(filename) > 35 else ''}"
 
         if total_bytes > 0:
             percent = (current_bytes / total_bytes) * 100
             status_text += f" ({current_bytes / 1024 / 1024:.1f}MB / {total_bytes / 1024 / 1024:.1f}MB)"
 
-        self.root.after(0, self._set_progress, percent, status_text)
+        bar['value'] = percent
+        label.config(text=status_text)
 
-    def _set_progress(self, percent, status_text):
-        """Internal helper to modify progress widgets (must run on main thread)."""
-        self.progress_bar['value'] = percent
-        self.status_label.config(text=status_text)
+    def clear_progress(self, slot):
+        """Marks a worker's progress row as idle."""
+        self.telemetry.clear_progress(slot)
 
-    def clear_progress(self):
-        """Safely resets the progress bar and label."""
-        self.root.after(0, self._set_progress, 0, "Download complete. Waiting for next file...")
+    def update_throughput(self, completed, failed, total, rate, bytes):
+        """Records the aggregate status line (files done + combined transfer rate)."""
+        self.telemetry.set_status(f"{completed + failed}/{total} files finished ({failed} failed) • "
+                                  f"{rate / 1024 / 1024:.1f} MB/s • {bytes / 1024 / 1024:.0f}MB transferred")
 
     def show_error(self, title, message):
         """Safely shows a messagebox error from any thread."""
@@ -339,445 +667,312 @@ class DownloaderApp:
             self.start_button.config(state="normal", text="Start Processing")
             return
 
+        # --- NEW: Read the download settings here, Tk variables must not be touched from the worker ---
+        try:
+            download_settings = {
+                'max_workers': max(1, self.download_workers.get()),
+                'per_host': max(1, self.download_per_host.get()),
+                'order': self.download_order.get(),
+                'limiter': self.limiter,
+                'mirrors': self.use_mirrors.get(),
+            }
+            rule = SelectionRule(skip_optional=self.skip_optional.get()) if self.pipelined.get() else None
+        except tk.TclError:
+            self.show_error("Input Error", "Parallel downloads and per host limits must be whole numbers.")
+            self.start_button.config(state="normal", text="Start Processing")
+            return
+        use_async = self.async_engine.get()
+        if self.profile_run.get():
+            download_settings['profiler'] = RunProfiler(cpu=True, memory=True)
+
         self.selection_queue = queue.Queue()
 
         self.log_to_gui("Starting processing...", "", "info")
         worker_thread = threading.Thread(
             target=self.process_links,
-            args=(scrape_url, download_folder, self.selection_queue),
+            args=(scrape_url, download_folder, self.selection_queue, download_settings, rule, use_async),
             daemon=True
         )
         worker_thread.start()
 
-    def process_links(self, scrape_url, download_folder, selection_queue):
+    def process_links(self, scrape_url, download_folder, selection_queue, download_settings, rule=None,
+                      use_async=False):
         """
         THE WORKER THREAD FUNCTION
-        Handles link discovery, state management, and downloading.
+        Runs the UI-independent DownloadPipeline and mirrors its events into the GUI.
         """
+        pipeline_class = self._pipeline_class(use_async)
+        pipeline = pipeline_class(download_folder, on_event=self.handle_pipeline_event, headers=self.headers,
+                                  **download_settings)
+        self.profiler = pipeline.profiler
 
-        # --- NEW: State File Logic ---
-        # Create a unique, "hidden" state file based on the scrape URL
-        url_hash = hashlib.sha1(scrape_url.encode()).hexdigest()
-        state_file = os.path.join(download_folder, f".download_state_{url_hash}.json")
-        links_to_discover = []
-        # --- End NEW ---
-
-        try:
-            # --- PHASE 1: DISCOVERY (with Resume Logic) ---
-            filter_prefix = "https://fuckingfast.co/"
-
-            # --- NEW: Check for existing state file ---
-            if os.path.exists(state_file):
-                try:
-                    with open(state_file, 'r') as f:
-                        links_to_discover = json.load(f)
-                    if links_to_discover:
-                        self.log_to_gui(f"Resuming previous session. Found {len(links_to_discover)} remaining links.",
-                                        os.path.basename(state_file), "info")
-                    else:
-                        self.log_to_gui("State file was empty. Starting fresh scrape.", os.path.basename(state_file),
-                                        "warning")
-                        # Force re-scrape by falling through
-                except Exception as e:
-                    self.log_to_gui(
-                        f"Error reading state file '{os.path.basename(state_file)}'. Starting fresh scrape.", str(e),
-                        "error")
-                    links_to_discover = []  # Ensure list is empty to trigger scrape
-
-            if not links_to_discover:
-                self.log_to_gui("No previous session found. Starting fresh scrape...", scrape_url, "info")
-                links_to_discover = self.scrape_links(scrape_url, filter_prefix)
-                if links_to_discover:
-                    self.log_to_gui(f"Scrape complete. Found {len(links_to_discover)} links.", "Saving state...",
-                                    "info")
-                    self.save_state_file(state_file, links_to_discover)
-                else:
-                    self.log_to_gui("No matching links found to process.", "", "warning")
-                    return  # Stop if scraping found nothing
-            # --- End NEW ---
-
-            self.log_to_gui(f"Discovering file details for {len(links_to_discover)} links...", "", "info")
-
-            discovered_files = []
-            # --- MODIFIED: Use links_to_discover list ---
-            for i, link in enumerate(links_to_discover):
-                self.log_to_gui(f"Discovering file {i + 1}/{len(links_to_discover)}...", f"{link[:50]}...", "info")
-                try:
-                    response = requests.get(link, headers=self.headers)
-                    if response.status_code != 200:
-                        self.log_to_gui(f"Failed To Fetch Page", f"Status: {response.status_code} for {link}", "error")
-                        continue
-
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    meta_title = soup.find('meta', attrs={'name': 'title'})
-
-                    if meta_title and meta_title.get('content'):
-                        file_name = meta_title['content']
-                        file_name = re.sub(r'[<>:"/\\|?*]', '_', file_name)
-                    else:
-                        file_name = f"download_{datetime.now().strftime('%Y%m%d%H%M%S')}_{i}"
-                        self.log_to_gui("Could not find meta title, using default filename", file_name, "warning")
-
-                    script_tags = soup.find_all('script')
-                    download_function = None
-                    for script in script_tags:
-                        if script.string and 'function download' in script.string:
-                            download_function = script.string
-                            break
-
-                    if download_function:
-                        match = re.search(r'window\.open\(["\'](https?://[^\s"\'\)]+)', download_function)
-                        if match:
-                            download_url = match.group(1)
-                            discovered_files.append({
-                                'name': file_name,
-                                'url': download_url,
-                                'page_link': link  # --- IMPORTANT: We store this to update the state file
-                            })
-                        else:
-                            self.log_to_gui("No Download URL Found in download function for", link, "error")
-                    else:
-                        self.log_to_gui("Download Function Not Found on page", link, "error")
-                except Exception as e:
-                    self.log_to_gui(f"Error discovering link {link}", str(e), "error")
-
-            if not discovered_files:
-                self.log_to_gui("Discovery finished, but no valid files were found.", "", "error")
-                # --- NEW: Clean up state file if discovery fails for all links ---
-                if os.path.exists(state_file):
-                    os.remove(state_file)
-                self.log_to_gui("Removed state file due to discovery failure.", "", "warning")
-                return
-
-            # --- PHASE 2: USER SELECTION ---
-            self.log_to_gui(f"Discovery complete. Found {len(discovered_files)} valid files.",
-                            "Waiting for user selection...", "done")
-
+        def select(discovered_files):
             self.root.after(0, lambda: SelectionDialog(self.root, discovered_files, selection_queue))
-            selected_files = selection_queue.get()
-
-            # --- PHASE 3: DOWNLOADING ---
-            if not selected_files:
-                self.log_to_gui("Download cancelled by user.", "State file with remaining links is preserved.",
-                                "warning")
-                return
-
-            self.log_to_gui(f"User selected {len(selected_files)} of {len(discovered_files)} files to download.", "",
-                            "info")
-
-            for i, file_info in enumerate(selected_files):
-                self.log_to_gui(f"Downloading file {i + 1}/{len(selected_files)}...", file_info['name'], "info")
-                try:
-                    dl_success = self.download_file_gui(file_info['url'], download_folder, file_info['name'])
-
-                    if dl_success:
-                        # --- NEW: Update state file on success ---
-                        self.log_to_gui("Updating session file (removing downloaded link)...",
-                                        os.path.basename(state_file), "info")
-                        if file_info['page_link'] in links_to_discover:
-                            links_to_discover.remove(file_info['page_link'])
-                            self.save_state_file(state_file, links_to_discover)
-                        else:
-                            self.log_to_gui("Link not in state list (already processed?)", file_info['page_link'],
-                                            "warning")
-                        # --- End NEW ---
-
-                except Exception as e:
-                    self.log_to_gui(f"Error processing link {file_info['page_link']}", str(e), "error")
-
-            self.log_to_gui("Processing complete for selected files.", "", "done")
-
-            # --- NEW: Final cleanup ---
-            if not links_to_discover:
-                self.log_to_gui("All links in session processed.", "Removing session file.", "done")
-                try:
-                    if os.path.exists(state_file):
-                        os.remove(state_file)
-                except Exception as e:
-                    self.log_to_gui("Could not remove session file.", str(e), "warning")
-            else:
-                self.log_to_gui(f"{len(links_to_discover)} links remain in session file for next time.",
-                                os.path.basename(state_file), "info")
-            # --- End NEW ---
-
-        except Exception as e:
-            self.log_to_gui("An unexpected error occurred in the worker thread", str(e), "error")
-            self.show_error("Worker Thread Error", f"An error occurred: {e}")
+            return selection_queue.get()
 
+        try:
+            pipeline.run(scrape_url, select, rule=rule)
         finally:
+            self.profiler = None
             self.root.after(0, lambda: self.start_button.config(state="normal", text="Start Processing"))
-            self.root.after(0, lambda: self.status_label.config(text="Finished. Ready to start again."))
+            self.telemetry.set_status("Finished. Ready to start again.")
 
-    # --- NEW: Helper function to save state ---
-    def save_state_file(self, state_file_path, links_list):
-        """Saves the current list of pending links to the state file."""
-        try:
-            with open(state_file_path, 'w') as f:
-                json.dump(links_list, f, indent=2)
-        except Exception as e:
-            self.log_to_gui(f"Failed to save state file!", f"{os.path.basename(state_file_path)}: {e}", "error")
+    def _pipeline_class(self, use_async):
+        """DownloadPipeline, or the asyncio engine's if it was chosen and aiohttp is installed (worker threads)."""
+        from ffdownloader.core import DownloadPipeline
+
+        if not use_async:
+            return DownloadPipeline
+        from ffdownloader.aio import AsyncDownloadPipeline, engine_available
 
-    # --- Helper Functions (Called by Worker Thread) ---
+        if engine_available():
+            return AsyncDownloadPipeline
+        self.log_to_gui("The async engine needs aiohttp (pip install aiohttp), using threads", "", "warning")
+        return DownloadPipeline
 
-    def scrape_links(self, target_url, filter_prefix):
-        """Scrapes a webpage for links, logging to the GUI."""
-        self.log_to_gui("Scraping URL for links", target_url, "info")
+    def run_queue(self):
+        """Downloads the queued repacks in order, JOB_PARALLEL at a time, within one worker and bandwidth budget."""
         try:
-            response = requests.get(target_url, headers=self.headers)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            self.log_to_gui("Failed to retrieve webpage for scraping", str(e), "error")
-            return []
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        found_links = [
-            a['href'] for a in soup.find_all('a', href=True)
-            if a['href'].startswith(filter_prefix)
-        ]
-
-        if not found_links:
-            self.log_to_gui("No matching links found on the page with prefix", filter_prefix, "warning")
-        else:
-            self.log_to_gui(f"Found {len(found_links)} matching links", "", "success")
+            download_settings = {
+                'per_host': max(1, self.download_per_host.get()),
+                'order': self.download_order.get(),
+                'limiter': self.limiter,
+                'mirrors': self.use_mirrors.get(),
+            }
+            slot_pool = SlotPool(max(1, self.download_workers.get()))
+        except tk.TclError:
+            self.show_error("Input Error", "Parallel downloads and per host limits must be whole numbers.")
+            return
+        download_settings['max_workers'] = slot_pool.size
+        rule = SelectionRule(skip_optional=self.skip_optional.get()) if self.pipelined.get() else None
+        use_async = self.async_engine.get()
+
+        def make_pipeline(job):
+            pipeline_class = self._pipeline_class(use_async)
+            pipeline = pipeline_class(job['folder'], on_event=self.handle_pipeline_event, headers=self.headers,
+                                      slot_pool=slot_pool, **download_settings)
+            if rule is not None:
+                return pipeline, {'rule': rule}
+            selection_queue = queue.Queue()
+
+            def select(discovered_files):
+                self.root.after(0, lambda: SelectionDialog(self.root, discovered_files, selection_queue))
+                return selection_queue.get()
+
+            return pipeline, {'select': select}
+
+        self.job_runner = JobRunner(self.job_queue, make_pipeline, parallel=JOB_PARALLEL, log=self.log_to_gui)
+        self.run_queue_button.config(state="disabled", text="Running...")
+        self.start_button.config(state="disabled")
+        self.log_to_gui("Running the download queue...", "", "info")
+        threading.Thread(target=self._run_job_runner, args=(self.job_runner,), daemon=True).start()
+
+    def _run_job_runner(self, runner):
+        """Worker thread: runs the queue until nothing is queued or it is stopped."""
+        runner.start()
+        runner.wait()
+        self.root.after(0, self._queue_finished)
+
+    def _queue_finished(self):
+        self.job_runner = None
+        self.run_queue_button.config(state="normal", text="Run Queue")
+        self.start_button.config(state="normal")
+        self.telemetry.set_status("Queue finished. Ready to start again.")
+
+    def stop_queue(self):
+        """Stops the running jobs; they stay queued and resume from their sessions on the next run."""
+        if self.job_runner:
+            self.log_to_gui("Stopping the download queue...", "Running jobs keep their progress.", "warning")
+            self.job_runner.stop()
+
+    def handle_pipeline_event(self, kind, data):
+        """Pipeline callback (runs on worker threads), it only writes to self.telemetry or uses root.after()."""
+        if kind == "log":
+            self.log_to_gui(data['message'], data['obj'], data['tag'])
+        elif kind == "workers":
+            self.telemetry.set_workers(data['count'])
+        elif kind == "progress":
+            self.update_progress(data['slot'], data['current'], data['total'], data['file'])
+        elif kind == "file_finished":
+            self.clear_progress(data['slot'])
+        elif kind == "throughput":
+            self.update_throughput(data['completed'], data['failed'], data['total'], data['rate'], data['bytes'])
+        elif kind == "error":
+            self.show_error("Worker Thread Error", f"An error occurred: {data['message']}")
 
-        # --- NEW: Return unique links to prevent duplicates in state file ---
-        unique_links = list(dict.fromkeys(found_links))
-        if len(unique_links) < len(found_links):
-            self.log_to_gui(f"Removed {len(found_links) - len(unique_links)} duplicate links.", "", "info")
+    # --- UPDATE CHECKER: NEW METHODS ---
 
-        return unique_links
+    def start_update_check(self):
+        self.updater_thread = threading.Thread(target=self.check_for_updates, daemon=True)
+        self.updater_thread.start()
 
-    def download_file_gui(self, download_url, output_folder, file_label):
+    def check_for_updates(self):
         """
-        Downloads a file, updating the GUI progress bar.
-        It determines the filename from response headers or URL.
-        Returns True on success, False on failure.
+        Checks GitHub for the latest release (or the cached answer of an earlier check).
+        Runs in a separate thread.
         """
         try:
-            response = requests.get(download_url, stream=True, headers=self.headers)
-
-            if response.status_code == 200:
-                file_name = file_label
-                content_disposition = response.headers.get('content-disposition')
-                if content_disposition:
-                    match = re.search(r'filename="?([^"]+)"?', content_disposition)
-                    if match:
-                        file_name = match.group(1)
-                else:
-                    parsed_url_path = download_url.split('?')[0].split('#')[0]
-                    url_filename = parsed_url_path.split('/')[-1]
-                    if url_filename:
-                        file_name = url_filename
-
-                file_name = re.sub(r'[<>:"/\\|?*]', '_', file_name)
-
-                if not file_name or file_name.endswith('.'):
-                    file_name = file_label + "_download"
-                    self.log_to_gui("Could not determine filename, using label", file_name, "warning")
-
-                output_path = os.path.join(output_folder, file_name)
-                total_size = int(response.headers.get('content-length', 0))
-                block_size = 8192
-                downloaded_so_far = 0
-
-                self.update_progress(0, total_size, file_name)
-
-                with open(output_path, 'wb') as f:
-                    for data in response.iter_content(block_size):
-                        f.write(data)
-                        downloaded_so_far += len(data)
-                        self.update_progress(downloaded_so_far, total_size, file_name)
-
-                self.log_to_gui(f"Successfully Downloaded File", os.path.basename(output_path), "success")
-                self.clear_progress()
-                return True
-            else:
-                self.log_to_gui(f"Failed To Download File (Status: {response.status_code})",
-                                f"{file_label} from {download_url}", "error")
-                self.clear_progress()
-                return False
+            release, source = latest_release(GITHUB_REPO)
+        except UpdateCheckFailed as e:
+            self.log_to_gui("Update check failed.", str(e), "warning")
+            return
         except Exception as e:
-            self.log_to_gui(f"Failed To Download File '{file_label}'", str(e), "error")
-            self.clear_progress()
-            return False
+            self.log_to_gui("Error checking for updates", str(e), "error")
+            return
 
-    # --- UPDATE CHECKER: NEW METHODS ---
+        latest_version = release['tag_name']
+        download_url = None
+        # Find the WebScraper.exe asset
+        for asset in release['assets']:
+            if asset.get("name") == "WebScraper.exe":
+                download_url = asset.get("browser_download_url")
+                break
+
+        # Compare versions
+        if latest_version != CURRENT_VERSION:
+            self.log_to_gui(f"New version found: {latest_version}", "Update available!", "success")
+            if download_url:
+                # Show the update dialog on the main thread
+                self.root.after(0, self.show_update_dialog, latest_version, release['body'], download_url)
+            else:
+                self.log_to_gui(f"Update {latest_version} found, but 'WebScraper.exe' asset is missing.",
+                                "Update failed.", "error")
+        else:
+            checked = "" if source == "api" else " (GitHub unchanged)" if source == "not-modified" else " (cached)"
+            self.log_to_gui("Application is up to date.", f"Version: {CURRENT_VERSION}{checked}", "info")
 
-    def check_for_updates(self):
+    def show_update_dialog(self, version, notes, url):
+        """Creates and shows the update dialog window."""
+        UpdateDialog(self.root, version, notes, url, self.download_and_apply_update)
+
+    def download_and_apply_update(self, url):
         """
-        Checks GitHub API for the latest release.
-        Runs in a separate thread.
+        Downloads the new executable and creates a batch file
+        to perform the self-replacement and restart.
         """
-        self.log_to_gui("Checking for updates...", f"Repo: {GITHUB_REPO}", "info")
-        api_url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+        import subprocess  # Only needed on this rare path, not at every launch
+        import webbrowser
+
+        import requests
+
+        # Check if we are running as a frozen executable (PyInstaller)
+        if not getattr(sys, 'frozen', False):
+            # We are running from a Python script
+            self.log_to_gui("Running from source.", "Cannot apply update automatically.", "warning")
+            self.log_to_gui("Opening download page in browser...", url, "info")
+            self.root.after(0, lambda: messagebox.showinfo(
+                "Running from Source",
+                "A new version is available, but the app is running from a Python script.\n\n"
+                "The download page will be opened for you to update manually.",
+                parent=self.root
+            ))
+            webbrowser.open(f"https://github.com/{GITHUB_REPO}/releases/latest")
+            return
 
         try:
-            response = requests.get(api_url, timeout=5)
-            if response.status_code != 200:
-                self.log_to_gui("Failed to check for updates.", f"API Status: {response.status_code}", "warning")
-                return
-
-            data = response.json()
-            latest_version = data.get("tag_name")
-            release_notes = data.get("body")
-            assets = data.get("assets", [])
-            download_url = None
-
-            # Find the WebScraper.exe asset
-            for asset in assets:
-                if asset.get("name") == "WebScraper.exe":
-                    download_url = asset.get("browser_download_url")
-                    break
-
-            if not latest_version:
-                self.log_to_gui("Could not find 'tag_name' in API response.", "Update check failed.", "warning")
-                return
-
-            # Compare versions
-            if latest_version != CURRENT_VERSION:
-                self.log_to_gui(f"New version found: {latest_version}", "Update available!", "success")
-                if download_url:
-                    # Show the update dialog on the main thread
-                    self.root.after(0, self.show_update_dialog, latest_version, release_notes, download_url)
-                else:
-                    self.log_to_gui(f"Update {latest_version} found, but 'WebScraper.exe' asset is missing.",
-                                    "Update failed.", "error")
-            else:
-                self.log_to_gui("Application is up to date.", f"Version: {CURRENT_VERSION}", "info")
+            # --- We are running as an .exe ---
+            current_exe_path = sys.executable
+            exe_dir = os.path.dirname(current_exe_path)
+            exe_name = os.path.basename(current_exe_path)
+
+            # Define paths for new exe and updater script
+            new_exe_path = os.path.join(exe_dir, f"{exe_name}.new")
+            updater_bat_path = os.path.join(exe_dir, "updater.bat")
+
+            # Download the new .exe
+            self.log_to_gui("Downloading update...", f"To: {os.path.basename(new_exe_path)}", "info")
+            response = requests.get(url, stream=True)
+            response.raise_for_status()
 
-        except requests.exceptions.ConnectionError:
-            self.log_to_gui("Update check failed.", "No internet connection.", "warning")
-        except Exception as e:
-            self.log_to_gui(f"Error checking for updates", str(e), "error")
+            with open(new_exe_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    f.write(chunk)
+
+            self.log_to_gui("Update downloaded successfully.", "", "success")
+
+            # --- NEW ROBUST BATCH FILE CONTENT ---
+            # This script is much more aggressive about ensuring the update succeeds.
+            bat_content = f"""
+@echo off
+setlocal
+echo Waiting for application to close...
+:: Ping is a more reliable delay than timeout
+ping 127.0.0.1 -n 4 > nul
+
+echo Forcibly terminating {exe_name} (just in case)...
+:: Force-kill the executable by name, ignore errors if not running
+taskkill /f /im "{exe_name}" > nul 2>&1
+ping 127.0.0.1 -n 2 > nul
+
+set "OLD_EXE_PATH={current_exe_path}"
+set "NEW_EXE_PATH={new_exe_path}"
+
+echo Attempting to delete old executable...
+set "tries=0"
+:delete_loop
+if %tries% equ 5 (
+    echo FAILED: Could not delete %OLD_EXE_PATH%.
+    echo You may need to replace it manually.
+    echo New file is at: %NEW_EXE_PATH%
+    ping 127.0.0.1 -n 6 > nul
+    goto self_delete
+)
+:: Try to delete the old exe
+del "%OLD_EXE_PATH%" > nul 2>&1
+:: Check if it still exists
+if exist "%OLD_EXE_PATH%" (
+    echo File is still locked. Retrying in 3 sec...
+    ping 127.0.0.1 -n 3 > nul
+    set /a tries=%tries%+1
+    goto delete_loop
+)
+
+echo Old executable deleted.
+echo Renaming new version...
+
+:: Move/rename the new exe to the old exe's name
+move "%NEW_EXE_PATH%" "%OLD_EXE_PATH%"
+if %errorlevel% neq 0 (
+    echo FAILED: Could not rename new executable.
+    echo You may need to replace it manually.
+    echo New file is at: %NEW_EXE_PATH%
+    ping 127.0.0.1 -n 6 > nul
+    goto self_delete
+)
+
+echo Update complete. Restarting application...
+start "" "%OLD_EXE_PATH%"
+
+:self_delete
+echo Cleaning up updater...
+:: Standard batch trick to delete the batch file itself
+(goto) 2>nul & del "%~f0"
+"""
+            # --- END OF NEW BATCH FILE CONTENT ---
+
+            with open(updater_bat_path, 'w') as f:
+                f.write(bat_content)
+
+            self.log_to_gui("Applying update and restarting...", "App will close.", "info")
+
+            # Launch the batch file in a new, detached process
+            subprocess.Popen(
+                [updater_bat_path],
+                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
+                close_fds=True,
+                shell=True
+            )
 
-    def show_update_dialog(self, version, notes, url):
-        """Creates and shows the update dialog window."""
-        UpdateDialog(self.root, version, notes, url, self.download_and_apply_update)
+            # Close the main application
+            self.root.after(100, self.root.destroy)
 
-        def download_and_apply_update(self, url):
-            """
-            Downloads the new executable and creates a batch file
-            to perform the self-replacement and restart.
-            """
-
-            # Check if we are running as a frozen executable (PyInstaller)
-            if not getattr(sys, 'frozen', False):
-                # We are running from a Python script
-                self.log_to_gui("Running from source.", "Cannot apply update automatically.", "warning")
-                self.log_to_gui("Opening download page in browser...", url, "info")
-                self.root.after(0, lambda: messagebox.showinfo(
-                    "Running from Source",
-                    "A new version is available, but the app is running from a Python script.\n\n"
-                    "The download page will be opened for you to update manually.",
-                    parent=self.root
-                ))
-                webbrowser.open(f"https://github.com/{GITHUB_REPO}/releases/latest")
-                return
-
-            try:
-                # --- We are running as an .exe ---
-                current_exe_path = sys.executable
-                exe_dir = os.path.dirname(current_exe_path)
-                exe_name = os.path.basename(current_exe_path)
-
-                # Define paths for new exe and updater script
-                new_exe_path = os.path.join(exe_dir, f"{exe_name}.new")
-                updater_bat_path = os.path.join(exe_dir, "updater.bat")
-
-                # Download the new .exe
-                self.log_to_gui("Downloading update...", f"To: {os.path.basename(new_exe_path)}", "info")
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-
-                with open(new_exe_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-
-                self.log_to_gui("Update downloaded successfully.", "", "success")
-
-                # --- NEW ROBUST BATCH FILE CONTENT ---
-                # This script is much more aggressive about ensuring the update succeeds.
-                bat_content = f"""
-    @echo off
-    setlocal
-    echo Waiting for application to close...
-    :: Ping is a more reliable delay than timeout
-    ping 127.0.0.1 -n 4 > nul
-
-    echo Forcibly terminating {exe_name} (just in case)...
-    :: Force-kill the executable by name, ignore errors if not running
-    taskkill /f /im "{exe_name}" > nul 2>&1
-    ping 127.0.0.1 -n 2 > nul
-
-    set "OLD_EXE_PATH={current_exe_path}"
-    set "NEW_EXE_PATH={new_exe_path}"
-
-    echo Attempting to delete old executable...
-    set "tries=0"
-    :delete_loop
-    if %tries% equ 5 (
-        echo FAILED: Could not delete %OLD_EXE_PATH%.
-        echo You may need to replace it manually.
-        echo New file is at: %NEW_EXE_PATH%
-        ping 127.0.0.1 -n 6 > nul
-        goto self_delete
-    )
-    :: Try to delete the old exe
-    del "%OLD_EXE_PATH%" > nul 2>&1
-    :: Check if it still exists
-    if exist "%OLD_EXE_PATH%" (
-        echo File is still locked. Retrying in 3 sec...
-        ping 127.0.0.1 -n 3 > nul
-        set /a tries=%tries%+1
-        goto delete_loop
-    )
-
-    echo Old executable deleted.
-    echo Renaming new version...
-
-    :: Move/rename the new exe to the old exe's name
-    move "%NEW_EXE_PATH%" "%OLD_EXE_PATH%"
-    if %errorlevel% neq 0 (
-        echo FAILED: Could not rename new executable.
-        echo You may need to replace it manually.
-        echo New file is at: %NEW_EXE_PATH%
-        ping 127.0.0.1 -n 6 > nul
-        goto self_delete
-    )
-
-    echo Update complete. Restarting application...
-    start "" "%OLD_EXE_PATH%"
-
-    :self_delete
-    echo Cleaning up updater...
-    :: Standard batch trick to delete the batch file itself
-    (goto) 2>nul & del "%~f0"
-    """
-                # --- END OF NEW BATCH FILE CONTENT ---
-
-                with open(updater_bat_path, 'w') as f:
-                    f.write(bat_content)
-
-                self.log_to_gui("Applying update and restarting...", "App will close.", "info")
-
-                # Launch the batch file in a new, detached process
-                subprocess.Popen(
-                    [updater_bat_path],
-                    creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
-                    close_fds=True,
-                    shell=True
-                )
-
-                # Close the main application
-                self.root.after(100, self.root.destroy)
-
-            except Exception as e:
-                self.log_to_gui("Failed to apply update.", str(e), "error")
-                self.root.after(0, lambda: messagebox.showerror("Update Failed", f"Could not apply update: {e}",
-                                                                parent=self.root))
-                # Clean up partial download
-                if os.path.exists(new_exe_path):
-                    os.remove(new_exe_path)
+        except Exception as e:
+            self.log_to_gui("Failed to apply update.", str(e), "error")
+            self.root.after(0, lambda: messagebox.showerror("Update Failed", f"Could not apply update: {e}",
+                                                            parent=self.root))
+            # Clean up partial download
+            if os.path.exists(new_exe_path):
+                os.remove(new_exe_path)
 
 
 # --- Main execution ---